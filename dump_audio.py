@@ -4,37 +4,25 @@ sys.path.insert(0, '/Users/asnaroo/Desktop/experiments/boomer/products/backend')
 
 import numpy as np
 from audio import load_audio_files, audio_sources
-from processor import init_processor
+from processor import stream_processed
 
 # Load audio
 load_audio_files()
-init_processor()
-
-# Get the three sources
-ref = audio_sources['ref'].data
-room = audio_sources['room'].data
-processed = audio_sources['processed'].data
 
 sample_rate = audio_sources['ref'].sample_rate
 
-# Convert to mono if stereo
-if ref.ndim > 1:
-    ref = np.mean(ref, axis=1)
-if room.ndim > 1:
-    room = np.mean(room, axis=1)
-if processed.ndim > 1:
-    processed = np.mean(processed, axis=1)
-
 # Time range: 47-48 seconds (where the kicks start)
 start_sec = 47.0
 end_sec = 48.0
 start_sample = int(start_sec * sample_rate)
 end_sample = int(end_sec * sample_rate)
 
-# Extract segments
-ref_seg = ref[start_sample:end_sample]
-room_seg = room[start_sample:end_sample]
-processed_seg = processed[start_sample:end_sample]
+# Extract mono segments (only this range is read and converted)
+ref_seg = audio_sources['ref'].mono[start_sample:end_sample]
+room_seg = audio_sources['room'].mono[start_sample:end_sample]
+processed_seg = np.concatenate(list(stream_processed(start_sample, end_sample)))  # just this range is convolved
+if processed_seg.ndim > 1:
+    processed_seg = processed_seg.mean(axis=1)
 
 # Create time array
 times = np.arange(start_sample, end_sample) / sample_rate
@@ -0,0 +1,269 @@
+# testbed/load-audio/align
+#
+# room.wav is recorded on a phone: it starts at some offset from ref.wav and its clock drifts.
+# At load time we find room_position = offset + rate * ref_position from short stretches of either
+# file, so this takes about the same time for a 3-minute track and an hour-long one. Room is then
+# resampled into ref time once, into the cache, and presented as an AlignedView over that mapping.
+
+import json
+import time
+from dataclasses import replace
+from functools import lru_cache
+from pathlib import Path
+import numpy as np
+from logger import log
+import cache
+
+ALIGN_ROOM = True
+COARSE_RATE = 1000          # Hz, decimated rate for the coarse search
+COARSE_SEGMENTS = 8         # ref segments spread across the track
+COARSE_SECONDS = 20         # length of each coarse segment
+MAX_OFFSET_SECONDS = 30     # largest offset the coarse search looks for
+FINE_WINDOWS = 64           # GCC-PHAT windows spread across the track
+FINE_SAMPLES = 16384        # samples per fine window
+MIN_CONFIDENCE = 6.0        # correlation peak over its standard deviation; weaker windows are ignored
+MAX_RESIDUAL = 2.0          # samples; fine estimates further than this from the fit are outliers
+LANCZOS_A = 8               # resampling kernel half-width: 2 * LANCZOS_A taps per output sample
+KERNEL_PHASES = 4096        # fractional positions the kernel is tabulated at (error < 1/8192 sample)
+RESAMPLE_CHUNK = 65536      # output samples interpolated at a time, bounding temporary memory
+
+def align_params():
+    """Parameters that determine the alignment (part of its cache check)"""
+    return {
+        'coarse_rate': COARSE_RATE, 'coarse_segments': COARSE_SEGMENTS, 'coarse_seconds': COARSE_SECONDS,
+        'max_offset_seconds': MAX_OFFSET_SECONDS, 'fine_windows': FINE_WINDOWS, 'fine_samples': FINE_SAMPLES,
+    }
+
+@lru_cache(maxsize=1)
+def lanczos_table():
+    """(KERNEL_PHASES + 1, 2 * LANCZOS_A) weights for source samples base - LANCZOS_A + 1 .. base + LANCZOS_A,
+    one row per fraction of a sample, each normalized to unity gain"""
+    frac = np.arange(KERNEL_PHASES + 1) / KERNEL_PHASES
+    distance = np.arange(-LANCZOS_A + 1, LANCZOS_A + 1) - frac[:, np.newaxis]
+    table = np.sinc(distance) * np.sinc(distance / LANCZOS_A)
+    table /= table.sum(axis=1, keepdims=True)
+    table = table.astype(np.float32)
+    table.setflags(write=False)
+    return table
+
+def resample(source, offset, rate, start, count):
+    """source[offset + rate * m] for m in start..start + count, interpolated with the Lanczos kernel
+
+    Positions outside the source are silent. count is at most RESAMPLE_CHUNK, bounding temporary memory.
+    """
+    # source positions of the requested samples, split into integer and fractional parts
+    positions = offset + rate * np.arange(start, start + count, dtype=np.float64)
+    base = np.floor(positions).astype(np.int64)
+    phase = np.round((positions - base) * KERNEL_PHASES).astype(np.int64)
+    out = np.zeros((count, *source.shape[1:]), dtype=np.float32)
+    if count == 0:
+        return out
+
+    # one read covering every tap, zero-padded outside the source
+    first = int(base[0]) - LANCZOS_A + 1
+    last = int(base[-1]) + LANCZOS_A + 1
+    taps = np.zeros((last - first, *source.shape[1:]), dtype=np.float32)
+    lo, hi = max(first, 0), min(last, len(source))
+    if hi > lo:
+        taps[lo - first:hi - first] = source[lo:hi]
+
+    weights = lanczos_table()[phase]
+    index = base - base[0]
+    if out.ndim > 1:
+        weights = weights[..., np.newaxis]
+    for tap in range(2 * LANCZOS_A):
+        out += taps[index + tap] * weights[:, tap]
+    return out
+
+def aligned_samples(room, offset, rate, length):
+    """room resampled into ref time as a read-only float32 memory map, rendered into the cache once
+
+    Keyed by the room file's hash plus the alignment, so a restart (or another room switch) maps it again.
+    """
+    key = cache.cache_key([room.path], {'offset': offset, 'rate': rate, 'length': length,
+                                        'lanczos_a': LANCZOS_A, 'kernel_phases': KERNEL_PHASES})
+    samples = cache.load_array(key, 'aligned', mmap_mode='r')
+    if samples is None:
+        start_time = time.time()
+
+        def fill(out):
+            for start in range(0, length, RESAMPLE_CHUNK):
+                out[start:start + RESAMPLE_CHUNK] = resample(room.data, offset, rate, start, min(RESAMPLE_CHUNK, length - start))
+
+        cache.write_array(key, 'aligned', (length, *room.data.shape[1:]), np.float32, fill)
+        samples = cache.load_array(key, 'aligned', mmap_mode='r')
+        log('audio', f'Resampled {room.path} into ref time in {time.time() - start_time:.1f}s')
+    return samples
+
+class AlignedView:
+    """Read-only float32 view of a room in ref time: out[m] = room[offset + rate * m]
+
+    The resampled samples are memory-mapped from the cache (aligned_samples), so a read is a slice.
+    """
+
+    def __init__(self, raw, offset, rate, downmix=False):
+        self.raw = raw            # float32 (ref length,) or (ref length, channels) memory map
+        self.offset = offset
+        self.rate = rate
+        self.downmix = downmix and raw.ndim > 1
+        self.shape = (raw.shape[0],) if self.downmix else raw.shape
+        self.ndim = len(self.shape)
+        self.dtype = np.dtype(np.float32)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        chunk = np.array(self.raw[key])  # a copy, never a view into the mapping
+        if self.downmix:
+            chunk = chunk @ np.full(chunk.shape[-1], 1 / chunk.shape[-1], dtype=np.float32)
+        return chunk
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self[:], dtype=dtype)
+
+    def downmixed(self):
+        """The same view averaged to mono"""
+        return AlignedView(self.raw, self.offset, self.rate, downmix=True)
+
+def read_padded(mono, start, length):
+    """mono[start:start + length] as float32, with zeros outside the signal"""
+    out = np.zeros(length, dtype=np.float32)
+    lo, hi = max(start, 0), min(start + length, len(mono))
+    if hi > lo:
+        out[lo - start:hi - start] = mono[lo:hi]
+    return out
+
+def decimated(mono, start, length, factor):
+    """`length` decimated samples from sample `start`, each the mean of `factor` samples"""
+    return read_padded(mono, start, length * factor).reshape(length, factor).mean(axis=1)
+
+def gcc_phat(x, y, max_lag):
+    """Lag of y relative to x (y[n + lag] ~ x[n]) within ±max_lag, to a fraction of a sample
+
+    x, y: (windows, n) stacks. Returns (lags, confidence), where confidence is the PHAT peak in
+    standard deviations of the whole correlation.
+    """
+    n = x.shape[-1]
+    size = 2 * n
+    X = np.fft.rfft(x, size, axis=-1)
+    Y = np.fft.rfft(y, size, axis=-1)
+    cross = Y * np.conj(X)
+    cross /= np.maximum(np.abs(cross), 1e-12)
+    corr = np.fft.irfft(cross, size, axis=-1)
+    spread = np.maximum(corr.std(axis=-1), 1e-12)
+
+    # lags -max_lag..max_lag, in order
+    corr = np.concatenate([corr[:, -max_lag:], corr[:, :max_lag + 1]], axis=-1)
+    peak = np.argmax(corr, axis=-1)
+    rows = np.arange(len(corr))
+
+    # fraction of a sample from the phase slope of the cross spectrum, once the whole-sample lag is removed
+    lag = peak - max_lag
+    omega = 2 * np.pi * np.arange(cross.shape[-1]) / size
+    residual = Y * np.conj(X) * np.exp(1j * omega * lag[:, np.newaxis])
+    weight = np.abs(residual)
+    phase = np.angle(residual)
+    fraction = -np.sum(weight * omega * phase, axis=-1) / np.maximum(np.sum(weight * omega ** 2, axis=-1), 1e-12)
+
+    return lag + np.clip(fraction, -1, 1), corr[rows, peak] / spread
+
+def theil_sen(m, n):
+    """Median of pairwise slopes and the matching offset: a line fit that ignores a minority of bad points"""
+    i, j = np.triu_indices(len(m), k=1)
+    rate = float(np.median((n[j] - n[i]) / (m[j] - m[i])))
+    return float(np.median(n - rate * m)), rate
+
+def fit_line(m, n, weights):
+    """Weighted least squares n = offset + rate * m"""
+    A = np.stack([np.ones_like(m), m], axis=1) * weights[:, np.newaxis]
+    (offset, rate), *_ = np.linalg.lstsq(A, n * weights, rcond=None)
+    return offset, rate
+
+def coarse_alignment(ref_mono, room_mono, sample_rate):
+    """Rough (offset, rate) from decimated segments across the track, or None"""
+    factor = max(1, sample_rate // COARSE_RATE)
+    segment = min(int(COARSE_SECONDS * sample_rate), len(ref_mono)) // factor
+    reach = int(MAX_OFFSET_SECONDS * sample_rate) // factor
+    starts = np.unique(np.linspace(0, max(0, len(ref_mono) // factor - segment), COARSE_SEGMENTS).astype(int))
+
+    x = np.stack([np.pad(decimated(ref_mono, s * factor, segment, factor), (reach, reach)) for s in starts])
+    y = np.stack([decimated(room_mono, (s - reach) * factor, segment + 2 * reach, factor) for s in starts])
+    lags, confidence = gcc_phat(x, y, reach)
+
+    good = confidence >= MIN_CONFIDENCE
+    if not good.any():
+        return None
+    m = (starts + segment / 2) * factor
+    n = m + lags * factor
+    if good.sum() == 1:
+        return float(n[good][0] - m[good][0]), 1.0
+
+    return theil_sen(m[good], n[good])
+
+def fine_alignment(ref_mono, room_mono, sample_rate, coarse):
+    """(offset, rate, windows used, rms residual) refined with GCC-PHAT on full-rate windows, or None"""
+    offset, rate = coarse
+    window = np.hanning(FINE_SAMPLES).astype(np.float32)
+    m = np.unique(np.linspace(0, max(0, len(ref_mono) - FINE_SAMPLES), FINE_WINDOWS).astype(int))
+    predicted = np.round(offset + rate * m).astype(int)
+
+    x = np.stack([read_padded(ref_mono, s, FINE_SAMPLES) for s in m]) * window
+    y = np.stack([read_padded(room_mono, s, FINE_SAMPLES) for s in predicted]) * window
+    lags, confidence = gcc_phat(x, y, FINE_SAMPLES // 4)
+
+    # each lag holds at the window centres (with drift, not at their starts)
+    m = m + FINE_SAMPLES / 2
+    n = predicted + FINE_SAMPLES / 2 + lags
+
+    # robust line through the confident windows, then least squares on the ones that agree with it
+    good = confidence >= MIN_CONFIDENCE
+    if good.sum() < 2:
+        return None
+    offset, rate = theil_sen(m[good], n[good])
+    for _ in range(2):
+        inliers = good & (np.abs(n - (offset + rate * m)) <= MAX_RESIDUAL)
+        if inliers.sum() < 2:
+            return None
+        offset, rate = fit_line(m[inliers], n[inliers], np.sqrt(confidence[inliers]))
+    residual = n[inliers] - (offset + rate * m[inliers])
+    return offset, rate, int(inliers.sum()), float(np.sqrt(np.mean(residual ** 2)))
+
+def alignment_file(room):
+    return Path(room.path).with_suffix('.align.json')
+
+def find_alignment(ref, room):
+    """{'offset', 'rate', ...} mapping ref positions to room positions, from the file next to room.wav if current"""
+    path = alignment_file(room)
+    inputs = {'ref': cache.file_hash(ref.path), 'room': cache.file_hash(room.path), 'params': align_params()}
+    if path.exists():
+        saved = json.loads(path.read_text())
+        if saved.get('inputs') == inputs:
+            return saved['alignment']
+
+    sample_rate = ref.sample_rate
+    coarse = coarse_alignment(ref.mono, room.mono, sample_rate)
+    fine = None if coarse is None else fine_alignment(ref.mono, room.mono, sample_rate, coarse)
+    if fine is None:
+        alignment = None
+    else:
+        offset, rate, windows, residual = fine
+        alignment = {'offset': float(offset), 'rate': float(rate), 'windows': windows, 'residual': residual}
+    path.write_text(json.dumps({'inputs': inputs, 'alignment': alignment}, indent=2))
+    return alignment
+
+def align_room(ref, room):
+    """room as an AudioData in ref time (same length as ref), or room unchanged if no alignment was found"""
+    alignment = find_alignment(ref, room)
+    if alignment is None:
+        log('audio', 'Alignment: no reliable match between ref and room, using room as is')
+        return room
+
+    drift_ppm = (alignment['rate'] - 1) * 1e6
+    log('audio', f"Alignment: room offset {alignment['offset'] / ref.sample_rate * 1000:.2f}ms, "
+                 f"drift {drift_ppm:+.1f}ppm ({alignment['windows']}/{FINE_WINDOWS} windows, "
+                 f"residual {alignment['residual']:.2f} samples)")
+    samples = aligned_samples(room, alignment['offset'], alignment['rate'], len(ref.data))
+    data = AlignedView(samples, alignment['offset'], alignment['rate'])
+    return replace(room, data=data, duration=ref.duration,
+                   alignment={'offset': alignment['offset'], 'rate': alignment['rate']})
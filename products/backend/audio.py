@@ -1,43 +1,136 @@
-# testbed/load-audio
+# testbed/load-audio, testbed/load-audio/memory-mapped, testbed/load-audio/align, testbed/load-audio/session
 
+import json
+import re
 import numpy as np
 from scipy.io import wavfile
 from dataclasses import dataclass
+from functools import cached_property
 from pathlib import Path
+import align
+
+class SampleView:
+    """Read-only float32 view of raw samples; converts (and optionally downmixes) one slice at a time"""
+
+    def __init__(self, raw, scale=1.0, downmix=False):
+        self.raw = raw            # int16/int32/float32 array, usually memory-mapped
+        self.scale = scale        # multiplier that brings raw values into [-1, 1]
+        self.downmix = downmix and raw.ndim > 1
+        self.shape = (raw.shape[0],) if self.downmix else raw.shape
+        self.ndim = len(self.shape)
+        self.dtype = np.dtype(np.float32)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        chunk = self.raw[key].astype(np.float32)  # only the requested pages are read
+        if self.scale != 1.0:
+            chunk *= self.scale
+        if self.downmix:
+            # average channels with a matrix-vector product (much faster than mean over a short axis)
+            chunk = chunk @ np.full(chunk.shape[-1], 1 / chunk.shape[-1], dtype=np.float32)
+        return chunk
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self[:], dtype=dtype)
+
+    def downmixed(self):
+        return SampleView(self.raw, self.scale, downmix=True)
 
 @dataclass
 class AudioData:
-    data: np.ndarray      # float32, shape (samples,) or (samples, channels)
+    data: np.ndarray      # float32 samples (or a SampleView), shape (samples,) or (samples, channels)
     sample_rate: int
     channels: int
     duration: float
+    path: str = ''        # source file, if loaded from disk
+    alignment: dict = None  # testbed/load-audio/align - {'offset', 'rate'} if resampled into ref time
+
+    @cached_property
+    def mono(self):
+        """Mono downmix of data, as a view that converts per slice"""
+        if self.data.ndim == 1:
+            return self.data
+        if hasattr(self.data, 'downmixed'):
+            return self.data.downmixed()
+        return SampleView(self.data, downmix=True)
 
 # global storage
 audio_sources: dict[str, AudioData] = {}
 
+# scale factors that bring each supported wav format into [-1, 1]
+SAMPLE_SCALES = {
+    np.dtype(np.int16): 1 / 32768.0,
+    np.dtype(np.int32): 1 / 2147483648.0,
+    np.dtype(np.float32): 1.0,
+}
+
 def load_wav(path: str) -> AudioData:
     filepath = Path(path)
     if not filepath.exists():
         raise FileNotFoundError(f"Audio file not found: {path}")
 
-    sample_rate, data = wavfile.read(filepath)
+    # testbed/load-audio/memory-mapped - map the file; samples are read and converted on access
+    try:
+        sample_rate, raw = wavfile.read(filepath, mmap=True)
+    except ValueError:
+        # formats scipy can't map (e.g. 24-bit) are read into memory instead
+        sample_rate, raw = wavfile.read(filepath)
 
-    # convert to float32 normalized to [-1, 1]
-    if data.dtype == np.int16:
-        data = data.astype(np.float32) / 32768.0
-    elif data.dtype == np.int32:
-        data = data.astype(np.float32) / 2147483648.0
-    elif data.dtype != np.float32:
-        raise ValueError(f"Unsupported wav format: {data.dtype}")
+    if raw.dtype not in SAMPLE_SCALES:
+        raise ValueError(f"Unsupported wav format: {raw.dtype}")
+    data = SampleView(raw, SAMPLE_SCALES[raw.dtype])
 
     channels = 1 if data.ndim == 1 else data.shape[1]
     duration = len(data) / sample_rate
 
-    return AudioData(data=data, sample_rate=sample_rate, channels=channels, duration=duration)
+    return AudioData(data=data, sample_rate=sample_rate, channels=channels, duration=duration, path=str(filepath))
+
+# testbed/load-audio/session - the recordings of a session: one ref and any number of named rooms
+SESSION_FILE = Path('session.json')
+RESERVED_NAMES = {'ref', 'room', 'processed'}  # playback roles, so not usable as room names in SESSION_FILE
+manifest = {'ref': 'ref.wav', 'rooms': {'room': 'room.wav'}, 'memory_budget_mb': None}
+
+def load_manifest():
+    """Read SESSION_FILE into manifest, or keep ref.wav + room.wav (as the room 'room') if there is none"""
+    if not SESSION_FILE.exists():
+        return manifest
+    saved = json.loads(SESSION_FILE.read_text())
+    rooms = saved.get('rooms') or {}
+    if not rooms:
+        raise ValueError(f'{SESSION_FILE} lists no rooms')
+    for name in rooms:
+        if not re.fullmatch(r'[\w.-]+', name) or name in RESERVED_NAMES:
+            raise ValueError(f'Invalid room name in {SESSION_FILE}: {name!r}')
+    manifest.update({
+        'ref': saved.get('ref', 'ref.wav'),
+        'rooms': dict(rooms),
+        'memory_budget_mb': saved.get('memory_budget_mb'),
+    })
+    return manifest
+
+def load_room(name, ref=None):
+    """A room recording from the manifest, checked against ref (the loaded source unless given) and aligned to it"""
+    if name not in manifest['rooms']:
+        raise KeyError(f'Unknown room: {name}')
+    if ref is None:
+        ref = audio_sources['ref']
+    room = load_wav(manifest['rooms'][name])
+
+    if ref.sample_rate != room.sample_rate:
+        raise ValueError(f"Sample rates must match between {ref.path} and {room.path}")
 
-def load_audio_files():
-    audio_sources['ref'] = load_wav('ref.wav')
-    audio_sources['room'] = load_wav('room.wav')
+    # testbed/load-audio/align - present room in ref time (offset and clock drift removed)
+    if align.ALIGN_ROOM:
+        room = align.align_room(ref, room)
+    return room
 
-    if audio_sources['ref'].sample_rate != audio_sources['room'].sample_rate:
-        raise ValueError("Sample rates must match between ref.wav and room.wav")
+def load_audio_files(room=None):
+    """Load ref and one room (the manifest's first unless named) as the 'ref' and 'room' sources"""
+    load_manifest()
+    # testbed/startup - both are published once the room is aligned, so nothing plays ref while the audio stage runs
+    ref = load_wav(manifest['ref'])
+    room = load_room(room or next(iter(manifest['rooms'])), ref)
+    audio_sources['ref'] = ref
+    audio_sources['room'] = room
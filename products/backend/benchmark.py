@@ -0,0 +1,289 @@
+# testbed/benchmark
+#
+# Time the DSP and metering hot paths on synthetic audio, headless, and compare against a baseline.
+# Runs in a scratch directory, so the real cache, history and logs are never touched:
+#
+#   python benchmark.py --lengths 30,120 --output bench.json
+#   python benchmark.py --baseline bench.json          # exits 1 if anything got slower than the tolerance
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+from scipy import signal
+from scipy.io import wavfile
+from audio import audio_sources, load_wav, load_audio_files
+from measurements import spectrum
+import align
+import cache
+import export
+import history
+import logger
+import meters
+import processor
+
+SAMPLE_RATE = 44100
+ROOM_OFFSET = 0.25        # seconds room.wav starts after ref.wav
+ROOM_DRIFT = 20e-6        # room clock rate error
+METER_CALLS = 200         # calls per timing of the per-tick functions
+
+# testbed/benchmark - synthetic audio
+
+def generate_ref(seconds, sample_rate, seed=0):
+    """Stereo 'music': low-passed noise with a slow loudness envelope and a few tones, float32 in [-1, 1]"""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sample_rate)
+    t = np.arange(n, dtype=np.float32) / sample_rate
+    noise = signal.lfilter([0.05], [1, -0.95], rng.standard_normal((n, 2)).astype(np.float32), axis=0)
+    envelope = 0.6 + 0.4 * np.sin(2 * np.pi * 0.2 * t)
+    tones = sum(0.05 * np.sin(2 * np.pi * f * t) for f in (110, 440, 1760))
+    mix = noise * envelope[:, np.newaxis] + tones[:, np.newaxis]
+    return (mix / np.max(np.abs(mix)) * 0.8).astype(np.float32)
+
+def generate_room(ref, sample_rate, seed=1):
+    """ref through a short decaying-noise room response, offset and drifting like a phone recording"""
+    rng = np.random.default_rng(seed)
+    ir_length = int(0.2 * sample_rate)
+    ir = rng.standard_normal(ir_length) * np.exp(-np.arange(ir_length) / (0.04 * sample_rate))
+    ir[0] = 4.0
+    wet = signal.oaconvolve(ref, (ir / np.sum(np.abs(ir)) * 4)[:, np.newaxis], axes=0)[:len(ref)]
+
+    # room[offset + rate * m] = wet[m]
+    n = np.arange(int(len(ref) * (1 + ROOM_DRIFT) + ROOM_OFFSET * sample_rate))
+    positions = (n - ROOM_OFFSET * sample_rate) / (1 + ROOM_DRIFT)
+    room = np.stack([np.interp(positions, np.arange(len(wet)), wet[:, c], left=0, right=0) for c in range(2)], axis=1)
+    room += rng.standard_normal(room.shape) * 1e-3
+    return (room / np.max(np.abs(room)) * 0.8).astype(np.float32)
+
+def write_wav(path, samples, sample_rate):
+    wavfile.write(path, sample_rate, np.round(samples * 32767).astype(np.int16))
+
+def generate_track(seconds, sample_rate=SAMPLE_RATE):
+    """Write ref.wav and room.wav of the given length into the current directory"""
+    ref = generate_ref(seconds, sample_rate)
+    write_wav('ref.wav', ref, sample_rate)
+    write_wav('room.wav', generate_room(ref, sample_rate), sample_rate)
+
+# testbed/benchmark - cases; each returns (function to time, calls per timing)
+
+def aligned_entries():
+    """Cache entries holding an aligned room (load-audio/align) rather than processor output"""
+    return [entry for entry in cache.CACHE_DIR.glob('*') if (entry / 'aligned.npy').exists()]
+
+def reset_processor_cache():
+    aligned = set(aligned_entries())
+    for entry in cache.CACHE_DIR.glob('*'):
+        if entry.is_dir() and entry not in aligned:
+            shutil.rmtree(entry)
+    processor.spectra_memo.clear()
+    processor.room_energy_memo.clear()
+
+def case_load_wav():
+    def run():
+        np.asarray(load_wav('ref.wav').data)  # map, then read and convert every sample
+    return run, 1
+
+def case_align_room():
+    def run():
+        Path('room.align.json').unlink(missing_ok=True)
+        for entry in aligned_entries():
+            shutil.rmtree(entry)  # time the one-off resample too
+        align.align_room(load_wav('ref.wav'), load_wav('room.wav'))
+    return run, 1
+
+def case_extract_impulse_response():
+    ref, room = audio_sources['ref'], audio_sources['room']
+    return lambda: processor.extract_impulse_response(ref.data, room.data, ref.sample_rate), 1
+
+def case_init_processor():
+    def run():
+        reset_processor_cache()
+        processor.init_processor()
+    return run, 1
+
+def case_init_processor_cached():
+    processor.init_processor()  # fill the cache once
+    return processor.init_processor, 1
+
+def case_spectrum_measure():
+    chunk = audio_sources['ref'].mono[:meters.CHUNK_SIZE]
+    def run():
+        for _ in range(METER_CALLS):
+            spectrum.measure(chunk, SAMPLE_RATE)
+    return run, METER_CALLS
+
+def case_get_chunk_at_position():
+    mono = audio_sources['ref'].mono
+    positions = np.random.default_rng(2).integers(0, len(mono), METER_CALLS)
+    def run():
+        for position in positions:
+            meters.get_chunk_at_position(mono, int(position), meters.CHUNK_SIZE)
+    return run, METER_CALLS
+
+def fill_history(name='bench'):
+    """A whole-track meter history, as analysis would leave it"""
+    store = meters.get_store(name, spectrum.NUM_BANDS)
+    num_buckets = meters.track_buckets()
+    rows = np.random.default_rng(3).uniform(-80, 0, (num_buckets, spectrum.NUM_BANDS)).astype(np.float32)
+    store.write(np.arange(num_buckets), {source: rows for source in history.SOURCES})
+    return num_buckets
+
+def case_store_meter_data():
+    bands = [-40.0] * spectrum.NUM_BANDS
+    duration = audio_sources['ref'].duration
+    times = np.random.default_rng(4).uniform(0, duration, METER_CALLS)
+    def run():
+        for t in times:
+            meters.store_meter_data('bench_live', float(t), bands, bands, bands)
+    return run, METER_CALLS
+
+def case_save_history_to_disk():
+    fill_history()
+    def run():
+        for store in meters.meter_history.values():
+            store.values['ref'][0] = store.values['ref'][0]  # touch a page so the flush has work to do
+        meters.save_history_to_disk()
+    return run, 1
+
+def case_load_history_from_disk():
+    fill_history()
+    meters.save_history_to_disk()
+    def run():
+        meters.meter_history.clear()
+        meters.load_history_from_disk()
+    return run, 1
+
+def export_case(export_format):
+    def make_case():
+        fill_history()
+        end = audio_sources['ref'].duration
+        def run():
+            chunks, _ = export.export_history('bench', 0, end, export_format)
+            for _ in chunks:
+                pass
+        return run, 1
+    return make_case
+
+CASES = {
+    'load_wav': case_load_wav,
+    'align_room': case_align_room,
+    'extract_impulse_response': case_extract_impulse_response,
+    'init_processor': case_init_processor,
+    'init_processor_cached': case_init_processor_cached,
+    'spectrum.measure': case_spectrum_measure,
+    'get_chunk_at_position': case_get_chunk_at_position,
+    'store_meter_data': case_store_meter_data,
+    'save_history_to_disk': case_save_history_to_disk,
+    'load_history_from_disk': case_load_history_from_disk,
+    'export_csv': export_case('csv'),
+    'export_npz': export_case('npz'),
+}
+
+def reset_state():
+    """Fresh cache, history and sources for the next case"""
+    reset_processor_cache()
+    meters.meter_history.clear()
+    shutil.rmtree(history.HISTORY_DIR, ignore_errors=True)
+    load_audio_files()
+
+def time_case(make_case, repeat):
+    """Seconds per call: median and best over `repeat` timings, after one untimed warm-up"""
+    reset_state()
+    run, calls = make_case()
+    run()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) / calls)
+    return {'seconds': statistics.median(timings), 'best': min(timings), 'calls': calls, 'repeat': repeat}
+
+def run_benchmarks(lengths, names, repeat):
+    results = {}
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='boomer-bench-') as scratch:
+        os.chdir(scratch)
+        try:
+            for seconds in lengths:
+                print(f'Generating {seconds:g}s track...', file=sys.stderr)
+                generate_track(seconds)
+                for name in names:
+                    result = time_case(CASES[name], repeat)
+                    result['track_seconds'] = seconds
+                    results[f'{name}@{seconds:g}s'] = result
+                    print(f'  {name:<26} {result["seconds"] * 1000:10.3f} ms', file=sys.stderr)
+        finally:
+            logger.stop_writer()  # close the scratch session log before the directory goes
+            os.chdir(original_dir)
+    return results
+
+# testbed/benchmark - baseline comparison
+
+def compare(results, baseline, tolerance):
+    """Print current vs baseline for every shared case; returns the names that got slower than tolerance"""
+    regressions = []
+    print(f'{"case":<36} {"baseline ms":>12} {"current ms":>12} {"change":>8}')
+    for name, result in results.items():
+        if name not in baseline:
+            print(f'{name:<36} {"-":>12} {result["seconds"] * 1000:12.3f} {"new":>8}')
+            continue
+        before = baseline[name]['seconds']
+        ratio = result['seconds'] / before if before > 0 else 1.0
+        flag = ''
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            flag = '  SLOWER'
+        print(f'{name:<36} {before * 1000:12.3f} {result["seconds"] * 1000:12.3f} {ratio - 1:+8.0%}{flag}')
+    return regressions
+
+def parse_lengths(text):
+    return [float(v) for v in text.split(',')]
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the DSP and metering hot paths on synthetic audio')
+    parser.add_argument('--lengths', type=parse_lengths, default=[30, 120], help='track lengths in seconds, comma separated')
+    parser.add_argument('--cases', default=','.join(CASES), help='cases to run, comma separated')
+    parser.add_argument('--repeat', type=int, default=5, help='timings per case (median is reported)')
+    parser.add_argument('--output', default='bench.json', help='write results here')
+    parser.add_argument('--baseline', help='compare against this earlier output')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='slowdown that counts as a regression (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    names = args.cases.split(',')
+    unknown = [n for n in names if n not in CASES]
+    if unknown:
+        parser.error(f'unknown cases: {", ".join(unknown)} (choose from {", ".join(CASES)})')
+
+    results = run_benchmarks(args.lengths, names, args.repeat)
+
+    output = {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'results': results,
+    }
+    Path(args.output).write_text(json.dumps(output, indent=2))
+    print(f'Wrote {args.output}')
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())['results']
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f'{len(regressions)} regressions beyond {args.tolerance:.0%}: {", ".join(regressions)}')
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
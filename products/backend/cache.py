@@ -0,0 +1,109 @@
+# testbed/processor/cache
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+import numpy as np
+from numpy.lib.format import open_memmap
+from logger import log
+
+CACHE_DIR = Path('cache')
+CACHE_MAX_BYTES = 4 * 1024 ** 3  # evict least-recently-used entries beyond this
+HASH_INDEX = CACHE_DIR / 'hashes.json'
+
+def file_hash(path):
+    """Content hash of a file, remembered per (path, size, mtime) so unchanged files aren't re-read"""
+    filepath = Path(path).resolve()
+    stat = filepath.stat()
+
+    index = {}
+    if HASH_INDEX.exists():
+        try:
+            index = json.loads(HASH_INDEX.read_text())
+        except ValueError:
+            index = {}
+
+    entry = index.get(str(filepath))
+    if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        return entry['hash']
+
+    with open(filepath, 'rb') as f:
+        digest = hashlib.file_digest(f, 'sha1').hexdigest()
+
+    index[str(filepath)] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': digest}
+    CACHE_DIR.mkdir(exist_ok=True)
+
+    # startup threads and param_search workers hash at the same time: a reader must never see a
+    # half-written index, so each writer writes its own temp file and renames it into place
+    tmp = HASH_INDEX.with_name(f'hashes.{os.getpid()}.{threading.get_ident()}.tmp')
+    tmp.write_text(json.dumps(index))
+    tmp.replace(HASH_INDEX)
+    return digest
+
+def cache_key(paths, params):
+    """Key from the content of the input files plus the parameters that produced the output"""
+    hasher = hashlib.sha1()
+    for path in paths:
+        hasher.update(file_hash(path).encode())
+    hasher.update(json.dumps(params, sort_keys=True).encode())
+    return hasher.hexdigest()[:16]
+
+def load_array(key, name, mmap_mode=None):
+    """Load a cached array, or None if it isn't cached"""
+    filepath = CACHE_DIR / key / f'{name}.npy'
+    if not filepath.exists():
+        return None
+    filepath.parent.touch()  # mark entry as recently used
+    return np.load(filepath, mmap_mode=mmap_mode)
+
+def store_array(key, name, array):
+    """Write an array into the cache entry for key, then enforce the size limit"""
+    entry = CACHE_DIR / key
+    entry.mkdir(parents=True, exist_ok=True)
+
+    # write to a temp file first so a crash never leaves a truncated entry
+    tmp = entry / f'{name}.tmp.npy'
+    np.save(tmp, array)
+    tmp.replace(entry / f'{name}.npy')
+    entry.touch()
+
+    evict(keep=key)
+
+def write_array(key, name, shape, dtype, fill):
+    """Write an array too large to build in memory into the cache entry for key
+
+    fill(out) writes into a memory-mapped temp file, which is renamed into place once complete.
+    """
+    entry = CACHE_DIR / key
+    entry.mkdir(parents=True, exist_ok=True)
+
+    tmp = entry / f'{name}.{os.getpid()}.{threading.get_ident()}.tmp.npy'
+    out = open_memmap(tmp, mode='w+', dtype=dtype, shape=shape)
+    fill(out)
+    out.flush()
+    del out
+    tmp.replace(entry / f'{name}.npy')
+    entry.touch()
+
+    evict(keep=key)
+
+def entry_size(entry):
+    return sum(f.stat().st_size for f in entry.glob('*.npy'))
+
+def evict(keep=None):
+    """Remove least-recently-used entries until the cache fits in CACHE_MAX_BYTES"""
+    entries = [e for e in CACHE_DIR.iterdir() if e.is_dir()]
+    sizes = {e: entry_size(e) for e in entries}
+    total = sum(sizes.values())
+
+    for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+        if total <= CACHE_MAX_BYTES:
+            break
+        if entry.name == keep:
+            continue
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= sizes[entry]
+        log('cache', f'Evicted {entry.name} ({sizes[entry] / 1e6:.1f}MB)')
@@ -0,0 +1,178 @@
+# testbed/remote-control/send-queue
+#
+# Every websocket gets a bounded outgoing queue and its own writer thread, so broadcasting only enqueues
+# and a slow or stalled client can't hold up the position and metering threads for everyone else.
+# Messages sent with a coalesce key (state, perf, each meter's frames) replace one still queued under
+# the same key: a client that falls behind gets the latest, at the rate it can take them.
+
+import socket
+import threading
+import time
+from collections import deque
+from logger import log
+
+SEND_QUEUE_LIMIT = 256   # queued messages per client; a client with more is dropped as stalled
+SEND_TIMEOUT = 10.0      # seconds one send may take before the client is dropped as stalled
+LAG_SMOOTHING = 0.1      # weight of the newest message in the mean lag
+
+class ClientConnection:
+    """Outgoing side of one websocket: a queue of [coalesce key, message, enqueue time] and a writer"""
+
+    def __init__(self, ws, address=''):
+        self.ws = ws
+        self.address = address
+        self.queue = deque()
+        self.pending = {}           # coalesce key -> its queued entry
+        self.condition = threading.Condition()
+        self.closed = False
+        self.dropped = None         # why the server gave up on this client, if it did
+        self.connected_at = time.time()
+        self.sent = 0
+        self.bytes = 0
+        self.coalesced = {}         # coalesce key -> messages replaced by a newer one before they went out
+        self.max_queue = 0
+        self.mean_lag = 0.0         # seconds from enqueue to sent, smoothed
+        self.max_lag = 0.0
+        self.max_send = 0.0         # longest single ws.send
+        self.sending_since = None   # start of the send in progress
+        self.thread = threading.Thread(target=self.writer_loop, daemon=True)
+        self.thread.start()
+
+    def send(self, message, coalesce=None):
+        """Queue a message; with a coalesce key, replace the queued one under that key instead"""
+        with self.condition:
+            if self.closed:
+                return False
+            now = time.time()
+            if self.sending_since is not None and now - self.sending_since > SEND_TIMEOUT:
+                self.close_locked(f'stalled in one send for {now - self.sending_since:.0f}s')
+                return False
+            entry = self.pending.get(coalesce) if coalesce is not None else None
+            if entry is not None:
+                entry[1] = message  # keeps its queue time, so lag counts from the first message it stands for
+                self.coalesced[coalesce] = self.coalesced.get(coalesce, 0) + 1
+                return True
+            if len(self.queue) >= SEND_QUEUE_LIMIT:
+                self.close_locked(f'stalled with {len(self.queue)} messages queued')
+                return False
+            entry = [coalesce, message, now]
+            self.queue.append(entry)
+            if coalesce is not None:
+                self.pending[coalesce] = entry
+            self.max_queue = max(self.max_queue, len(self.queue))
+            self.condition.notify()
+            return True
+
+    def writer_loop(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    break
+                coalesce, message, queued_at = self.queue.popleft()
+                if coalesce is not None:
+                    del self.pending[coalesce]
+                send_start = self.sending_since = time.time()
+
+            try:
+                self.ws.send(message)
+            except Exception as e:
+                with self.condition:
+                    self.close_locked(f'send failed: {e}')
+                break
+            done = time.time()
+            self.sending_since = None
+
+            lag = done - queued_at
+            self.sent += 1
+            self.bytes += len(message)
+            self.mean_lag += LAG_SMOOTHING * (lag - self.mean_lag)
+            self.max_lag = max(self.max_lag, lag)
+            self.max_send = max(self.max_send, done - send_start)
+
+        # a dropped client is disconnected, so it reconnects and starts from a fresh state
+        # (its socket is already shut down; this ends the websocket's own state)
+        if self.dropped is not None:
+            try:
+                self.ws.close()
+            except Exception:
+                pass
+
+    def close_locked(self, reason=None):
+        """Stop the writer and drop whatever is queued (call with the condition held)"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        self.pending.clear()
+        self.condition.notify()
+        if reason:
+            self.dropped = reason
+            log('ws', f'Dropped client {self.address}: {reason}')
+            self.shutdown_socket()
+
+    def shutdown_socket(self):
+        """Shut down the websocket's TCP socket, so a send blocked on a stalled client fails at once"""
+        sock = getattr(self.ws, 'sock', None)  # simple_websocket's connection
+        if sock is None:
+            return
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass  # already closed
+
+    def close(self):
+        with self.condition:
+            self.close_locked()
+
+    def stats(self):
+        with self.condition:
+            queued = len(self.queue)
+            queued_bytes = sum(len(message) for _, message, _ in self.queue)  # testbed/memory
+        return {
+            'address': self.address,
+            'connected_seconds': time.time() - self.connected_at,
+            'dropped': self.dropped,
+            'queued': queued,
+            'queued_bytes': queued_bytes,
+            'max_queue': self.max_queue,
+            'sent': self.sent,
+            'bytes': self.bytes,
+            'coalesced': dict(self.coalesced),
+            'mean_lag_ms': self.mean_lag * 1000,
+            'max_lag_ms': self.max_lag * 1000,
+            'max_send_ms': self.max_send * 1000,
+        }
+
+# global registry: ws -> ClientConnection
+connections = {}
+connections_lock = threading.Lock()
+
+def connect(ws, address=''):
+    with connections_lock:
+        connections[ws] = ClientConnection(ws, address)
+
+def disconnect(ws):
+    with connections_lock:
+        connection = connections.pop(ws, None)
+    if connection is not None:
+        connection.close()
+
+def send(ws, message, coalesce=None):
+    """Queue a message for one client; False if it's gone or was just dropped as stalled"""
+    connection = connections.get(ws)
+    return connection is not None and connection.send(message, coalesce)
+
+def broadcast(message, coalesce=None):
+    """Queue a message for every client"""
+    with connections_lock:
+        targets = list(connections.values())
+    for connection in targets:
+        connection.send(message, coalesce)
+
+def client_stats():
+    """Per-client queue and lag statistics, for /api/clients"""
+    with connections_lock:
+        targets = list(connections.values())
+    return [connection.stats() for connection in targets]
@@ -0,0 +1,129 @@
+# testbed/metering/history/export
+#
+# Meter history for a time range as CSV or .npz, formatted in bulk with numpy and produced a chunk of
+# buckets at a time, so the HTTP response streams while it's being built and memory stays bounded.
+
+import io
+import zipfile
+from functools import lru_cache
+import numpy as np
+from numpy.lib import format as npy_format
+import history
+import meters
+
+EXPORT_CHUNK_BUCKETS = 4096  # buckets formatted per chunk of output
+CELL_RANGE = 300.0          # values within ±CELL_RANGE are formatted by table lookup
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'npz': 'application/octet-stream',
+}
+
+def export_indices(meter_name, start_time, end_time):
+    """Bucket indices in [start_time, end_time] where any source has a value, or None if the meter has no history"""
+    store = meters.meter_history.get(meter_name)
+    if store is None:
+        return None
+    first = max(0, meters.bucket_index(start_time))
+    last = min(store.capacity, meters.bucket_index(end_time) + 1)
+    if last <= first:
+        return np.zeros(0, dtype=np.int64)
+    stored = np.zeros(last - first, dtype=bool)
+    for source in history.SOURCES:
+        stored |= store.valid_mask(source, first, last)
+    return np.flatnonzero(stored) + first
+
+def chunk_rows(store, indices):
+    """{source: (len(indices), bands) float32} with NaN where a source has nothing stored"""
+    return {source: store.read_at(source, indices, fill=np.nan) for source in history.SOURCES}
+
+@lru_cache(maxsize=1)
+def cell_strings():
+    """'%.2f' text of every value from -CELL_RANGE to CELL_RANGE in steps of 0.01, indexed by hundredths + offset"""
+    steps = int(round(CELL_RANGE * 100))
+    return np.array([f'{i / 100:.2f}' for i in range(-steps, steps + 1)], dtype=object), steps
+
+def format_cells(values):
+    """Object array of '%.2f' strings for a float array: a table lookup, with a per-cell format outside its range"""
+    table, offset = cell_strings()
+    hundredths = np.round(values.astype(np.float64) * 100)
+    inside = np.abs(hundredths) <= offset
+    cells = table[np.where(inside, hundredths, 0).astype(np.int64) + offset]
+    cells[(hundredths == 0) & (values < 0)] = '-0.00'  # as '%.2f' prints small negatives
+    for i in zip(*np.nonzero(~inside)):
+        cells[i] = f'{values[i]:.2f}'
+    return cells
+
+def csv_chunks(meter_name, indices):
+    """CSV text: one row per stored (bucket, source), sources in history.SOURCES order within a bucket"""
+    store = meters.meter_history[meter_name]
+    header = ['time', 'source'] + [f'band_{i}' for i in range(store.num_bands)]
+    yield ','.join(header) + '\n'
+
+    bands = store.num_bands
+    source_labels = np.array([f',{source}' for source in history.SOURCES], dtype=object)
+    for start in range(0, len(indices), EXPORT_CHUNK_BUCKETS):
+        chunk = indices[start:start + EXPORT_CHUNK_BUCKETS]
+        rows = chunk_rows(store, chunk)
+
+        # (buckets, sources) in bucket-major order, keeping only stored rows
+        values = np.stack([rows[s] for s in history.SOURCES], axis=1)
+        bucket, source = np.nonzero(~np.isnan(values[..., 0]))
+
+        # every cell and separator of the chunk in one object array, joined once:
+        # time ',source' , v0 , v1 ... , v(bands-1) '\n'
+        times = np.array([f'{t:.1f}' for t in (chunk * meters.TIME_BUCKET_SIZE).tolist()], dtype=object)
+        cells = np.empty((len(bucket), 2 * bands + 3), dtype=object)
+        cells[:, 0] = times[bucket]
+        cells[:, 1] = source_labels[source]
+        cells[:, 2:2 * bands + 1:2] = ','
+        cells[:, 3:2 * bands + 2:2] = format_cells(values[bucket, source])
+        cells[:, -1] = '\n'
+        yield ''.join(cells.ravel().tolist())
+
+class ZipStream(io.RawIOBase):
+    """Write-only stream that hands out what has been written so far, for zipfile's streaming mode"""
+
+    def __init__(self):
+        self.parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+def npz_chunks(meter_name, indices):
+    """An .npz with `time` (buckets,) and one (buckets, bands) float32 array per source, NaN where missing"""
+    store = meters.meter_history[meter_name]
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED) as archive:
+        with archive.open('time.npy', 'w') as member:
+            npy_format.write_array(member, (indices * meters.TIME_BUCKET_SIZE).astype(np.float64))
+        yield stream.take()
+
+        for source in history.SOURCES:
+            with archive.open(f'{source}.npy', 'w', force_zip64=True) as member:
+                header = {'descr': npy_format.dtype_to_descr(np.dtype(np.float32)), 'fortran_order': False,
+                          'shape': (len(indices), store.num_bands)}
+                npy_format.write_array_header_1_0(member, header)
+                for start in range(0, len(indices), EXPORT_CHUNK_BUCKETS):
+                    rows = store.read_at(source, indices[start:start + EXPORT_CHUNK_BUCKETS], fill=np.nan)
+                    member.write(rows.tobytes())
+                    yield stream.take()
+    yield stream.take()
+
+def export_history(meter_name, start_time, end_time, export_format='csv'):
+    """(chunk generator, bucket count) for a time range of a meter's history, or None if there's nothing in it"""
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f'Unknown export format: {export_format} (choose from {", ".join(EXPORT_FORMATS)})')
+    indices = export_indices(meter_name, start_time, end_time)
+    if indices is None or len(indices) == 0:
+        return None
+    chunks = csv_chunks if export_format == 'csv' else npz_chunks
+    return chunks(meter_name, indices), len(indices)
@@ -0,0 +1,71 @@
+# testbed/metering/binary-frames, testbed/metering/history/range
+#
+# Frame layout (little-endian):
+#   header   u8 kind, u8 encoding, u8 num_sources, u8 reserved, u16 num_bands, u16 label_length
+#   label    utf-8 "name:source,source,..." (range frames add ":stat,stat,...") zero-padded to a multiple of 4 bytes
+#   meter:   f64 time, f32 diff, then per source: num_bands values
+#   range:   f64 start, f64 end, u32 buckets per column,
+#            then per source: u32 count, u32 first bucket of each column[count], then count * num_bands values per stat
+# Values are float32, or uint8 dB quantized over [DB_MIN, DB_MAX]; uint8 runs are padded to 4 bytes
+# so every Float32Array/Uint32Array view on the frontend starts aligned.
+
+import struct
+import numpy as np
+
+KIND_METER = 1
+KIND_RANGE = 3
+
+ENCODINGS = {'f32': 0, 'u8': 1}
+FORMATS = ['json', *ENCODINGS]
+
+DB_MIN = -80.0
+DB_MAX = 0.0
+
+HEADER = struct.Struct('<BBBBHH')
+METER_FIELDS = struct.Struct('<df')
+RANGE_FIELDS = struct.Struct('<ddI')
+
+def padding(length):
+    return -length % 4
+
+def encode_values(values, encoding):
+    """Band values as bytes in the given encoding, padded to a multiple of 4 bytes"""
+    values = np.asarray(values, dtype=np.float32)
+    if encoding == 'u8':
+        scaled = (np.clip(values, DB_MIN, DB_MAX) - DB_MIN) * (255 / (DB_MAX - DB_MIN))
+        data = np.round(scaled).astype(np.uint8).tobytes()
+        return data + bytes(padding(len(data)))
+    return values.astype('<f4').tobytes()
+
+def encode_header(kind, encoding, name, sources, num_bands, stats=None):
+    label = f'{name}:{",".join(sources)}'
+    if stats:
+        label += f':{",".join(stats)}'
+    label = label.encode()
+    header = HEADER.pack(kind, ENCODINGS[encoding], len(sources), 0, num_bands, len(label))
+    return header + label + bytes(padding(len(label)))
+
+def encode_meter_frame(name, time, diff, bands_by_source, encoding):
+    """One live meter reading for several sources"""
+    sources = list(bands_by_source)
+    num_bands = len(bands_by_source[sources[0]])
+    parts = [
+        encode_header(KIND_METER, encoding, name, sources, num_bands),
+        METER_FIELDS.pack(time, np.nan if diff is None else diff),
+    ]
+    parts += [encode_values(bands_by_source[s], encoding) for s in sources]
+    return b''.join(parts)
+
+def encode_range_frame(name, num_bands, start, end, span, columns_by_source, stats, encoding):
+    """Aggregated history; columns_by_source[source] = (first bucket indices, {stat: rows of num_bands values})"""
+    sources = list(columns_by_source)
+    parts = [
+        encode_header(KIND_RANGE, encoding, name, sources, num_bands, stats),
+        RANGE_FIELDS.pack(start, end, span),
+    ]
+    for source in sources:
+        indices, rows = columns_by_source[source]
+        parts.append(struct.pack('<I', len(indices)))
+        parts.append(np.asarray(indices, dtype='<u4').tobytes())
+        parts += [encode_values(rows[stat], encoding) for stat in stats]
+    return b''.join(parts)
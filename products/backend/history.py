@@ -0,0 +1,297 @@
+# testbed/metering/history/columnar, testbed/metering/history/range
+
+import json
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+import numpy as np
+from numpy.lib.format import open_memmap
+from logger import log
+
+HISTORY_DIR = Path('meter_history')
+SOURCES = ['ref', 'room', 'processed']
+HISTORY_DTYPE = 'float32'     # 'float32', or 'int16' for values quantized to 1/QUANTIZE_SCALE
+QUANTIZE_SCALE = 100.0        # int16 steps per unit (0.01 dB for dB meters)
+INITIAL_CAPACITY = 1024       # buckets allocated for a new meter when the track length isn't known
+MISSING_INT16 = np.iinfo(np.int16).min
+PYRAMID_FACTOR = 4            # testbed/metering/history/range - nodes (or buckets) aggregated per pyramid node
+STATS = ['min', 'mean', 'max']
+
+@dataclass
+class Level:
+    """One pyramid level for one source: each node aggregates PYRAMID_FACTOR ** level buckets"""
+    sum: np.ndarray       # (nodes, bands) float32
+    count: np.ndarray     # (nodes,) stored buckets under each node
+    min: np.ndarray       # (nodes, bands), +inf where count is 0
+    max: np.ndarray       # (nodes, bands), -inf where count is 0
+
+class MeterStore:
+    """History of one meter: a (bucket index x band) array per source, memory-mapped from disk"""
+
+    def __init__(self, directory, num_bands, dtype=HISTORY_DTYPE, capacity=INITIAL_CAPACITY, max_buckets=None):
+        self.directory = Path(directory)
+        self.lock = threading.RLock()
+        self.max_buckets = max_buckets  # keep only this many most recently written buckets (None = all)
+
+        meta_file = self.directory / 'meta.json'
+        if meta_file.exists():
+            meta = json.loads(meta_file.read_text())
+            self.num_bands = meta['bands']
+            self.dtype = np.dtype(meta['dtype'])
+            self.values = {s: open_memmap(self.directory / f'{s}.npy', mode='r+') for s in SOURCES}
+            self.stamps = open_memmap(self.directory / 'stamps.npy', mode='r+')
+        else:
+            self.num_bands = num_bands
+            self.dtype = np.dtype(dtype)
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self.values = {s: self.create_column(f'{s}.npy', capacity) for s in SOURCES}
+            self.stamps = open_memmap(self.directory / 'stamps.npy', mode='w+', dtype=np.int64, shape=(capacity,))
+            meta_file.write_text(json.dumps({'bands': self.num_bands, 'dtype': self.dtype.name}))
+
+        # stamps[i] = write sequence number of bucket i (0 = never written); used for the duration cap
+        self.sequence = int(self.stamps.max(initial=0))
+        self.count = int(np.count_nonzero(self.stamps))
+        self.build_pyramid()
+
+    @property
+    def capacity(self):
+        return len(self.stamps)
+
+    def create_column(self, name, capacity):
+        column = open_memmap(self.directory / name, mode='w+', dtype=self.dtype, shape=(capacity, self.num_bands))
+        column[:] = self.missing
+        return column
+
+    @property
+    def missing(self):
+        return MISSING_INT16 if self.dtype == np.int16 else np.nan
+
+    def encode(self, rows):
+        rows = np.asarray(rows, dtype=np.float32)
+        if self.dtype == np.int16:
+            return np.clip(np.round(rows * QUANTIZE_SCALE), MISSING_INT16 + 1, np.iinfo(np.int16).max)
+        return rows
+
+    def decode(self, rows):
+        if self.dtype == np.int16:
+            return rows.astype(np.float32) / QUANTIZE_SCALE
+        return np.asarray(rows, dtype=np.float32)
+
+    def is_stored(self, rows):
+        """True for each raw row that holds a value rather than the missing marker"""
+        if self.dtype == np.int16:
+            return rows[..., 0] != MISSING_INT16
+        return ~np.isnan(rows[..., 0])
+
+    def valid_mask(self, source, first=0, last=None):
+        return self.is_stored(self.values[source][first:last])
+
+    def grow(self, needed):
+        """Reallocate every column to hold at least `needed` buckets (called with lock held)"""
+        self.reallocate(max(needed, 2 * self.capacity))
+
+    def reallocate(self, capacity):
+        """Copy every column into files of `capacity` buckets, dropping any past it (called with lock held)"""
+        kept = min(capacity, self.capacity)
+        for source in SOURCES:
+            old = self.values[source]
+            tmp = self.create_column(f'{source}.tmp.npy', capacity)
+            tmp[:kept] = old[:kept]
+            tmp.flush()
+            del tmp, old
+            (self.directory / f'{source}.tmp.npy').replace(self.directory / f'{source}.npy')
+            self.values[source] = open_memmap(self.directory / f'{source}.npy', mode='r+')
+
+        old = self.stamps
+        tmp = open_memmap(self.directory / 'stamps.tmp.npy', mode='w+', dtype=np.int64, shape=(capacity,))
+        tmp[:kept] = old[:kept]
+        tmp.flush()
+        del tmp, old
+        (self.directory / 'stamps.tmp.npy').replace(self.directory / 'stamps.npy')
+        self.stamps = open_memmap(self.directory / 'stamps.npy', mode='r+')
+        self.build_pyramid()
+
+    def write(self, indices, rows_by_source):
+        """Store rows at the given bucket indices; rows_by_source[source] is (len(indices), bands)"""
+        indices = np.asarray(indices)
+        if len(indices) == 0:
+            return
+        with self.lock:
+            if indices.max() >= self.capacity:
+                self.grow(int(indices.max()) + 1)
+
+            for source, rows in rows_by_source.items():
+                self.values[source][indices] = self.encode(rows)
+            self.update_pyramid(indices, rows_by_source)
+
+            self.count += int(np.count_nonzero(self.stamps[indices] == 0))
+            self.stamps[indices] = np.arange(self.sequence + 1, self.sequence + 1 + len(indices))
+            self.sequence += len(indices)
+
+            if self.max_buckets is not None and self.count > self.max_buckets * 1.1:
+                self.enforce_cap()
+
+    def enforce_cap(self):
+        """Forget the least recently written buckets, back down to max_buckets (called with lock held)"""
+        written = np.flatnonzero(self.stamps)
+        oldest = written[np.argsort(self.stamps[written])[:len(written) - self.max_buckets]]
+        for source in SOURCES:
+            self.values[source][oldest] = self.missing
+        self.stamps[oldest] = 0
+        self.count = self.max_buckets
+
+        # buckets are indexed by track position, so the columns can only shrink to the last one still stored;
+        # only when that at least halves them, so a store near its size isn't reallocated on every write
+        stored = np.flatnonzero(self.stamps)
+        needed = max(INITIAL_CAPACITY, int(stored[-1]) + 1 if len(stored) else 0)
+        if needed <= self.capacity // 2:
+            self.reallocate(needed)  # rebuilds the pyramid at the new size
+        else:
+            self.update_pyramid(oldest, SOURCES)
+
+    def read(self, source, first=0, last=None):
+        """(indices, rows) of stored buckets in [first, last) for one source, rows as float32"""
+        with self.lock:
+            last = self.capacity if last is None else min(last, self.capacity)
+            first = max(0, first)
+            if last <= first:
+                return np.zeros(0, dtype=np.int64), np.zeros((0, self.num_bands), dtype=np.float32)
+            indices = np.flatnonzero(self.valid_mask(source, first, last)) + first
+            return indices, self.decode(self.values[source][indices])
+
+    def read_at(self, source, indices, fill=0.0):
+        """Rows for one source at the given bucket indices, with `fill` where nothing is stored"""
+        with self.lock:
+            indices = np.asarray(indices)
+            inside = indices < self.capacity
+            rows = np.full((len(indices), self.num_bands), fill, dtype=np.float32)
+            stored = np.zeros(len(indices), dtype=bool)
+            stored[inside] = self.valid_mask(source)[indices[inside]]
+            rows[stored] = self.decode(self.values[source][indices[stored]])
+            return rows
+
+    # testbed/metering/history/range - min/mean/max pyramid, kept in memory and updated on every write
+
+    def build_pyramid(self):
+        """Aggregate every level from the stored buckets (on open and after growing)"""
+        self.pyramid = {source: [] for source in SOURCES}
+        for source in SOURCES:
+            size = self.capacity
+            while size > 1:
+                size = -(-size // PYRAMID_FACTOR)
+                self.pyramid[source].append(Level(
+                    sum=np.zeros((size, self.num_bands), dtype=np.float32),
+                    count=np.zeros(size, dtype=np.int32),
+                    min=np.full((size, self.num_bands), np.inf, dtype=np.float32),
+                    max=np.full((size, self.num_bands), -np.inf, dtype=np.float32)))
+                self.refresh(source, len(self.pyramid[source]), np.arange(size))
+
+    def node_stats(self, source, level, nodes):
+        """(sum, count, min, max) of nodes at a level (0 = the stored buckets); nodes past the end are empty"""
+        if level == 0:
+            size = self.capacity
+        else:
+            below = self.pyramid[source][level - 1]
+            size = len(below.count)
+        inside = nodes < size
+        nodes = np.where(inside, nodes, 0)
+
+        if level == 0:
+            raw = self.values[source][nodes]
+            count = (self.is_stored(raw) & inside).astype(np.int32)
+            rows = self.decode(raw)
+            total, low, high = rows, rows, rows
+        else:
+            count = np.where(inside, below.count[nodes], 0)
+            total, low, high = below.sum[nodes], below.min[nodes], below.max[nodes]
+
+        stored = count[..., np.newaxis] > 0
+        return (np.where(stored, total, 0), count,
+                np.where(stored, low, np.inf), np.where(stored, high, -np.inf))
+
+    def refresh(self, source, level, nodes):
+        """Recompute nodes at a level (>= 1) from their children one level down"""
+        children = nodes[:, np.newaxis] * PYRAMID_FACTOR + np.arange(PYRAMID_FACTOR)
+        total, count, low, high = self.node_stats(source, level - 1, children)
+        target = self.pyramid[source][level - 1]
+        target.sum[nodes] = total.sum(axis=1)
+        target.count[nodes] = count.sum(axis=1)
+        target.min[nodes] = low.min(axis=1)
+        target.max[nodes] = high.max(axis=1)
+
+    def update_pyramid(self, indices, sources):
+        """Refresh the ancestors of the given buckets, level by level (called with lock held)"""
+        for source in sources:
+            nodes = np.unique(indices)
+            for level in range(1, len(self.pyramid[source]) + 1):
+                nodes = np.unique(nodes // PYRAMID_FACTOR)
+                self.refresh(source, level, nodes)
+
+    def read_range(self, source, first, last, columns):
+        """Aggregates of the buckets in [first, last) at about `columns` columns
+
+        Uses the pyramid level whose node size is nearest to the buckets per column, so the result
+        has between half and twice the requested number of columns (fewer if the range has fewer buckets).
+        returns: (first bucket index of each column, buckets per column, {stat: (columns, bands) rows})
+        """
+        with self.lock:
+            first = max(0, first)
+            last = min(last, self.capacity)
+            levels = self.pyramid[source]
+            level = 0
+            while level < len(levels) and PYRAMID_FACTOR ** (level + 1) * max(1, columns) <= 2 * (last - first):
+                level += 1
+
+            if level == 0:
+                indices, rows = self.read(source, first, last)
+                return indices, 1, {stat: rows for stat in STATS}
+
+            span = PYRAMID_FACTOR ** level
+            node = levels[level - 1]
+            nodes = np.arange(first // span, -(-last // span))
+            nodes = nodes[node.count[nodes] > 0]
+            count = node.count[nodes][:, np.newaxis]
+            return nodes * span, span, {
+                'min': node.min[nodes],
+                'mean': node.sum[nodes] / count,
+                'max': node.max[nodes],
+            }
+
+    def num_buckets(self, source='ref'):
+        with self.lock:
+            return int(np.count_nonzero(self.valid_mask(source)))
+
+    def flush(self):
+        with self.lock:
+            for column in self.values.values():
+                column.flush()
+            self.stamps.flush()
+
+def open_stores(directory=HISTORY_DIR, max_buckets=None):
+    """Open every meter store found on disk"""
+    stores = {}
+    if directory.exists():
+        for meta in directory.glob('*/meta.json'):
+            stores[meta.parent.name] = MeterStore(meta.parent, num_bands=None, max_buckets=max_buckets)
+    return stores
+
+def import_json_history(path, bucket_size, capacity, directory=HISTORY_DIR, max_buckets=None):
+    """One-time migration from the old meter_history.json (float-second keys, list values)"""
+    with open(path, 'r') as f:
+        data = json.load(f)
+
+    stores = {}
+    for meter_name, sources in data.items():
+        buckets = sources.get('ref', {})
+        if not buckets:
+            continue
+        num_bands = len(next(iter(buckets.values())))
+        store = MeterStore(directory / meter_name, num_bands, capacity=capacity, max_buckets=max_buckets)
+        for source, buckets in sources.items():
+            if source in SOURCES and buckets:
+                indices = [round(float(k) / bucket_size) for k in buckets.keys()]
+                store.write(indices, {source: list(buckets.values())})
+        store.flush()
+        stores[meter_name] = store
+    log('meter', f'Imported {len(stores)} meters from {path}')
+    return stores
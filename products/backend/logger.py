@@ -1,20 +1,134 @@
-# testbed/logging
+# testbed/logging, testbed/logging/queued
 
+import atexit
+import queue
+import sys
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
 
 LOG_DIR = Path('logs')
 LOG_FILE = LOG_DIR / 'session.log'
 
+# testbed/logging/queued - callers only enqueue; a background writer formats and flushes in batches
+QUEUE_SIZE = 10000        # pending messages; beyond this, messages are dropped and counted
+RATE_LIMIT = 50           # messages per category per RATE_WINDOW; the rest are suppressed and counted
+RATE_WINDOW = 1.0         # seconds
+FLUSH_INTERVAL = 0.1      # seconds the writer waits for more messages before flushing
+
+log_queue = queue.Queue(maxsize=QUEUE_SIZE)
+writer_thread = None
+writer_lock = threading.Lock()
+counter_lock = threading.Lock()
+rate_windows = {}         # category -> [window start, messages allowed in window]
+suppressed = {}           # category -> messages suppressed by the rate limit, ever
+dropped = 0               # messages lost to a full queue, ever
+
 def init_logging():
     LOG_DIR.mkdir(exist_ok=True)
     LOG_FILE.write_text('')
+    start_writer()
     log('system', 'Logging initialized')
 
 def log(category: str, message: str, source: str = 'backend'):
-    timestamp = datetime.now().strftime('%H:%M:%S.') + f'{datetime.now().microsecond // 1000:03d}'
-    line = f'[{timestamp}] [{source}] [{category}] {message}'
+    global dropped
+    now = time.time()
+    if not allow(category, now):
+        return
+    if writer_thread is None:
+        start_writer()
+    try:
+        log_queue.put_nowait((now, source, category, message))
+    except queue.Full:
+        with counter_lock:
+            dropped += 1
+
+def allow(category, now):
+    """Per-category rate limit: at most RATE_LIMIT messages per RATE_WINDOW"""
+    with counter_lock:
+        window = rate_windows.get(category)
+        if window is None or now - window[0] >= RATE_WINDOW:
+            rate_windows[category] = [now, 1]
+            return True
+        if window[1] < RATE_LIMIT:
+            window[1] += 1
+            return True
+        suppressed[category] = suppressed.get(category, 0) + 1
+        return False
+
+def format_line(entry):
+    timestamp, source, category, message = entry
+    when = datetime.fromtimestamp(timestamp)
+    return f'[{when.strftime("%H:%M:%S.")}{when.microsecond // 1000:03d}] [{source}] [{category}] {message}'
+
+def notices(now, reported):
+    """Lines reporting messages suppressed or dropped since the last report (writer thread only)"""
+    with counter_lock:
+        counts = {**{f'{category} messages suppressed': n for category, n in suppressed.items()},
+                  'messages dropped (queue full)': dropped}
+    lines = []
+    for what, count in counts.items():
+        if count > reported.get(what, 0):
+            lines.append(format_line((now, 'backend', 'logging', f'{count - reported.get(what, 0)} {what}')))
+            reported[what] = count
+    return lines
+
+def write_batch(file, lines):
+    if lines:
+        text = '\n'.join(lines) + '\n'
+        sys.stdout.write(text)
+        sys.stdout.flush()
+        file.write(text)
+        file.flush()
+
+def writer_loop(file):
+    reported = {}  # suppression and drop counts already written
+    last_notice = time.time()
+    while True:
+        try:
+            entries = [log_queue.get(timeout=FLUSH_INTERVAL)]
+        except queue.Empty:
+            entries = []
+        while len(entries) < QUEUE_SIZE:
+            try:
+                entries.append(log_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        stopping = None in entries
+        lines = [format_line(e) for e in entries if e is not None]
+        now = time.time()
+        if stopping or now - last_notice >= RATE_WINDOW:
+            lines += notices(now, reported)
+            last_notice = now
+        write_batch(file, lines)
+        if stopping:
+            file.close()
+            return
+
+def start_writer():
+    """Open the log file once and start the writer (idempotent)"""
+    global writer_thread
+    with writer_lock:
+        if writer_thread is not None:
+            return
+        LOG_DIR.mkdir(exist_ok=True)
+        file = open(LOG_FILE, 'a')
+        writer_thread = threading.Thread(target=writer_loop, args=(file,), daemon=True)
+        writer_thread.start()
+        atexit.register(stop_writer)
+
+def stop_writer():
+    """Flush everything queued so far and close the file"""
+    global writer_thread
+    with writer_lock:
+        if writer_thread is None:
+            return
+        log_queue.put(None)
+        writer_thread.join()
+        writer_thread = None
 
-    print(line)
-    with open(LOG_FILE, 'a') as f:
-        f.write(line + '\n')
+def get_log_stats():
+    with counter_lock:
+        return {'queued': log_queue.qsize(), 'dropped': dropped, 'suppressed': dict(suppressed)}
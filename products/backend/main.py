@@ -1,16 +1,26 @@
-# testbed/load-audio, testbed/logging, testbed/remote-control, testbed/transport, testbed/metering, testbed/processor
+# testbed/load-audio, testbed/logging, testbed/remote-control, testbed/transport, testbed/metering, testbed/processor, testbed/metering/history/analyze, testbed/metering/binary-frames, testbed/metering/history/range, testbed/processor/live-params, testbed/transport/low-latency, testbed/transport/perf, testbed/load-audio/session, testbed/remote-control/send-queue, testbed/startup, testbed/memory
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_sock import Sock
+import atexit
 import json
-from audio import load_audio_files, audio_sources
+import os
+import threading
+from audio import manifest
 from logger import init_logging, log
-from state import state, connected_clients, get_state_dict, broadcast_state
-from playback import start_playback, stop_playback, seek, start_position_thread, switch_source
-from meters import start_metering_thread, subscribe, unsubscribe, client_disconnected, register_measurement, get_meter_history, load_history_from_disk, save_history_to_disk, export_meter_csv
+from state import state, get_state_dict, broadcast_state
+from playback import start_playback, stop_playback, seek, start_position_thread, switch_source, set_processor_params, set_playback_mode
+from meters import subscribe, unsubscribe, client_disconnected, register_measurement, get_meter_history, save_history_to_disk, start_analysis, set_meter_format, get_meter_range, encode_range_message, send_range
 from measurements import register_all
 import processor
-
+import perf
+import export
+import session
+import clients
+import startup
+import memory
+
+DEBUG = True
 app = Flask(__name__, static_folder='../frontend', static_url_path='')
 sock = Sock(app)
 
@@ -20,24 +30,12 @@ def index():
 
 @sock.route('/ws')
 def websocket(ws):
-    connected_clients.append(ws)
-    log('ws', 'Client connected')
-
-    # send audio metadata on connect
-    metadata = {
-        'type': 'audio_loaded',
-        'ref': {
-            'duration': audio_sources['ref'].duration,
-            'sample_rate': audio_sources['ref'].sample_rate,
-            'channels': audio_sources['ref'].channels
-        },
-        'room': {
-            'duration': audio_sources['room'].duration,
-            'sample_rate': audio_sources['room'].sample_rate,
-            'channels': audio_sources['room'].channels
-        }
-    }
-    ws.send(json.dumps(metadata))
+    clients.connect(ws, request.remote_addr)  # testbed/remote-control/send-queue - everything sent goes through its queue
+    log('ws', f'Client connected: {request.remote_addr}')
+
+    # send audio metadata on connect (testbed/startup - or once the audio stage is ready)
+    if startup.ready('audio'):
+        clients.send(ws, json.dumps(session.audio_metadata()))
 
     # keep connection open for future messages
     while True:
@@ -58,20 +56,43 @@ def websocket(ws):
             stop_playback()
         if data['type'] == 'seek':
             seek(data['position'])
+        # testbed/transport/low-latency
+        if data['type'] == 'playback_mode':
+            try:
+                set_playback_mode(data['mode'])
+            except ValueError as e:
+                log('transport', f'Rejected playback mode: {e}')
 
         # testbed/source-switch
         if data['type'] == 'source':
-            switch_source(data['name'])
+            # testbed/load-audio/session - another room may need loading first, so that runs in the background
+            if data['name'] in session.rooms and data['name'] != session.active_room:
+                threading.Thread(target=switch_source, args=(data['name'],), daemon=True).start()
+            else:
+                switch_source(data['name'])
+
+        # testbed/processor/live-params - applied in the background so this client's messages keep flowing
+        if data['type'] == 'processor_params':
+            threading.Thread(target=apply_processor_params, args=(data['params'],), daemon=True).start()
 
         # testbed/metering
         if data['type'] == 'meter_subscribe':
             subscribe(ws, data['name'])
         if data['type'] == 'meter_unsubscribe':
             unsubscribe(ws, data['name'])
+        # testbed/metering/binary-frames
+        if data['type'] == 'meter_format':
+            set_meter_format(ws, data['format'])
+        # testbed/metering/history/range
+        if data['type'] == 'meter_range':
+            send_range(ws, data['name'], data['start'], data['end'], data['columns'], data.get('stats'))
+        # testbed/metering/history/analyze
+        if data['type'] == 'meter_analyze':
+            start_analysis(data['name'])
 
     # testbed/metering - cleanup on disconnect
     client_disconnected(ws)
-    connected_clients.remove(ws)
+    clients.disconnect(ws)
     log('ws', 'Client disconnected')
 
 # testbed/remote-control - API endpoints
@@ -96,12 +117,63 @@ def api_seek():
     seek(position)
     return jsonify(get_state_dict())
 
+# testbed/transport/perf - callback timing, headroom and underruns since start (or the last reset)
+@app.route('/api/perf')
+def api_perf():
+    return jsonify(perf.get_perf())
+
+@app.route('/api/perf/reset', methods=['POST'])
+def api_perf_reset():
+    perf.reset()
+    return jsonify(perf.get_perf())
+
+# testbed/transport/low-latency
+@app.route('/api/playback/mode', methods=['POST'])
+def api_playback_mode():
+    try:
+        set_playback_mode(request.args.get('mode', 'stable'))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify(get_state_dict())
+
 @app.route('/api/source', methods=['POST'])
 def api_source():
     name = request.args.get('name', 'ref')
     switch_source(name)
     return jsonify(get_state_dict())
 
+# testbed/load-audio/session
+@app.route('/api/session')
+def api_session():
+    return jsonify({'ref': manifest['ref'], 'active': session.active_room,
+                    'memory_budget_mb': session.memory_budget() / 1024 ** 2, 'rooms': session.describe_rooms()})
+
+# testbed/remote-control/send-queue - queue depth, coalesced messages and lag per connected client
+@app.route('/api/clients')
+def api_clients():
+    return jsonify(clients.client_stats())
+
+# testbed/memory - bytes held per source, buffer and meter history
+@app.route('/api/memory')
+def api_memory():
+    return jsonify(memory.memory_report())
+
+# testbed/processor/live-params - change IR parameters while playing
+def apply_processor_params(params):
+    try:
+        set_processor_params(params)
+    except ValueError as e:
+        log('processor', f'Rejected parameters: {e}')
+
+@app.route('/api/processor/params', methods=['GET', 'POST'])
+def api_processor_params():
+    if request.method == 'POST':
+        try:
+            set_processor_params(request.args.to_dict())
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify(processor.ir_params())
+
 # testbed/remote-control - client control endpoints
 
 @app.route('/api/client/click', methods=['POST'])
@@ -109,11 +181,7 @@ def api_client_click():
     element = request.args.get('element', '')
     message = json.dumps({'type': 'remote_click', 'element': element})
     log('remote', f'Click: {element}')
-    for ws in connected_clients:
-        try:
-            ws.send(message)
-        except:
-            pass
+    clients.broadcast(message)
     return jsonify(get_state_dict())
 
 @app.route('/api/client/eval', methods=['POST'])
@@ -121,48 +189,65 @@ def api_client_eval():
     code = request.args.get('js', '')
     message = json.dumps({'type': 'remote_eval', 'code': code})
     log('remote', f'Eval: {code[:50]}...' if len(code) > 50 else f'Eval: {code}')
-    for ws in connected_clients:
-        try:
-            ws.send(message)
-        except:
-            pass
+    clients.broadcast(message)
     return jsonify(get_state_dict())
 
 @app.route('/api/client/refresh', methods=['POST'])
 def api_client_refresh():
     message = json.dumps({'type': 'remote_refresh'})
     log('remote', 'Refresh all clients')
-    for ws in connected_clients:
-        try:
-            ws.send(message)
-        except:
-            pass
+    clients.broadcast(message)
     return jsonify({'status': 'ok'})
 
-# testbed/metering/history/persistence - export API
+# testbed/metering/history/export - streamed as the response body, nothing is written on the server
 @app.route('/api/meter/export')
 def api_meter_export():
     meter = request.args.get('meter', 'spectrum')
     start = float(request.args.get('start', 0))
-    end = float(request.args.get('end', 60))
-    filepath = request.args.get('file', 'meter_export.csv')
-
-    success = export_meter_csv(meter, start, end, filepath)
-    if success:
-        return jsonify({'status': 'ok', 'file': filepath})
-    else:
+    end = float(request.args.get('end', state.duration))
+    export_format = request.args.get('format', 'csv')
+
+    try:
+        result = export.export_history(meter, start, end, export_format)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    if result is None:
         return jsonify({'status': 'error', 'message': 'No data in range'}), 404
+    chunks, buckets = result
+    log('meter', f'Exporting {buckets} {meter} buckets ({start:g}-{end:g}s) as {export_format}')
+    filename = f'{meter}_{start:g}-{end:g}.{export_format}'
+    return Response(chunks, mimetype=export.EXPORT_FORMATS[export_format],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+# testbed/metering/history/range - aggregated history for a time window
+@app.route('/api/meter/range')
+def api_meter_range():
+    meter = request.args.get('meter', 'spectrum')
+    start = float(request.args.get('start', 0))
+    end = float(request.args.get('end', state.duration))
+    columns = int(request.args.get('columns', 500))
+    stats = request.args.get('stats', 'min,mean,max').split(',')
+
+    result = get_meter_range(meter, start, end, columns, stats)
+    if result is None:
+        return jsonify({'status': 'error', 'message': f'No history for {meter}'}), 404
+    return encode_range_message('json', meter, result), {'Content-Type': 'application/json'}
+
+# testbed/metering/history/analyze - fill history for the whole track offline
+@app.route('/api/meter/analyze', methods=['POST'])
+def api_meter_analyze():
+    meter = request.args.get('meter', 'spectrum')
+    if start_analysis(meter):
+        return jsonify({'status': 'started', 'meter': meter})
+    return jsonify({'status': 'error', 'message': 'Analysis already running'}), 409
 
 if __name__ == '__main__':
     init_logging()
-    load_audio_files()
-    processor.init_processor()  # testbed/processor
-    state.duration = audio_sources['ref'].duration
-    log('audio', f"Loaded ref.wav: {audio_sources['ref'].duration:.1f}s")
-    log('audio', f"Loaded room.wav: {audio_sources['room'].duration:.1f}s")
+    register_all(register_measurement)  # testbed/metering
+    atexit.register(session.save_renders)  # testbed/processor/cache - every room's rendered blocks
     start_position_thread()
-    # testbed/metering
-    register_all(register_measurement)
-    load_history_from_disk()  # testbed/metering/history/persistence
-    start_metering_thread()
-    app.run(debug=True, port=5000, threaded=True)
+    # testbed/startup - audio, history, processor and metering load in the background while the server
+    # already answers; the reloader's watcher process only restarts the server, so it skips them
+    if not DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        startup.start()
+    app.run(debug=DEBUG, port=5000, threaded=True)
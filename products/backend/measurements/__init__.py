@@ -1,6 +1,23 @@
-# testbed/metering/spectrum
+# testbed/metering/spectrum, testbed/metering/spectrum/batched, testbed/metering/frame
 
 from . import spectrum
+from .frame import AnalysisFrame
 
 def register_all(register_fn):
     register_fn('spectrum', spectrum)
+
+def measure_frame(module, frame):
+    """Measure every chunk of an AnalysisFrame, through the most shared entry point the module has
+
+    measure_frame(frame) reads the frame's cached analysis; measure_batch(chunks, sample_rate) and
+    measure(chunk, sample_rate) get the raw chunks. Returns one result per chunk.
+    """
+    if hasattr(module, 'measure_frame'):
+        return module.measure_frame(frame).tolist()
+    if hasattr(module, 'measure_batch'):
+        return module.measure_batch(frame.chunks, frame.sample_rate).tolist()
+    return [module.measure(chunk, frame.sample_rate) for chunk in frame.chunks]
+
+def measure_batch(module, chunks, sample_rate):
+    """Measure a stack of chunks with one call if the module supports it; returns one result per chunk"""
+    return measure_frame(module, AnalysisFrame(chunks, sample_rate))
@@ -0,0 +1,63 @@
+# testbed/metering/frame, testbed/memory
+
+from functools import cached_property, lru_cache
+import numpy as np
+import scipy.fft
+
+@lru_cache(maxsize=8)
+def hann(chunk_size):
+    """Hann window for one chunk size, built once and shared (float32, so windowing keeps single precision)"""
+    window = np.hanning(chunk_size).astype(np.float32)
+    window.setflags(write=False)
+    return window
+
+class AnalysisFrame:
+    """A stack of chunks at one position, with the analysis every meter shares
+
+    Each property is computed on first access and then reused, so the meters of one tick
+    share a single downmix, window and FFT. Rows are chunks (e.g. ref, room, processed).
+    Float32 chunks stay float32 (complex64 spectra) throughout.
+    """
+
+    def __init__(self, chunks, sample_rate):
+        self.chunks = np.asarray(chunks)   # (num_chunks, chunk_size) mono or (num_chunks, chunk_size, channels)
+        self.sample_rate = sample_rate
+
+    @property
+    def chunk_size(self):
+        return self.chunks.shape[1]
+
+    def __len__(self):
+        return len(self.chunks)
+
+    @cached_property
+    def mono(self):
+        """(num_chunks, chunk_size) stereo averaged to mono"""
+        return self.chunks.mean(axis=-1) if self.chunks.ndim > 2 else self.chunks
+
+    @cached_property
+    def windowed(self):
+        return self.mono * hann(self.chunk_size)
+
+    @cached_property
+    def spectrum(self):
+        """Complex rfft of the windowed chunks (scipy's keeps single precision; numpy's is always double)"""
+        return scipy.fft.rfft(self.windowed, axis=-1)
+
+    @cached_property
+    def magnitude(self):
+        """|spectrum| normalized by chunk size"""
+        return np.abs(self.spectrum) / self.chunk_size
+
+    @cached_property
+    def power(self):
+        return self.magnitude ** 2
+
+    @cached_property
+    def rms(self):
+        """(num_chunks,) RMS level of the unwindowed mono chunks"""
+        return np.sqrt(np.mean(np.square(self.mono), axis=-1, dtype=np.float64))  # accumulated in double
+
+    @cached_property
+    def freqs(self):
+        return np.fft.rfftfreq(self.chunk_size, 1 / self.sample_rate)
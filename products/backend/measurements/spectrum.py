@@ -1,51 +1,56 @@
-# testbed/metering/spectrum
+# testbed/metering/spectrum, testbed/metering/spectrum/batched, testbed/metering/frame, testbed/memory
 
+from functools import lru_cache
 import numpy as np
+from .frame import AnalysisFrame
 
 NUM_BANDS = 32
 MIN_FREQ = 20
 MAX_FREQ = 20000
 
-def measure(audio_chunk, sample_rate):
-    """Compute logarithmic frequency band magnitudes"""
-    # convert stereo to mono
-    if audio_chunk.ndim > 1:
-        audio_chunk = audio_chunk.mean(axis=1)
-
-    # apply Hann window
-    window = np.hanning(len(audio_chunk))
-    windowed = audio_chunk * window
+@lru_cache(maxsize=8)
+def analysis_setup(chunk_size, sample_rate):
+    """Band-averaging matrix for one (chunk size, sample rate), built once"""
 
-    # compute FFT and normalize by chunk size
-    fft = np.fft.rfft(windowed)
-    magnitudes = np.abs(fft) / len(audio_chunk)
-
-    # frequency bins
-    freqs = np.fft.rfftfreq(len(audio_chunk), 1/sample_rate)
-
-    # create logarithmic band edges
+    # frequency bins and logarithmic band edges
+    freqs = np.fft.rfftfreq(chunk_size, 1/sample_rate)
     band_edges = np.logspace(np.log10(MIN_FREQ), np.log10(MAX_FREQ), NUM_BANDS + 1)
 
-    # compute energy in each band
-    bands = []
+    # matrix[bin, band] averages the magnitudes of the bins in each band
+    matrix = np.zeros((len(freqs), NUM_BANDS), dtype=np.float32)
     for i in range(NUM_BANDS):
-        low = band_edges[i]
-        high = band_edges[i + 1]
-        mask = (freqs >= low) & (freqs < high)
+        mask = (freqs >= band_edges[i]) & (freqs < band_edges[i + 1])
         if mask.any():
-            band_energy = magnitudes[mask].mean()
-        else:
-            band_energy = 1e-10  # no data in this band
-        bands.append(band_energy)
+            matrix[mask, i] = 1.0 / mask.sum()
+    empty = ~matrix.any(axis=0)  # bands with no bins
+
+    # shared between callers, so make sure nobody modifies them
+    for array in (matrix, empty):
+        array.setflags(write=False)
+    return matrix, empty
 
-    # convert to dB
-    bands = np.array(bands)
+def measure_frame(frame):
+    """Logarithmic band magnitudes in dB for every chunk of an AnalysisFrame
+
+    returns: (num_chunks, NUM_BANDS) array
+    """
+    matrix, empty = analysis_setup(frame.chunk_size, frame.sample_rate)
+
+    # energy in every band of every chunk in one matrix multiply, from the frame's shared FFT
+    bands = frame.magnitude @ matrix
+    bands[..., empty] = 1e-10  # no data in this band
+
+    # convert to dB, normalize to reasonable range (clip to -80 to 0 dB)
     bands_db = 20 * np.log10(bands + 1e-10)
+    return np.clip(bands_db, -80, 0)
 
-    # normalize to reasonable range (clip to -80 to 0 dB)
-    bands_db = np.clip(bands_db, -80, 0)
+def measure_batch(chunks, sample_rate):
+    """measure_frame for a stack of chunks: (num_chunks, chunk_size) mono or (num_chunks, chunk_size, channels)"""
+    return measure_frame(AnalysisFrame(chunks, sample_rate))
 
-    return bands_db.tolist()
+def measure(audio_chunk, sample_rate):
+    """Compute logarithmic frequency band magnitudes"""
+    return measure_batch(audio_chunk[np.newaxis], sample_rate)[0].tolist()
 
 def compare(ref_bands, room_bands):
     """Compute mean absolute difference between spectra"""
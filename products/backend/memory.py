@@ -0,0 +1,88 @@
+# testbed/memory
+#
+# Bytes the backend holds, per audio source, buffer and meter history. Heap is memory the process
+# allocated itself; mapped is file-backed (wav files, cached renders and spectra, history columns),
+# paged in by the OS as it is read and dropped again under pressure, so it costs far less.
+
+import numpy as np
+from audio import audio_sources
+import clients
+import meters
+import playback
+import processor
+import session
+
+def array_bytes(array):
+    """(heap, mapped) bytes of an array; a memory map is file-backed"""
+    if array is None:
+        return 0, 0
+    if isinstance(array, np.memmap):
+        return 0, array.nbytes
+    return array.nbytes, 0
+
+def entry(heap, mapped, array=None):
+    described = {'heap': int(heap), 'mapped': int(mapped)}
+    if array is not None:
+        described.update(dtype=str(array.dtype), shape=list(array.shape))
+    return described
+
+def source_entry(source):
+    """The samples behind a source; the views over them (SampleView, AlignedView) hold none themselves"""
+    data = source.data
+    raw = getattr(data, 'raw', data)
+    return entry(*array_bytes(raw), raw)
+
+def render_bytes(render):
+    """(heap, mapped) bytes of a render's buffer; a cache mapping is file-backed apart from the blocks rendered since"""
+    buffer = render.buffer
+    if isinstance(buffer, np.memmap):
+        unsaved = max(0, int(render.valid.sum()) - render.saved_blocks)
+        return buffer.nbytes * unsaved // len(render.valid) + render.valid.nbytes, buffer.nbytes
+    return session.buffer_bytes(render) + render.valid.nbytes, 0
+
+def room_entry(room):
+    """A loaded room that isn't active: its samples, and its render with IR and convolver if it has one"""
+    heap, mapped = array_bytes(getattr(room.audio.data, 'raw', None))
+    render = room.render
+    if render is not None:
+        render_heap, render_mapped = render_bytes(render)
+        heap += render_heap + render.ir.nbytes + render.convolver.partitions.nbytes + render.convolver.delay_line.nbytes
+        mapped += render_mapped
+    return entry(heap, mapped)
+
+def store_entry(store):
+    """A meter's history: columns on disk, and the min/mean/max pyramid in memory"""
+    with store.lock:
+        mapped = sum(column.nbytes for column in store.values.values()) + store.stamps.nbytes
+        heap = sum(level.sum.nbytes + level.count.nbytes + level.min.nbytes + level.max.nbytes
+                   for levels in store.pyramid.values() for level in levels)
+        return entry(heap, mapped) | {'dtype': store.dtype.name, 'buckets': store.count}
+
+def memory_report():
+    """{sources, buffers, rooms, history, total}, each entry {heap, mapped} in bytes"""
+    sources = {name: source_entry(source) for name, source in list(audio_sources.items()) if name != 'processed'}
+
+    buffers = {}
+    render = processor.current_render()
+    if render is not None:
+        # processed is its render buffer
+        conv = render.convolver
+        sources['processed'] = entry(*render_bytes(render), render.buffer)
+        buffers['impulse_response'] = entry(render.ir.nbytes, 0, render.ir)
+        buffers['convolver'] = entry(conv.partitions.nbytes + conv.delay_line.nbytes, 0, conv.partitions)
+    spectra = [array_bytes(array) for pair in list(processor.spectra_memo.values()) for array in pair]
+    buffers['training_spectra'] = entry(sum(heap for heap, _ in spectra), sum(mapped for _, mapped in spectra))
+    ring = playback.ring
+    if ring is not None:
+        buffers['playback_ring'] = entry(ring.data.nbytes, 0, ring.data)
+    buffers['client_queues'] = entry(sum(stats['queued_bytes'] for stats in clients.client_stats()), 0)
+
+    # loaded rooms other than the active one (whose audio and render are counted above)
+    rooms = {name: room_entry(room) for name, room in list(session.rooms.items())
+             if name != session.active_room and room.audio is not None}
+
+    history = {name: store_entry(store) for name, store in list(meters.meter_history.items())}
+
+    entries = [*sources.values(), *buffers.values(), *rooms.values(), *history.values()]
+    total = {'heap': sum(e['heap'] for e in entries), 'mapped': sum(e['mapped'] for e in entries)}
+    return {'sources': sources, 'buffers': buffers, 'rooms': rooms, 'history': history, 'total': total}
@@ -1,15 +1,20 @@
-# testbed/metering, testbed/processor
+# testbed/metering, testbed/processor, testbed/metering/history/analyze, testbed/metering/history/columnar, testbed/metering/fan-out, testbed/metering/binary-frames, testbed/metering/history/range, testbed/metering/frame, testbed/load-audio/session, testbed/remote-control/send-queue, testbed/startup
 
 import threading
 import time
 import json
+import math
 import numpy as np
 from pathlib import Path
 from audio import audio_sources
-from state import state, connected_clients
+from state import state
 import playback
 import processor
 from logger import log
+from measurements import AnalysisFrame, measure_frame
+import history
+import framing
+import clients
 
 # measurement registry
 measurements = {}
@@ -17,45 +22,71 @@ measurements = {}
 # active subscriptions per client (ws -> set of measurement names)
 client_subscriptions = {}
 
-# testbed/metering/history/persistence - server-side history storage
-meter_history = {}  # meter_history[meter_name][source][time_bucket] = data
+# testbed/metering/binary-frames - meter message format per client (ws -> 'json' | 'f32' | 'u8')
+client_formats = {}
+
+# testbed/metering/history/persistence, testbed/metering/history/columnar - server-side history storage
+meter_history = {}  # meter_history[meter_name] = MeterStore (bucket index x band arrays per source)
 TIME_BUCKET_SIZE = 0.1  # 100ms buckets, must match frontend
-HISTORY_FILE = Path('meter_history.json')
+HISTORY_FILE = Path('meter_history.json')  # old JSON format, imported once if no store exists
+HISTORY_MAX_DURATION = None  # seconds of most recently written history kept per meter (None = keep all)
+history_dir = history.HISTORY_DIR  # testbed/load-audio/session - the active room's stores
+
+def max_history_buckets():
+    return None if HISTORY_MAX_DURATION is None else int(HISTORY_MAX_DURATION / TIME_BUCKET_SIZE)
+
+def track_buckets():
+    """Number of buckets covering the whole track (initial store capacity)"""
+    if 'ref' in audio_sources:
+        return bucket_index(audio_sources['ref'].duration) + 1
+    return history.INITIAL_CAPACITY
 
 def save_history_to_disk():
-    """Save meter history to disk"""
-    # Convert float keys to strings for JSON
-    serializable = {}
-    for meter_name, sources in meter_history.items():
-        serializable[meter_name] = {}
-        for source, buckets in sources.items():
-            serializable[meter_name][source] = {str(k): v for k, v in buckets.items()}
-
-    with open(HISTORY_FILE, 'w') as f:
-        json.dump(serializable, f)
-    log('meter', f'Saved history to {HISTORY_FILE}')
+    """Flush meter history to disk (only pages changed since the last flush are written)"""
+    for store in list(meter_history.values()):
+        store.flush()
 
 def load_history_from_disk():
-    """Load meter history from disk"""
-    global meter_history
-    if HISTORY_FILE.exists():
-        with open(HISTORY_FILE, 'r') as f:
-            data = json.load(f)
-        # Convert string keys back to floats
-        for meter_name, sources in data.items():
-            meter_history[meter_name] = {}
-            for source, buckets in sources.items():
-                meter_history[meter_name][source] = {float(k): v for k, v in buckets.items()}
-        log('meter', f'Loaded {sum(len(s.get("ref", {})) for s in meter_history.values())} history buckets from {HISTORY_FILE}')
+    """Open the history stores on disk (memory-mapped, so nothing is parsed)"""
+    meter_history.update(history.open_stores(history_dir, max_buckets=max_history_buckets()))
+    if not meter_history and history_dir == history.HISTORY_DIR and HISTORY_FILE.exists():
+        meter_history.update(history.import_json_history(
+            HISTORY_FILE, TIME_BUCKET_SIZE, track_buckets(), max_buckets=max_history_buckets()))
+    log('meter', f'Loaded {sum(s.num_buckets() for s in meter_history.values())} history buckets from {history_dir}')
+
+# testbed/load-audio/session - every room has its own history
+def set_history_dir(directory):
+    """Flush and close the current stores, then open the ones in directory"""
+    global history_dir
+    with _store_lock:
+        save_history_to_disk()
+        meter_history.clear()
+        history_dir = directory
+        load_history_from_disk()
 
 CHUNK_SIZE = 8192  # samples for measurement (gives ~5.4Hz resolution at 44.1kHz)
 METER_RATE = 20    # Hz
 
 def time_bucket(t):
     """Floor time to bucket boundary (must match frontend)"""
-    import math
     return math.floor(t / TIME_BUCKET_SIZE) * TIME_BUCKET_SIZE
 
+def bucket_index(t):
+    """Index of the bucket containing time t; its time is index * TIME_BUCKET_SIZE"""
+    return math.floor(t / TIME_BUCKET_SIZE)
+
+_store_lock = threading.Lock()
+tick_lock = threading.Lock()  # testbed/load-audio/session - held for a whole tick, so a room switch falls between ticks
+
+def get_store(meter_name, num_bands):
+    """History store for a meter, created on first write"""
+    with _store_lock:
+        if meter_name not in meter_history:
+            meter_history[meter_name] = history.MeterStore(
+                history_dir / meter_name, num_bands,
+                capacity=track_buckets(), max_buckets=max_history_buckets())
+        return meter_history[meter_name]
+
 _save_counter = 0
 _SAVE_INTERVAL = 100  # save every N buckets
 
@@ -63,62 +94,27 @@ def store_meter_data(meter_name, t, ref_data, room_data, processed_data=None):
     """Store meter data in server-side history"""
     global _save_counter
 
-    if meter_name not in meter_history:
-        meter_history[meter_name] = {'ref': {}, 'room': {}, 'processed': {}}
-
-    bucket = time_bucket(t)
-    meter_history[meter_name]['ref'][bucket] = ref_data
-    meter_history[meter_name]['room'][bucket] = room_data
+    rows = {'ref': [ref_data], 'room': [room_data]}
     if processed_data is not None:
-        meter_history[meter_name]['processed'][bucket] = processed_data
+        rows['processed'] = [processed_data]
+    get_store(meter_name, len(ref_data)).write([bucket_index(t)], rows)
 
-    # Periodically save to disk
+    # Periodically flush to disk
     _save_counter += 1
     if _save_counter >= _SAVE_INTERVAL:
         _save_counter = 0
         save_history_to_disk()
 
 def get_meter_history(meter_name):
-    """Get stored history for a meter"""
-    if meter_name in meter_history:
-        return meter_history[meter_name]
-    return {'ref': {}, 'room': {}, 'processed': {}}
-
-def export_meter_csv(meter_name, start_time, end_time, filepath):
-    """Export meter history to CSV with alternating ref/room rows"""
-    history = get_meter_history(meter_name)
-    if not history['ref']:
-        return False
-
-    # Get sorted time buckets in range
-    times = sorted([t for t in history['ref'].keys() if start_time <= t <= end_time])
-
-    if not times:
-        return False
-
-    # Figure out number of bands from first entry
-    num_bands = len(history['ref'][times[0]])
-
-    with open(filepath, 'w') as f:
-        # Header row
-        header = ['time', 'source'] + [f'band_{i}' for i in range(num_bands)]
-        f.write(','.join(header) + '\n')
-
-        # Data rows - alternating ref/room for each time bucket
-        for t in times:
-            ref_data = history['ref'].get(t, [0] * num_bands)
-            room_data = history['room'].get(t, [0] * num_bands)
-
-            # Ref row
-            ref_row = [f'{t:.1f}', 'ref'] + [f'{v:.2f}' for v in ref_data]
-            f.write(','.join(ref_row) + '\n')
-
-            # Room row
-            room_row = [f'{t:.1f}', 'room'] + [f'{v:.2f}' for v in room_data]
-            f.write(','.join(room_row) + '\n')
-
-    log('meter', f'Exported {len(times)} buckets to {filepath}')
-    return True
+    """Get stored history for a meter as {source: {bucket_time: bands}}"""
+    result = {source: {} for source in history.SOURCES}
+    store = meter_history.get(meter_name)
+    if store is None:
+        return result
+    for source in history.SOURCES:
+        indices, rows = store.read(source)
+        result[source] = dict(zip((indices * TIME_BUCKET_SIZE).tolist(), rows.tolist()))
+    return result
 
 def register_measurement(name, module):
     """Register a measurement module with the framework"""
@@ -143,51 +139,154 @@ def get_chunk_at_position(audio_data, position, chunk_size):
 def metering_loop():
     """Background thread that computes and broadcasts measurements"""
     while True:
-        if state.playing and client_subscriptions:
-            sample_rate = audio_sources['ref'].sample_rate
+        with tick_lock:
+            metering_tick()
+        time.sleep(1.0 / METER_RATE)
+
+def metering_tick():
+    """Measure every subscribed meter at the playhead, store the readings and send them"""
+    if state.playing and client_subscriptions:
+        sample_rate = audio_sources['ref'].sample_rate
 
-            with playback.playback_lock:
-                pos = playback.playback_position
+        with playback.playback_lock:
+            pos = playback.playback_position
 
-            # get chunks from all sources at same position
-            ref_chunk = get_chunk_at_position(audio_sources['ref'].data, pos, CHUNK_SIZE)
-            room_chunk = get_chunk_at_position(audio_sources['room'].data, pos, CHUNK_SIZE)
+        # get mono chunks from all sources at same position, stacked for batched measurement
+        ref_chunk = get_chunk_at_position(audio_sources['ref'].mono, pos, CHUNK_SIZE)
+        room_chunk = get_chunk_at_position(audio_sources['room'].mono, pos, CHUNK_SIZE)
 
-            # testbed/processor - ensure processed data exists and get chunk
+        # testbed/processor - ensure processed data exists and get chunk
+        # (testbed/startup - processed joins once the processor stage is ready)
+        chunks = [ref_chunk, room_chunk]
+        if 'processed' in audio_sources:
             processor.process_chunk(pos - CHUNK_SIZE // 2, pos + CHUNK_SIZE // 2)
-            processed_chunk = get_chunk_at_position(audio_sources['processed'].data, pos, CHUNK_SIZE)
-
-            # compute measurements for subscribed clients
-            for ws, subscribed in list(client_subscriptions.items()):
-                for name in subscribed:
-                    if name in measurements:
-                        module = measurements[name]
-                        try:
-                            ref_data = module.measure(ref_chunk, sample_rate)
-                            room_data = module.measure(room_chunk, sample_rate)
-                            processed_data = module.measure(processed_chunk, sample_rate)
-                            diff = module.compare(ref_data, room_data)
-
-                            meter_time = pos / sample_rate
-
-                            # testbed/metering/history/persistence - store on server
-                            store_meter_data(name, meter_time, ref_data, room_data, processed_data)
-
-                            # testbed/metering/history - add time to message
-                            message = json.dumps({
-                                'type': 'meter',
-                                'name': name,
-                                'time': meter_time,
-                                'ref': ref_data,
-                                'room': room_data,
-                                'processed': processed_data,
-                                'diff': diff
-                            })
-                            ws.send(message)
-                        except Exception as e:
-                            log('meter', f'Error computing {name}: {e}')
+            chunks.append(get_chunk_at_position(audio_sources['processed'].mono, pos, CHUNK_SIZE))
+
+        # testbed/metering/frame - one FFT per tick, shared by every meter that reads it
+        frame = AnalysisFrame(np.stack(chunks), sample_rate)
+
+        # testbed/metering/fan-out - group clients by meter so each meter is measured once per tick
+        subscribers = {}
+        for ws, subscribed in list(client_subscriptions.items()):
+            for name in list(subscribed):
+                subscribers.setdefault(name, []).append(ws)
+
+        meter_time = pos / sample_rate
+
+        for name, watchers in subscribers.items():
+            if name not in measurements:
+                continue
+            module = measurements[name]
+            try:
+                # testbed/metering/spectrum/batched - all three sources in one call
+                ref_data, room_data, *processed = measure_frame(module, frame)
+                processed_data = processed[0] if processed else None
+                diff = module.compare(ref_data, room_data)
+
+                # testbed/metering/history/persistence - store on server
+                store_meter_data(name, meter_time, ref_data, room_data, processed_data)
+            except Exception as e:
+                log('meter', f'Error computing {name}: {e}')
+                continue
+
+            # serialize once per format in use, then queue the same message for every subscriber
+            results = {'ref': ref_data, 'room': room_data}
+            if processed_data is not None:
+                results['processed'] = processed_data
+            messages = {}
+            for ws in watchers:
+                fmt = client_formats.get(ws, 'json')
+                try:
+                    if fmt not in messages:
+                        messages[fmt] = encode_meter_message(fmt, name, meter_time, results, diff)
+                except Exception as e:
+                    log('meter', f'Error encoding {name}: {e}')
+                    continue
+                # testbed/remote-control/send-queue - a client still holding an older frame of this meter gets this one instead
+                clients.send(ws, messages[fmt], coalesce=f'meter:{name}')
+
+# testbed/metering/history/analyze - offline whole-track metering
+ANALYZE_BATCH = 256  # frames measured per vectorized batch
+analyzing = set()    # meters with an analysis in progress
+
+def analyze_track(meter_name):
+    """Measure the whole track for ref, room and processed, writing straight into history"""
+    module = measurements.get(meter_name)
+    if module is None:
+        log('meter', f'Cannot analyze {meter_name}: not registered')
+        return False
 
-        time.sleep(1.0 / METER_RATE)
+    start_time = time.time()
+    ref = audio_sources['ref']
+    sample_rate = ref.sample_rate
+    directory = history_dir  # testbed/load-audio/session - stop if the room changes underneath
+
+    # one frame per history bucket, positioned exactly as metering_loop would take it
+    num_buckets = int(np.ceil(len(ref.data) / (TIME_BUCKET_SIZE * sample_rate)))
+    positions = np.round(np.arange(num_buckets) * TIME_BUCKET_SIZE * sample_rate).astype(int)
+    starts = np.maximum(0, positions - CHUNK_SIZE // 2)
+
+    for source in ['ref', 'room', 'processed']:
+        if source not in audio_sources:
+            log('meter', f'Analyzing {meter_name} without {source}: not ready yet')  # testbed/startup
+            continue
+        mono = audio_sources[source].mono
+
+        for first in range(0, num_buckets, ANALYZE_BATCH):
+            batch_starts = starts[first:first + ANALYZE_BATCH]
+            seg_start = batch_starts[0]
+            seg_end = batch_starts[-1] + CHUNK_SIZE
+
+            # testbed/processor - render the processed blocks this batch reads
+            if source == 'processed':
+                processor.process_chunk(seg_start, seg_end)
+
+            # read the batch's span once; frames are strided views into it (zero-padded past the end)
+            segment = np.zeros(seg_end - seg_start, dtype=np.float32)
+            available = max(0, min(len(mono), seg_end) - seg_start)
+            segment[:available] = mono[seg_start:seg_start + available]
+            frames = np.lib.stride_tricks.sliding_window_view(segment, CHUNK_SIZE)[batch_starts - seg_start]
+
+            # testbed/metering/history/columnar - write the whole batch as one slice
+            results = measure_frame(module, AnalysisFrame(frames, sample_rate))
+            if history_dir != directory:
+                log('meter', f'Stopped analyzing {meter_name}: the room changed')
+                return False
+            store = get_store(meter_name, len(results[0]))
+            store.write(np.arange(first, first + len(results)), {source: results})
+
+    save_history_to_disk()
+    log('meter', f'Analyzed {num_buckets} buckets of {meter_name} in {time.time() - start_time:.1f}s')
+    return True
+
+def start_analysis(meter_name):
+    """Run analyze_track in the background, then tell subscribers the history changed"""
+    if meter_name in analyzing:
+        return False
+    analyzing.add(meter_name)
+
+    def run():
+        try:
+            if analyze_track(meter_name):
+                # testbed/metering/history/range - subscribers re-query whatever they are viewing
+                message = json.dumps({'type': 'meter_history_changed', 'name': meter_name})
+                for ws, subscribed in list(client_subscriptions.items()):
+                    if meter_name in subscribed:
+                        clients.send(ws, message)
+        except Exception as e:
+            log('meter', f'Error analyzing {meter_name}: {e}')
+        finally:
+            analyzing.discard(meter_name)
+
+    threading.Thread(target=run, daemon=True).start()
+    return True
+
+def encode_meter_message(fmt, name, meter_time, results, diff):
+    """Live meter message as JSON text or a binary frame"""
+    if fmt == 'json':
+        # testbed/metering/history - add time to message
+        return json.dumps({'type': 'meter', 'name': name, 'time': meter_time, **results, 'diff': diff})
+    return framing.encode_meter_frame(name, meter_time, diff, results, fmt)
 
 def start_metering_thread():
     thread = threading.Thread(target=metering_loop, daemon=True)
@@ -199,19 +298,47 @@ def subscribe(ws, name):
     client_subscriptions[ws].add(name)
     log('meter', f'Subscribed to: {name}')
 
-    # testbed/metering/history/persistence - send existing history to new subscriber
-    history = get_meter_history(name)
-    history_size = len(history['ref'])
-    if history_size > 0:
-        message = json.dumps({
-            'type': 'meter_history',
-            'name': name,
-            'ref': history['ref'],
-            'room': history['room'],
-            'processed': history['processed']
-        })
-        ws.send(message)
-        log('meter', f'Sent {history_size} history buckets for {name}')
+# testbed/metering/history/range - aggregated history for a time window
+def get_meter_range(meter_name, start_time, end_time, columns, stats=None):
+    """Stored history in [start_time, end_time) as about `columns` min/mean/max columns per source"""
+    store = meter_history.get(meter_name)
+    if store is None:
+        return None
+    stats = [s for s in (stats or history.STATS) if s in history.STATS]
+    first = bucket_index(start_time)
+    last = bucket_index(end_time) + 1
+    result = {'start': start_time, 'end': end_time, 'span': 1, 'num_bands': store.num_bands, 'stats': stats, 'sources': {}}
+    for source in history.SOURCES:
+        indices, span, rows = store.read_range(source, first, last, columns)
+        result['span'] = span
+        result['sources'][source] = (indices, {stat: rows[stat] for stat in stats})
+    return result
+
+def encode_range_message(fmt, name, result):
+    """Range query result as JSON text or a binary frame"""
+    stats = result['stats']
+    if fmt == 'json':
+        message = {'type': 'meter_range', 'name': name, 'start': result['start'], 'end': result['end'], 'span': result['span']}
+        for source, (indices, rows) in result['sources'].items():
+            message[source] = {'indices': indices.tolist(), **{stat: rows[stat].tolist() for stat in stats}}
+        return json.dumps(message)
+    return framing.encode_range_frame(name, result['num_bands'], result['start'], result['end'],
+                                      result['span'], result['sources'], stats, fmt)
+
+def send_range(ws, name, start_time, end_time, columns, stats=None):
+    """Answer a client's range query in its meter format"""
+    result = get_meter_range(name, start_time, end_time, columns, stats)
+    if result is None:
+        # nothing stored for this meter yet; answer anyway so the client isn't left waiting
+        clients.send(ws, json.dumps({'type': 'meter_range', 'name': name, 'start': start_time, 'end': end_time, 'span': 1}))
+        return
+    clients.send(ws, encode_range_message(client_formats.get(ws, 'json'), name, result))
+
+def set_meter_format(ws, fmt):
+    """Choose how meter messages are sent to a client"""
+    if fmt in framing.FORMATS:
+        client_formats[ws] = fmt
+        log('meter', f'Meter format: {fmt}')
 
 def unsubscribe(ws, name):
     if ws in client_subscriptions:
@@ -221,3 +348,4 @@ def unsubscribe(ws, name):
 def client_disconnected(ws):
     if ws in client_subscriptions:
         del client_subscriptions[ws]
+    client_formats.pop(ws, None)
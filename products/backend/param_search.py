@@ -0,0 +1,175 @@
+# testbed/processor/param-search
+#
+# Evaluate many IR parameter sets in parallel and rank them by how close the processed audio's
+# spectrum gets to room.wav. Run from the backend directory (next to ref.wav and room.wav):
+#
+#   python param_search.py --training 30,60,90 --ir-length 0.25,0.5,1.0 --regularization 1e-10,1e-9,1e-8
+
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from audio import audio_sources, load_audio_files
+from measurements import spectrum
+import processor
+import cache
+
+SCORE_CHUNK_SIZE = 8192  # samples per spectrum frame, same as live metering
+
+# per-worker state, set up once by init_worker
+room_bands = None        # (windows, frames, bands) room spectra, shared by every candidate
+window_blocks = None     # (first block, last block) of each scoring window
+
+def scoring_windows(num_samples, sample_rate, num_windows, window_seconds):
+    """Block ranges of windows spread evenly across the track (like level matching)"""
+    B = processor.BLOCK_SIZE
+    num_blocks = -(-num_samples // B)
+    length = max(1, int(window_seconds * sample_rate) // B)
+    firsts = np.unique(np.linspace(0, max(0, num_blocks - length), num_windows).astype(int))
+    return [(int(first), int(min(num_blocks, first + length)) - 1) for first in firsts]
+
+def frames(signal):
+    """Consecutive non-overlapping spectrum frames of a window"""
+    count = len(signal) // SCORE_CHUNK_SIZE
+    return signal[:count * SCORE_CHUNK_SIZE].reshape(count, SCORE_CHUNK_SIZE)
+
+def window_bands(mono, windows, sample_rate):
+    """Spectrum of every frame of every scoring window of a mono source"""
+    B = processor.BLOCK_SIZE
+    return [spectrum.measure_batch(frames(mono[first * B:(last + 1) * B]), sample_rate) for first, last in windows]
+
+def mean_difference(bands_a, bands_b):
+    """spectrum.compare averaged over every frame of every window"""
+    return float(np.mean([spectrum.compare(a, b)
+                          for window_a, window_b in zip(bands_a, bands_b)
+                          for a, b in zip(window_a, window_b)]))
+
+def init_worker(windows, bands):
+    """Runs once in each pool process: map the audio and take the shared room spectra"""
+    global room_bands, window_blocks
+    load_audio_files()
+    window_blocks = windows
+    room_bands = bands
+
+def render_windows(ir):
+    """Convolve ref with an IR over each scoring window; returns the windows and the level-match gain"""
+    ref, room = audio_sources['ref'], audio_sources['room']
+    B = processor.BLOCK_SIZE
+    conv = processor.PartitionedConvolver(ir, B, lambda start, end: ref.data[start:end], len(ref.data))
+
+    outputs = []
+    conv_energy = 0.0
+    room_energy = 0.0
+    for first, last in window_blocks:
+        out = conv.process_blocks(first, last)
+        outputs.append(out)
+        conv_energy += float(np.sum(out.astype(np.float64) ** 2))
+        room_energy += float(np.sum(np.asarray(room.data[first * B:(last + 1) * B], dtype=np.float64) ** 2))
+
+    gain = np.sqrt(room_energy / conv_energy) if conv_energy > 0 else 1.0
+    return outputs, gain
+
+def evaluate(candidate):
+    """Extract the candidate's IR from the shared spectra and score it (runs in a worker)"""
+    ref, room = audio_sources['ref'], audio_sources['room']
+    sample_rate = ref.sample_rate
+
+    # mapped from the cache entry the main process wrote, once per worker
+    cross_spectrum, ref_power = processor.load_training_spectra(
+        ref, room, candidate['training_duration'], candidate['ir_max_length'])
+
+    ir = processor.deconvolve(cross_spectrum, ref_power, int(candidate['ir_max_length'] * sample_rate),
+                              candidate['regularization'])
+    outputs, gain = render_windows(ir)
+
+    # scored on the mono downmix, like room's bands
+    processed_bands = [spectrum.measure_batch(frames(out.mean(axis=1) * gain), sample_rate) for out in outputs]
+    score = mean_difference(room_bands, processed_bands)
+    return {**candidate, 'gain': float(gain), 'score': score, 'ir': ir}
+
+def parse_values(text):
+    return [float(v) for v in text.split(',')]
+
+def main():
+    parser = argparse.ArgumentParser(description='Rank IR processor parameter sets by spectrum match to room.wav')
+    parser.add_argument('--training', type=parse_values, default=[processor.TRAINING_DURATION],
+                        help='training durations in seconds (0 = whole track), comma separated')
+    parser.add_argument('--ir-length', type=parse_values, default=[processor.IR_MAX_LENGTH],
+                        help='IR lengths in seconds, comma separated')
+    parser.add_argument('--regularization', type=parse_values, default=[processor.REGULARIZATION],
+                        help='Wiener regularization values, comma separated')
+    parser.add_argument('--windows', type=int, default=processor.LEVEL_MATCH_WINDOWS,
+                        help='scoring windows spread across the track')
+    parser.add_argument('--window-seconds', type=float, default=processor.LEVEL_MATCH_SECONDS,
+                        help='length of each scoring window')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('--top', type=int, default=20, help='rows of the ranked table to print')
+    parser.add_argument('--table', default='param_search.csv', help='write the full ranked table here')
+    parser.add_argument('--ir-file', default='best_ir.npy', help='write the best IR here')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    load_audio_files()
+    ref, room = audio_sources['ref'], audio_sources['room']
+    sample_rate = ref.sample_rate
+
+    candidates = [
+        {'training_duration': t, 'ir_max_length': l, 'regularization': r}
+        for t, l, r in itertools.product(args.training, args.ir_length, args.regularization)
+    ]
+
+    # room spectra and the unprocessed baseline are the same for every candidate
+    windows = scoring_windows(len(ref.data), sample_rate, args.windows, args.window_seconds)
+    bands = window_bands(room.mono, windows, sample_rate)
+    baseline = mean_difference(bands, window_bands(ref.mono, windows, sample_rate))
+
+    # one pair of training FFTs per (training duration, FFT size), shared by all candidates that use it
+    groups = set()
+    for candidate in candidates:
+        group = processor.spectra_key(ref, room, candidate['training_duration'], candidate['ir_max_length'])
+        if group not in groups:
+            processor.load_training_spectra(ref, room, candidate['training_duration'], candidate['ir_max_length'])
+            groups.add(group)
+    print(f'{len(candidates)} candidates, {len(groups)} training FFT groups, {len(windows)} scoring windows '
+          f'({time.time() - start_time:.1f}s to prepare)')
+
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(windows, bands)) as pool:
+        futures = [pool.submit(evaluate, c) for c in candidates]
+        for done, future in enumerate(as_completed(futures), 1):
+            results.append(future.result())
+            print(f'\r{done}/{len(candidates)} evaluated', end='', flush=True)
+    print()
+
+    results.sort(key=lambda r: r['score'])
+
+    # ranked table
+    header = f'{"rank":>4}  {"training":>8}  {"ir_length":>9}  {"regularization":>14}  {"gain":>8}  {"score":>7}'
+    print(header)
+    print(f'{"":>4}  {"(ref)":>8}  {"":>9}  {"":>14}  {"":>8}  {baseline:7.3f}')
+    for rank, r in enumerate(results[:args.top], 1):
+        print(f'{rank:>4}  {r["training_duration"]:>8g}  {r["ir_max_length"]:>9g}  {r["regularization"]:>14g}  '
+              f'{r["gain"]:>8.4f}  {r["score"]:7.3f}')
+
+    with open(args.table, 'w') as f:
+        f.write('rank,training_duration,ir_max_length,regularization,gain,score\n')
+        for rank, r in enumerate(results, 1):
+            f.write(f'{rank},{r["training_duration"]},{r["ir_max_length"]},{r["regularization"]},'
+                    f'{r["gain"]:.6f},{r["score"]:.4f}\n')
+
+    # best IR, also cached under the key init_processor will look for with these settings
+    best = results[0]
+    np.save(args.ir_file, best['ir'])
+    processor.TRAINING_DURATION = best['training_duration']
+    processor.IR_MAX_LENGTH = best['ir_max_length']
+    processor.REGULARIZATION = best['regularization']
+    cache.store_array(processor.source_key(ref, room, processor.ir_params()), 'ir', best['ir'])
+
+    print(f'Best: TRAINING_DURATION = {best["training_duration"]:g}, IR_MAX_LENGTH = {best["ir_max_length"]:g}, '
+          f'REGULARIZATION = {best["regularization"]:g} (score {best["score"]:.3f}, ref {baseline:.3f})')
+    print(f'Wrote {args.table} and {args.ir_file} in {time.time() - start_time:.1f}s')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# testbed/transport/perf
+#
+# Real-time accounting for the playback path. Each accumulator has a single writer (the audio
+# callback, or whichever thread feeds it), records with a bisect and a few integer/float updates,
+# and never locks or allocates arrays; readers take a snapshot that may be one call out of date.
+
+from bisect import bisect_right
+from logger import get_log_stats
+
+# histogram bucket edges in seconds: two per octave from 25us to ~200ms
+HISTOGRAM_EDGES = [25e-6 * 2 ** (k / 2) for k in range(27)]
+STATUS_FLAGS = ['output_underflow', 'output_overflow', 'priming_output']
+
+class Timing:
+    """Duration histogram of one timed stage"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(HISTOGRAM_EDGES) + 1)
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect_right(HISTOGRAM_EDGES, seconds)] += 1
+        self.calls += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def summary(self):
+        return {
+            'calls': self.calls,
+            'mean_ms': 1000 * self.total / self.calls if self.calls else 0.0,
+            'max_ms': 1000 * self.max,
+            'histogram': list(self.counts),
+        }
+
+class CallbackTiming(Timing):
+    """Timing of the audio callback, plus deadline headroom and sounddevice status flags"""
+
+    def __init__(self):
+        self.sample_rate = 0
+        self.blocksize = 0
+        super().__init__()
+
+    def reset(self):
+        super().reset()
+        self.deadline_misses = 0
+        self.min_headroom = None
+        self.total_headroom = 0.0
+        self.underruns = 0  # blocks the low-latency ring couldn't fill
+        self.status = dict.fromkeys(STATUS_FLAGS, 0)
+
+    def start_stream(self, sample_rate, blocksize):
+        self.sample_rate = sample_rate
+        self.blocksize = blocksize
+
+    def record_callback(self, seconds, frames, status):
+        self.record(seconds)
+        headroom = frames / self.sample_rate - seconds
+        self.total_headroom += headroom
+        if self.min_headroom is None or headroom < self.min_headroom:
+            self.min_headroom = headroom
+        if headroom < 0:
+            self.deadline_misses += 1
+        if status:
+            for flag in STATUS_FLAGS:
+                if getattr(status, flag, False):
+                    self.status[flag] += 1
+
+    def summary(self):
+        return {
+            **super().summary(),
+            'sample_rate': self.sample_rate,
+            'blocksize': self.blocksize,
+            'deadline_ms': 1000 * self.blocksize / self.sample_rate if self.sample_rate else 0.0,
+            'min_headroom_ms': 1000 * self.min_headroom if self.min_headroom is not None else None,
+            'mean_headroom_ms': 1000 * self.total_headroom / self.calls if self.calls else None,
+            'deadline_misses': self.deadline_misses,
+            'underruns': self.underruns,
+            'status': dict(self.status),
+        }
+
+callback = CallbackTiming()
+process_chunk = Timing()  # processor.process_chunk as called from the playback path
+
+def get_perf():
+    return {
+        'histogram_edges_ms': [1000 * edge for edge in HISTOGRAM_EDGES],
+        'callback': callback.summary(),
+        'process_chunk': process_chunk.summary(),
+        'logging': get_log_stats(),  # testbed/logging/queued
+    }
+
+def reset():
+    callback.reset()
+    process_chunk.reset()
@@ -1,24 +1,55 @@
-# testbed/transport, testbed/source-switch, testbed/processor
+# testbed/transport, testbed/source-switch, testbed/processor, testbed/processor/live-params, testbed/transport/low-latency, testbed/transport/perf, testbed/load-audio/session, testbed/remote-control/send-queue, testbed/startup
 
 import sounddevice as sd
 import numpy as np
+import json
+import queue
 import threading
 import time
+from functools import lru_cache
 from audio import audio_sources
 from state import state, broadcast_state
 from logger import log
+from ringbuffer import RingBuffer
 import processor
+import perf
+import session
+import clients
 
 # playback state
 stream = None
 playback_position = 0  # in samples
 playback_lock = threading.Lock()
+playback_ended = False  # set by the callback at the end of the track, handled by position_update_loop
 
 # crossfade state (source-switch)
 crossfade_samples = 0
 crossfade_from_audio = None
 CROSSFADE_MS = 15  # milliseconds
 
+# testbed/transport/low-latency
+PLAYBACK_MODES = ['stable', 'low-latency']
+STABLE_BLOCKSIZE = 4096
+LOW_LATENCY_BLOCKSIZE = 256
+RING_LEAD_BLOCKS = 16         # callback blocks the producer keeps queued ahead of the callback (~93ms at 44.1kHz)
+PREFILL_TIMEOUT = 0.5         # seconds start_playback waits for the first half of the lead
+
+ring = None
+ring_mark = (0, 0)            # (ring index, track sample) where the producer's latest restart begins
+ring_end = None               # (ring index, track sample) just past the last frame of the track
+ring_requests = queue.SimpleQueue()
+producer_thread = None
+producer_running = False
+
+@lru_cache(maxsize=4)
+def crossfade_ramps(sample_rate):
+    """(fade_in, fade_out) column vectors of CROSSFADE_MS samples, built once per sample rate"""
+    fade_in = np.linspace(0, 1, int(sample_rate * CROSSFADE_MS / 1000), dtype=np.float32)[:, np.newaxis]
+    fade_out = 1 - fade_in
+    for ramp in (fade_in, fade_out):
+        ramp.setflags(write=False)
+    return fade_in, fade_out
+
 def get_current_audio():
     # For processed source, ensure data is processed before returning
     if state.source == 'processed':
@@ -26,7 +57,8 @@ def get_current_audio():
     return audio_sources[state.source].data
 
 def audio_callback(outdata, frames, time_info, status):
-    global playback_position, crossfade_samples, crossfade_from_audio
+    global playback_position, crossfade_samples, crossfade_from_audio, playback_ended
+    callback_start = time.perf_counter()
 
     with playback_lock:
         start = playback_position
@@ -34,7 +66,9 @@ def audio_callback(outdata, frames, time_info, status):
 
     # testbed/processor - ensure processed data is ready before playback
     if state.source == 'processed':
+        render_start = time.perf_counter()
         processor.process_chunk(start, end)
+        perf.process_chunk.record(time.perf_counter() - render_start)
 
     audio = get_current_audio()
 
@@ -52,8 +86,8 @@ def audio_callback(outdata, frames, time_info, status):
                 outdata[:samples_to_copy] = audio[start:end]
             outdata[samples_to_copy:] = 0  # silence for remaining
             playback_position = len(audio)
-            # schedule stop (can't stop from callback)
-            threading.Thread(target=stop_playback).start()
+            # can't stop from the callback; position_update_loop stops playback
+            playback_ended = True
         else:
             if audio.ndim == 1:
                 outdata[:, 0] = audio[start:end]
@@ -70,16 +104,14 @@ def audio_callback(outdata, frames, time_info, status):
                 old_end = min(start + fade_frames, len(crossfade_from_audio))
                 old_samples = crossfade_from_audio[start:old_end]
 
-                # create crossfade ramp
-                t = np.linspace(0, 1, fade_frames)
-                fade_in = t.reshape(-1, 1)
-                fade_out = (1 - t).reshape(-1, 1)
+                # precomputed ramps, from where the fade has got to
+                fade_in, fade_out = crossfade_ramps(audio_sources['ref'].sample_rate)
+                done = len(fade_in) - crossfade_samples
+                fade_in = fade_in[done:done + fade_frames]
+                fade_out = fade_out[done:done + fade_frames]
 
-                # make old samples stereo if needed
-                if crossfade_from_audio.ndim == 1:
-                    old_stereo = np.column_stack([old_samples, old_samples])
-                else:
-                    old_stereo = old_samples
+                # mono old samples broadcast across the output channels
+                old_stereo = old_samples[:, np.newaxis] if crossfade_from_audio.ndim == 1 else old_samples
 
                 # blend (only for frames we have old data for)
                 blend_frames = min(fade_frames, len(old_stereo))
@@ -92,28 +124,179 @@ def audio_callback(outdata, frames, time_info, status):
 
             playback_position = end
 
+    # testbed/transport/perf
+    perf.callback.record_callback(time.perf_counter() - callback_start, frames, status)
+
+# testbed/transport/low-latency - the producer fills the ring, the callback only copies out of it
+
+def fill_frames(out, audio, start, count):
+    """Copy count frames of audio from start into out, spreading mono across the channels"""
+    if audio.ndim == 1:
+        out[:count] = audio[start:start + count, np.newaxis]
+    else:
+        out[:count] = audio[start:start + count]
+
+def heard_position(block):
+    """Track sample the producer should restart from so the callback carries on without a jump"""
+    mark_index, mark_position = ring_mark
+    # the callback may copy one more block before it reaches the restart
+    return mark_position + max(0, ring.read_index - mark_index) + block
+
+def producer_loop(position, block):
+    """Keep RING_LEAD_BLOCKS blocks of the current source queued in the ring"""
+    global ring_mark, ring_end
+    sample_rate = audio_sources['ref'].sample_rate
+    fade_in, fade_out = crossfade_ramps(sample_rate)
+    chunk = np.zeros((block, ring.data.shape[1]), dtype=np.float32)
+    old = np.zeros_like(chunk)
+    lead = RING_LEAD_BLOCKS * block
+    source = state.source
+    fade_audio, fade_done = None, len(fade_in)
+    mark_index = 0
+    restart = True
+
+    while producer_running:
+        # seek, source switch and live-param swaps restart the stream at a new mark
+        while True:
+            try:
+                request_position, request_source, request_fade = ring_requests.get_nowait()
+            except queue.Empty:
+                break
+            position = heard_position(block) if request_position is None else request_position
+            source = request_source or source
+            if request_fade is not None:
+                fade_audio, fade_done = request_fade, 0
+            restart = True
+
+        audio = audio_sources[source].data
+        position = min(position, len(audio))
+        if restart:
+            mark_index = ring.write_index
+            ring_end = None
+
+        # frames queued since the latest restart; audio before it will be skipped
+        queued = ring.write_index - max(ring.read_index, mark_index)
+        if ring_end is not None or queued >= lead or ring.space() < block:
+            time.sleep(block / sample_rate / 4)
+            continue
+
+        count = min(block, len(audio) - position)
+        if source == 'processed':
+            render_start = time.perf_counter()
+            processor.process_chunk(position, position + count)
+            perf.process_chunk.record(time.perf_counter() - render_start)
+            audio = audio_sources['processed'].data
+        fill_frames(chunk, audio, position, count)
+        chunk[count:] = 0
+
+        # crossfade from the previous audio at the same track position
+        if fade_audio is not None:
+            fade_frames = min(count, len(fade_in) - fade_done, max(0, len(fade_audio) - position))
+            fill_frames(old, fade_audio, position, fade_frames)
+            chunk[:fade_frames] *= fade_in[fade_done:fade_done + fade_frames]
+            chunk[:fade_frames] += old[:fade_frames] * fade_out[fade_done:fade_done + fade_frames]
+            fade_done += fade_frames
+            if fade_done >= len(fade_in) or fade_frames < count:
+                fade_audio = None
+
+        ring.write(chunk)
+        if restart:
+            # published only once the new audio is in the ring
+            ring_mark = (mark_index, position)
+            restart = False
+        position += count
+        if position >= len(audio):
+            ring_end = (ring.write_index - (block - count), position)
+
+def ring_callback(outdata, frames, time_info, status):
+    """Audio callback for low-latency mode: copy from the ring, nothing else"""
+    global playback_position, playback_ended
+    callback_start = time.perf_counter()
+    mark_index, mark_position = ring_mark
+    if ring.read_index < mark_index:
+        ring.read_index = mark_index  # skip audio queued before a restart
+
+    end = ring_end
+    copied = ring.read_into(outdata)
+    if copied < frames:
+        outdata[copied:] = 0
+        if end is None or ring.read_index < end[0]:
+            perf.callback.underruns += 1  # the track's end isn't one
+
+    if end is not None and ring.read_index >= end[0]:
+        playback_position = end[1]
+        playback_ended = True
+    else:
+        playback_position = mark_position + ring.read_index - mark_index
+
+    perf.callback.record_callback(time.perf_counter() - callback_start, frames, status)
+
+def restart_ring(position=None, source=None, fade_from=None):
+    """Ask the producer to restart from position (None = where the callback is) with an optional crossfade"""
+    ring_requests.put((position, source, fade_from))
+
+def start_producer(position, block, channels):
+    global ring, ring_mark, ring_end, ring_requests, producer_thread, producer_running
+    # room for a full lead of new audio after a restart, on top of the lead still queued
+    ring = RingBuffer(2 * RING_LEAD_BLOCKS * block, channels)
+    ring_mark = (0, position)
+    ring_end = None
+    ring_requests = queue.SimpleQueue()
+    producer_running = True
+    producer_thread = threading.Thread(target=producer_loop, args=(position, block), daemon=True)
+    producer_thread.start()
+
+    # a short prefill so the first callbacks don't underrun
+    deadline = time.time() + PREFILL_TIMEOUT
+    while ring.available() < RING_LEAD_BLOCKS * block // 2 and ring_end is None and time.time() < deadline:
+        time.sleep(0.001)
+
+def stop_producer():
+    global producer_running, producer_thread
+    producer_running = False
+    if producer_thread is not None:
+        producer_thread.join()
+        producer_thread = None
+
 def start_playback():
-    global stream, playback_position
+    global stream, playback_position, playback_ended
 
     if state.playing:
         return
+    if state.source not in audio_sources:
+        log('transport', f'Cannot play: {state.source} is not loaded yet')  # testbed/startup
+        return
 
     audio = get_current_audio()
     sample_rate = audio_sources[state.source].sample_rate
-    channels = audio_sources[state.source].channels
+    channels = max(audio_sources[state.source].channels, 2)  # at least stereo output
 
     # if at end, restart from beginning
     with playback_lock:
         if playback_position >= len(audio):
             playback_position = 0
-
-    stream = sd.OutputStream(
-        samplerate=sample_rate,
-        channels=max(channels, 2),  # at least stereo output
-        callback=audio_callback,
-        blocksize=4096,  # larger buffer to prevent underruns
-        latency='high'   # prioritize stability over low latency
-    )
+        playback_ended = False
+
+    blocksize = LOW_LATENCY_BLOCKSIZE if state.playback_mode == 'low-latency' else STABLE_BLOCKSIZE
+    perf.callback.start_stream(sample_rate, blocksize)
+
+    if state.playback_mode == 'low-latency':
+        start_producer(playback_position, LOW_LATENCY_BLOCKSIZE, channels)
+        stream = sd.OutputStream(
+            samplerate=sample_rate,
+            channels=channels,
+            callback=ring_callback,
+            blocksize=LOW_LATENCY_BLOCKSIZE,
+            latency='low'
+        )
+    else:
+        stream = sd.OutputStream(
+            samplerate=sample_rate,
+            channels=channels,
+            callback=audio_callback,
+            blocksize=STABLE_BLOCKSIZE,  # larger buffer to prevent underruns
+            latency='high'               # prioritize stability over low latency
+        )
     stream.start()
 
     state.playing = True
@@ -130,6 +313,7 @@ def stop_playback():
         stream.stop()
         stream.close()
         stream = None
+    stop_producer()
 
     state.playing = False
     log('transport', f'Pause at {state.position:.1f}s')
@@ -138,6 +322,8 @@ def stop_playback():
 def seek(position_seconds):
     global playback_position
 
+    if state.source not in audio_sources:
+        return  # testbed/startup - nothing loaded to seek in yet
     sample_rate = audio_sources[state.source].sample_rate
     audio = get_current_audio()
 
@@ -145,40 +331,137 @@ def seek(position_seconds):
         playback_position = int(position_seconds * sample_rate)
         playback_position = max(0, min(playback_position, len(audio)))
         state.position = playback_position / sample_rate
+        position = playback_position
+
+    # testbed/processor/streaming - warm up the convolver here rather than in the audio callback
+    if state.source == 'processed':
+        processor.process_chunk(position, position + processor.BLOCK_SIZE)
+
+    if producer_running:
+        restart_ring(position)
 
     log('transport', f'Seek to {state.position:.1f}s')
     broadcast_state()
 
 def switch_source(new_source):
-    global crossfade_samples, crossfade_from_audio
-
+    # testbed/load-audio/session - a room name makes that room the 'room' source and plays it
+    if new_source in session.rooms and new_source != session.active_room:
+        switch_room(new_source)
+        return
+    if new_source in session.rooms:
+        new_source = 'room'
     if new_source not in ['ref', 'room', 'processed']:
         return
+    if new_source not in audio_sources:
+        log('transport', f'Source {new_source} is not ready yet')  # testbed/startup
+        return
     if new_source == state.source:
         return
 
     with playback_lock:
-        if state.playing:
+        if producer_running:
+            restart_ring(source=new_source, fade_from=audio_sources[state.source].data)
+        elif state.playing:
             # store current audio for crossfade
-            crossfade_from_audio = audio_sources[state.source].data
-            sample_rate = audio_sources[state.source].sample_rate
-            crossfade_samples = int(sample_rate * CROSSFADE_MS / 1000)
+            start_crossfade(audio_sources[state.source].data)
 
         state.source = new_source
 
     log('transport', f'Source: {new_source}')
     broadcast_state()
 
+# testbed/load-audio/session
+def switch_room(name):
+    """Play another room of the session, crossfading from whatever was playing"""
+    def on_swap(previous):
+        with playback_lock:
+            # 'room' and 'processed' were just replaced; ref is unchanged
+            from_audio = previous.get(state.source, audio_sources[state.source].data)
+            if producer_running:
+                restart_ring(source='room', fade_from=from_audio)
+            elif state.playing:
+                start_crossfade(from_audio)
+            state.source = 'room'
+            state.room = name
+
+    try:
+        session.activate_room(name, on_swap)
+    except (OSError, ValueError) as e:
+        log('transport', f'Cannot switch to room {name}: {e}')
+        return
+    log('transport', f'Source: room {name}')
+    broadcast_state()
+
+def start_crossfade(from_audio):
+    """Fade from from_audio to the current source over CROSSFADE_MS (call with playback_lock held)"""
+    global crossfade_samples, crossfade_from_audio
+    if producer_running:
+        restart_ring(fade_from=from_audio)
+        return
+    crossfade_from_audio = from_audio
+    sample_rate = audio_sources['ref'].sample_rate
+    crossfade_samples = int(sample_rate * CROSSFADE_MS / 1000)
+
+# testbed/processor/live-params
+def set_processor_params(params):
+    """Apply new processor parameters from the playhead, crossfading if processed is playing"""
+    def playhead():
+        with playback_lock:
+            return playback_position
+
+    def on_swap(previous_audio):
+        with playback_lock:
+            if state.playing and state.source == 'processed':
+                start_crossfade(previous_audio)
+
+    state.processor = processor.update_params(params, playhead, on_swap)
+    broadcast_state()
+    return state.processor
+
+# testbed/transport/low-latency
+def set_playback_mode(mode):
+    """Switch between the stable and low-latency engines, restarting the stream if playing"""
+    if mode not in PLAYBACK_MODES:
+        raise ValueError(f'unknown playback mode: {mode}')
+    if mode == state.playback_mode:
+        return
+
+    playing = state.playing
+    if playing:
+        stop_playback()
+    state.playback_mode = mode
+    log('transport', f'Playback mode: {mode}')
+    if playing:
+        start_playback()
+    else:
+        broadcast_state()
+
 def position_update_loop():
     """Run in background thread to update position during playback"""
+    global playback_ended
+    ticks = 0
     while True:
         if state.playing:
             sample_rate = audio_sources[state.source].sample_rate
             with playback_lock:
                 state.position = playback_position / sample_rate
-            broadcast_state()
+            if playback_ended:
+                playback_ended = False
+                stop_playback()  # the callback can't stop its own stream
+            else:
+                broadcast_state()
+            # testbed/transport/perf
+            ticks += 1
+            if ticks % PERF_BROADCAST_TICKS == 0:
+                broadcast_perf()
         time.sleep(0.1)  # 10Hz updates
 
+# testbed/transport/perf
+PERF_BROADCAST_TICKS = 10  # position updates per perf message (1Hz)
+
+def broadcast_perf():
+    clients.broadcast(json.dumps({'type': 'perf', **perf.get_perf()}), coalesce='perf')
+
 def start_position_thread():
     thread = threading.Thread(target=position_update_loop, daemon=True)
     thread.start()
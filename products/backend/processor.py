@@ -1,168 +1,640 @@
-# testbed/processor, testbed/processor/ir-convolution
-
+# testbed/processor, testbed/processor/ir-convolution, testbed/processor/streaming, testbed/processor/live-params,
+# testbed/processor/render, testbed/processor/stereo, testbed/processor/welch, testbed/load-audio/session,
+# testbed/startup, testbed/memory
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 import numpy as np
-from scipy.signal import fftconvolve
+import scipy.fft
 from audio import audio_sources, AudioData
 from logger import log
+import cache
 
 # processed audio buffer - stores processed output for each time position
-processed_buffer = None  # numpy array, same shape as ref audio
-processed_valid = None   # boolean array tracking which samples have been processed
+processed_buffer = None  # float32 (samples, channels) array (1-D if mono), same length as ref audio
+processed_valid = None   # boolean array tracking which blocks have been processed
+
+# testbed/processor/streaming - block-based convolution state
+BLOCK_SIZE = 4096           # samples per block / IR partition
+LEVEL_MATCH_WINDOWS = 16    # windows sampled across the track for level matching
+LEVEL_MATCH_SECONDS = 2.0   # length of each level-matching window
+RENDER_BATCH_BLOCKS = 32    # max blocks rendered per lock hold
+convolver = None
+output_gain = 1.0
+processor_lock = threading.Lock()
 
 # testbed/processor/ir-convolution - IR parameters
-TRAINING_DURATION = 90  # seconds
+TRAINING_DURATION = 0   # seconds from the start used for training (0 = the whole track)
 IR_MAX_LENGTH = 0.5     # seconds (balance between smear and frequency capture)
-REGULARIZATION = 0.01
+REGULARIZATION = 1e-9  # added to the ref power per bin, relative to full-scale white noise (-90dB)
+SOLVE_CHUNK = 65536     # frequency bins per batch of the deconvolution solve
 
-# Extracted impulse response
-impulse_response = None
-
-def extract_impulse_response(ref_data, room_data, sample_rate):
-    """Extract impulse response using Wiener deconvolution"""
-    global impulse_response
+# testbed/processor/welch - spectra averaged over overlapping segments
+SEGMENT_FACTOR = 4      # segments are the next power of 2 at least this many IR lengths long
+SEGMENT_BATCH = 8       # segments transformed together (bounds each worker's memory)
+TRAINING_WORKERS = os.cpu_count() or 1
+TRAINING_RUNS_PER_WORKER = 4  # runs of segments per worker, so progress can be reported as they finish
 
-    training_samples = int(TRAINING_DURATION * sample_rate)
-    ir_length_samples = int(IR_MAX_LENGTH * sample_rate)
+# testbed/startup - set while the startup stage runs init_processor; called with the fraction of training done
+progress_callback = None
 
-    # Take training portion
-    ref = ref_data[:training_samples].copy()
-    room = room_data[:training_samples].copy()
-
-    # Convert stereo to mono if needed
-    if ref.ndim > 1:
-        ref = np.mean(ref, axis=1)
-    if room.ndim > 1:
-        room = np.mean(room, axis=1)
+# Extracted impulse response
+impulse_response = None
 
-    # Zero-pad to next power of 2
+# testbed/processor/cache - reuse IR and rendered output across restarts
+CACHE_RENDER = True     # also cache the rendered processed buffer
+ir_cache_key = None
+render_cache_key = None
+saved_blocks = 0        # valid blocks at the time the render was last loaded or saved
+
+# testbed/processor/live-params - parameter changes while running
+PLAYHEAD_BLOCKS = 4     # blocks rendered from the playhead before the new parameters are swapped in
+params_lock = threading.Lock()  # one parameter change at a time
+render_generation = 0   # bumped on every change, so a stale background refill stops
+spectra_memo = {}       # training spectra cache key -> (cross spectrum, ref power), memory-mapped
+room_energy_memo = {}   # (room path, alignment, windows) -> room energy for level matching
+
+def ir_params():
+    """Parameters that determine the extracted IR, always floats so cache keys don't depend on how they were set"""
+    return {
+        'training_duration': float(TRAINING_DURATION),
+        'ir_max_length': float(IR_MAX_LENGTH),
+        'regularization': float(REGULARIZATION),
+    }
+
+def render_params():
+    """Parameters that determine the rendered processed buffer"""
+    return {
+        **ir_params(),
+        'block_size': BLOCK_SIZE,
+        'level_match_windows': LEVEL_MATCH_WINDOWS,
+        'level_match_seconds': LEVEL_MATCH_SECONDS,
+    }
+
+def segment_size(ir_length_samples):
+    """Training segment length: next power of 2 holding SEGMENT_FACTOR IR lengths"""
     n = 1
-    while n < len(ref) + ir_length_samples:
+    while n < SEGMENT_FACTOR * ir_length_samples:
         n *= 2
-
-    ref_padded = np.zeros(n)
-    room_padded = np.zeros(n)
-    ref_padded[:len(ref)] = ref
-    room_padded[:len(room)] = room
-
-    # FFT
-    ref_fft = np.fft.rfft(ref_padded)
-    room_fft = np.fft.rfft(room_padded)
-
-    # Wiener deconvolution
-    ref_power = np.abs(ref_fft) ** 2
-    ir_fft = room_fft * np.conj(ref_fft) / (ref_power + REGULARIZATION)
-
-    # Inverse FFT
-    ir = np.fft.irfft(ir_fft)
-
-    # Take real part and truncate
-    ir = np.real(ir[:ir_length_samples])
-
-    # Apply fade-out window (last 10%)
+    return n
+
+def training_samples(num_samples, sample_rate, training_duration):
+    """Samples from the start used for training (training_duration 0 = all of them)"""
+    if not training_duration:
+        return num_samples
+    return min(num_samples, int(training_duration * sample_rate))
+
+def as_frames(samples):
+    """Samples as a (frames, channels) array; mono becomes one column"""
+    samples = np.asarray(samples)
+    return samples.reshape(len(samples), -1)
+
+def segment_sums(ref_data, room_data, starts, size):
+    """Sums over Hann-windowed segments at `starts` of Room_out conj(Ref_in) and Ref_i conj(Ref_j)
+
+    Segments are transformed in single precision, a batch at a time, and accumulated in double precision.
+    """
+    inputs = as_frames(ref_data[:1]).shape[1]
+    outputs = as_frames(room_data[:1]).shape[1]
+    window = np.hanning(size).astype(np.float32)
+    cross = power = 0
+    for b in range(0, len(starts), SEGMENT_BATCH):
+        batch = starts[b:b + SEGMENT_BATCH]
+
+        # (segments, ref channels + room channels, samples), zero past the end of either file
+        segments = np.zeros((len(batch), inputs + outputs, size), dtype=np.float32)
+        for k, start in enumerate(batch):
+            ref = as_frames(ref_data[start:start + size])
+            room = as_frames(room_data[start:start + size])
+            segments[k, :inputs, :len(ref)] = ref.T
+            segments[k, inputs:, :len(room)] = room.T
+        segments *= window
+
+        # every channel of both files, every segment of the batch: one FFT
+        spectra = scipy.fft.rfft(segments, axis=-1)
+        ref_fft = spectra[:, :inputs]
+        ref_conj = np.conj(ref_fft)
+        cross = cross + np.einsum('sof,sif->oif', spectra[:, inputs:], ref_conj, dtype=np.complex128)
+        power = power + np.einsum('sif,sjf->ijf', ref_fft, ref_conj, dtype=np.complex128)
+    return np.ascontiguousarray(np.moveaxis(cross, -1, 0)), np.ascontiguousarray(np.moveaxis(power, -1, 0))
+
+def training_spectra(ref_data, room_data, sample_rate, training_duration, ir_max_length):
+    """Cross spectra (room x conj(ref)) and ref cross-power spectra, per channel pair, averaged over segments
+
+    Returns (cross, power): cross[f, out, in] = mean of Room_out(f) conj(Ref_in(f)) and
+    power[f, i, j] = mean of Ref_i(f) conj(Ref_j(f)) over Hann-windowed, half-overlapping segments of
+    segment_size(IR length) across the training portion (Welch averaging, for an H1 estimate), divided
+    by the window power. Full-scale white noise has power 1 in every bin, whatever the segment count.
+    Workers take contiguous runs of segments, so memory doesn't depend on the training length.
+    These are the expensive part of IR extraction; deconvolve() turns them into an IR for any
+    regularization, and any IR length with the same segment_size.
+    """
+    size = segment_size(int(ir_max_length * sample_rate))
+    usable = training_samples(len(ref_data), sample_rate, training_duration)
+    starts = np.arange(0, max(1, usable - size + 1), size // 2)
+
+    chunks = np.array_split(starts, min(TRAINING_WORKERS * TRAINING_RUNS_PER_WORKER, len(starts)))
+    cross = power = 0
+    with ThreadPoolExecutor(max_workers=min(TRAINING_WORKERS, len(chunks))) as pool:
+        sums = pool.map(lambda chunk: segment_sums(ref_data, room_data, chunk, size), chunks)
+        for done, (chunk_cross, chunk_power) in enumerate(sums, 1):
+            cross = cross + chunk_cross
+            power = power + chunk_power
+            if progress_callback is not None:
+                progress_callback(done / len(chunks))
+    scale = len(starts) * np.sum(np.hanning(size) ** 2)
+    return cross / scale, power / scale
+
+def deconvolve(cross_spectrum, ref_power, ir_length_samples, regularization):
+    """(outputs, inputs, taps) impulse response from training spectra by MIMO Wiener deconvolution
+
+    Solves IR(f) (power(f) + regularization I) = cross(f) at every frequency: the matrix form of
+    room x conj(ref) / (|ref|^2 + regularization), which it equals for mono.
+    """
+    inputs = ref_power.shape[-1]
+    regularized = np.eye(inputs) * regularization
+    ir_fft = np.empty(cross_spectrum.shape, dtype=np.complex64)
+    for start in range(0, len(ir_fft), SOLVE_CHUNK):
+        # power is close to singular where the ref channels are nearly identical: solve in double precision
+        A = ref_power[start:start + SOLVE_CHUNK] + regularized
+        B = cross_spectrum[start:start + SOLVE_CHUNK]
+        ir_fft[start:start + SOLVE_CHUNK] = np.linalg.solve(A.swapaxes(-1, -2), B.swapaxes(-1, -2)).swapaxes(-1, -2)
+
+    # Inverse FFT, truncate, taps last
+    ir = np.moveaxis(scipy.fft.irfft(ir_fft, axis=0)[:ir_length_samples], 0, -1)
+
+    # Apply fade-out window (last 10%; none for an IR under 10 samples)
     fade_samples = ir_length_samples // 10
-    fade = np.linspace(1, 0, fade_samples)
-    ir[-fade_samples:] *= fade
+    if fade_samples > 0:
+        ir[..., -fade_samples:] *= np.linspace(1, 0, fade_samples)
 
-    # Normalize
+    # Normalize by the loudest channel pair, keeping the balance between them
     peak = np.max(np.abs(ir))
     if peak > 0:
         ir /= peak
 
+    return ir
+
+# testbed/load-audio/align
+def source_key(ref, room, params):
+    """Cache key for results derived from ref and room; an aligned room keys on its alignment too"""
+    params = {**params, 'channels': [room.channels, ref.channels]}  # testbed/processor/stereo
+    params = {**params, 'spectra': 'mean'}  # testbed/processor/welch - averaged, not summed
+    if room.alignment is not None:
+        params = {**params, 'room_alignment': room.alignment}
+    return cache.cache_key([ref.path, room.path], params)
+
+def spectra_key(ref, room, training_duration, ir_max_length):
+    """Cache key of the training spectra; IR lengths with the same segment size share an entry"""
+    return source_key(ref, room, {
+        'training_samples': training_samples(len(ref.data), ref.sample_rate, training_duration),
+        'segment_size': segment_size(int(ir_max_length * ref.sample_rate)),
+    })
+
+def load_training_spectra(ref, room, training_duration, ir_max_length):
+    """Training spectra from memory or the disk cache, computing and caching them if needed"""
+    key = spectra_key(ref, room, training_duration, ir_max_length)
+    if key not in spectra_memo:
+        cross_spectrum = cache.load_array(key, 'cross_spectrum', mmap_mode='r')
+        ref_power = cache.load_array(key, 'ref_power', mmap_mode='r')
+        if cross_spectrum is None or ref_power is None:
+            cross_spectrum, ref_power = training_spectra(
+                ref.data, room.data, ref.sample_rate, training_duration, ir_max_length)
+            cache.store_array(key, 'cross_spectrum', cross_spectrum)
+            cache.store_array(key, 'ref_power', ref_power)
+            # keep the mapped copies, so held spectra cost page cache rather than heap
+            cross_spectrum = cache.load_array(key, 'cross_spectrum', mmap_mode='r')
+            ref_power = cache.load_array(key, 'ref_power', mmap_mode='r')
+        spectra_memo[key] = (cross_spectrum, ref_power)
+    return spectra_memo[key]
+
+def extract_impulse_response(ref_data, room_data, sample_rate, spectra=None):
+    """Extract impulse response using Wiener deconvolution (from precomputed training spectra if given)"""
+    global impulse_response
+
+    if spectra is None:
+        spectra = training_spectra(ref_data, room_data, sample_rate, TRAINING_DURATION, IR_MAX_LENGTH)
+    cross_spectrum, ref_power = spectra
+    ir = deconvolve(cross_spectrum, ref_power, int(IR_MAX_LENGTH * sample_rate), REGULARIZATION)
+
     impulse_response = ir
 
     # Log IR characteristics
-    peak_idx = np.argmax(np.abs(ir))
-    log('processor', f'IR peak at sample {peak_idx} ({peak_idx/sample_rate*1000:.1f}ms)')
+    peak_idx = int(np.argmax(np.max(np.abs(ir), axis=(0, 1))))
+    log('processor', f'IR peak at sample {peak_idx} ({peak_idx/sample_rate*1000:.1f}ms), '
+                     f'{ir.shape[0]}x{ir.shape[1]} channels')
 
     return ir
 
-def init_processor():
-    """Initialize the processor with IR-convolved audio"""
-    global processed_buffer, processed_valid, impulse_response
-
-    ref = audio_sources['ref']
-    room = audio_sources['room']
+# testbed/processor/streaming, testbed/processor/stereo - uniformly-partitioned overlap-save convolution
+class PartitionedConvolver:
+    """Convolves a source with an IR one block at a time (uniform partitions, overlap-save)
+
+    The IR is (outputs, inputs, taps), one filter per channel pair (a 1-D IR is mono to mono); every
+    input channel goes through one batched FFT per call, and every output channel through one inverse FFT.
+    The frequency domain is single precision, like the float32 output.
+    """
+
+    def __init__(self, ir, block_size, read, length):
+        ir = np.asarray(ir, dtype=np.float32)
+        if ir.ndim == 1:
+            ir = ir[np.newaxis, np.newaxis]
+        self.block_size = block_size
+        self.read = read          # read(start, end) -> (frames, inputs) or mono float samples
+        self.length = length      # source length in samples
+        self.outputs, self.inputs, taps = ir.shape
+        self.num_partitions = max(1, -(-taps // block_size))
+
+        # split IR into equal partitions and take each one's spectrum (zero-padded to 2 blocks):
+        # partitions[p, out, in] for every channel pair in one transform
+        padded = np.zeros((self.outputs, self.inputs, self.num_partitions * block_size), dtype=np.float32)
+        padded[..., :taps] = ir
+        padded = padded.reshape(self.outputs, self.inputs, self.num_partitions, block_size).transpose(2, 0, 1, 3)
+        self.partitions = scipy.fft.rfft(padded, n=2 * block_size, axis=-1)
+
+        # frequency-domain delay line: spectra of the last P input segments, oldest first
+        self.delay_line = np.zeros((self.num_partitions, self.inputs, block_size + 1), dtype=np.complex64)
+        self.last_block = None
+
+    def input_spectra(self, first, last):
+        """(blocks, inputs, bins) spectra of the two-block input segments ending at blocks first..last"""
+        B = self.block_size
+        seg_start = (first - 1) * B
+        seg_end = (last + 1) * B
+        segment = np.zeros((seg_end - seg_start, self.inputs), dtype=np.float32)
+        lo = max(0, seg_start)
+        hi = min(self.length, seg_end)
+        if hi > lo:
+            segment[lo - seg_start:hi - seg_start] = as_frames(self.read(lo, hi))
+        frames = np.lib.stride_tricks.sliding_window_view(segment, 2 * B, axis=0)[::B]
+        return scipy.fft.rfft(frames, axis=-1)
+
+    def process_blocks(self, first, last):
+        """Return output blocks first..last as (frames, outputs) samples (block k covers samples k*B to (k+1)*B)"""
+        P = self.num_partitions
+        count = last - first + 1
+
+        if self.last_block is not None and first == self.last_block + 1:
+            # contiguous: reuse the delay line, only transform the new input
+            spectra = np.concatenate([self.delay_line[1:], self.input_spectra(first, last)])
+        else:
+            # first block or after a seek: warm up from the preceding P-1 input blocks
+            spectra = self.input_spectra(first - P + 1, last)
+
+        # output block k, channel o = sum over p, i of (input i spectrum k-p) * (partition p, o <- i), all blocks at once
+        output = np.zeros((count, self.outputs, spectra.shape[-1]), dtype=np.complex64)
+        for p in range(P):
+            segment = spectra[P - 1 - p:P - 1 - p + count]
+            for i in range(self.inputs):
+                output += segment[:, i, np.newaxis, :] * self.partitions[p, :, i]
+
+        self.delay_line[:] = spectra[-P:]
+        self.last_block = last
+        out = scipy.fft.irfft(output, axis=-1)[..., self.block_size:]
+        return out.transpose(0, 2, 1).reshape(count * self.block_size, self.outputs)
+
+    def process_block(self, k):
+        """Return output block k"""
+        return self.process_blocks(k, k)
+
+def output_samples(frames):
+    """Convolver output in the processed buffer's layout: mono as 1-D, otherwise (frames, channels)"""
+    return frames[:, 0] if frames.shape[1] == 1 else frames
+
+def room_window_energy(room, windows):
+    """Energy of the room recording over level-matching windows ((start, end) samples)
+
+    It doesn't depend on the IR parameters, so it is read (through the aligned view) once per room
+    and alignment rather than on every parameter change.
+    """
+    key = (room.path, json.dumps(room.alignment, sort_keys=True), windows)
+    if key not in room_energy_memo:
+        room_energy_memo[key] = sum(float(np.sum(np.square(room.data[start:end]), dtype=np.float64))
+                                    for start, end in windows)
+    return room_energy_memo[key]
+
+def estimate_output_gain(conv, room):
+    """Level-match factor from RMS of convolved vs room audio over sampled windows"""
+    B = conv.block_size
+    num_blocks = -(-conv.length // B)
+    window_blocks = max(1, int(LEVEL_MATCH_SECONDS * room.sample_rate) // B)
+    first_blocks = np.linspace(0, max(0, num_blocks - window_blocks), LEVEL_MATCH_WINDOWS).astype(int)
+
+    conv_energy = 0.0
+    windows = []
+    for first in np.unique(first_blocks):
+        last = min(num_blocks, first + window_blocks)
+        out = conv.process_blocks(first, last - 1)
+        # squared in single precision, summed in double: no double-precision copy of the windows
+        conv_energy += float(np.sum(np.square(out), dtype=np.float64))
+        windows.append((int(first * B), int(min(len(room.data), last * B))))
+    room_energy = room_window_energy(room, tuple(windows))
+
+    if conv_energy <= 0:
+        return 1.0
+    return np.sqrt(room_energy / conv_energy)
+
+@dataclass
+class Render:
+    """IR, convolver, gain and output buffer for one set of parameters"""
+    ir_key: str
+    render_key: str
+    ir: np.ndarray
+    convolver: PartitionedConvolver
+    gain: float
+    buffer: np.ndarray    # float32 (samples, channels), 1-D if mono, same length as ref
+    valid: np.ndarray     # bool per block
+    saved_blocks: int
+
+def prepare_convolver(ref, room):
+    """(IR key, render key, IR, convolver, gain) for the current parameters, from the cache where possible"""
+    # testbed/processor/cache - inputs and parameters unchanged means the DSP can be skipped
+    ir_key = source_key(ref, room, ir_params())
+    render_key = source_key(ref, room, render_params())
 
     # testbed/processor/ir-convolution - Extract impulse response
-    log('processor', 'Extracting impulse response...')
-    ir = extract_impulse_response(ref.data, room.data, ref.sample_rate)
-    log('processor', f'IR extracted: {len(ir)} samples ({len(ir)/ref.sample_rate:.2f}s)')
-
-    # Convert ref to mono for convolution
-    ref_mono = ref.data.copy()
-    if ref_mono.ndim > 1:
-        ref_mono = np.mean(ref_mono, axis=1)
-
-    # Convolve entire ref with IR (use 'full' and trim to maintain alignment)
-    log('processor', 'Convolving ref with IR...')
-    convolved_full = fftconvolve(ref_mono, ir, mode='full')
-    # Trim to same length as input - IR starts at t=0, so just take first len(ref_mono) samples
-    convolved = convolved_full[:len(ref_mono)]
-
-    # Normalize to match room levels
-    room_mono = room.data.copy()
-    if room_mono.ndim > 1:
-        room_mono = np.mean(room_mono, axis=1)
-
-    room_rms = np.sqrt(np.mean(room_mono ** 2))
-    conv_rms = np.sqrt(np.mean(convolved ** 2))
-    if conv_rms > 0:
-        convolved *= room_rms / conv_rms
-    log('processor', f'Level matched: room RMS={room_rms:.4f}, conv RMS={conv_rms:.4f}')
-
-    # Store as processed buffer (expand back to stereo if needed)
-    if ref.data.ndim > 1:
-        processed_buffer = np.column_stack([convolved, convolved])
+    ir = cache.load_array(ir_key, 'ir')
+    if ir is None:
+        log('processor', 'Extracting impulse response...')
+        spectra = load_training_spectra(ref, room, TRAINING_DURATION, IR_MAX_LENGTH)
+        ir = extract_impulse_response(ref.data, room.data, ref.sample_rate, spectra)
+        cache.store_array(ir_key, 'ir', ir)
     else:
-        processed_buffer = convolved
-
-    processed_valid = np.ones(len(ref.data), dtype=bool)  # All pre-processed
+        log('processor', f'IR loaded from cache ({ir_key})')
+    log('processor', f'IR extracted: {ir.shape[-1]} samples ({ir.shape[-1]/ref.sample_rate:.2f}s)')
+
+    # testbed/processor/streaming - convolution happens per block, on demand
+    num_samples = len(ref.data)
+    conv = PartitionedConvolver(ir, BLOCK_SIZE, lambda start, end: ref.data[start:end], num_samples)
+
+    # Normalize to match room levels (estimated from sampled windows, not the whole track)
+    gain = cache.load_array(render_key, 'gain')
+    if gain is None:
+        gain = estimate_output_gain(conv, room)
+        conv.last_block = None
+        cache.store_array(render_key, 'gain', np.array(gain))
+    gain = float(gain)
+    log('processor', f'Level matched: gain={gain:.4f} from {LEVEL_MATCH_WINDOWS} windows')
+    return ir_key, render_key, ir, conv, gain
+
+def prepare_render(ref, room):
+    """Build a Render for the current parameters, taking whatever the cache already has"""
+    ir_key, render_key, ir, conv, gain = prepare_convolver(ref, room)
+    num_samples = len(ref.data)
+
+    # testbed/processor/stereo - one output channel per room channel, interleaved
+    shape = (num_samples,) if conv.outputs == 1 else (num_samples, conv.outputs)
+    buffer = None
+    valid = None
+    num_blocks = -(-num_samples // BLOCK_SIZE)
+    if CACHE_RENDER:
+        # copy-on-write mapping: new blocks never modify the cached file
+        cached_buffer = cache.load_array(render_key, 'processed', mmap_mode='c')
+        cached_valid = cache.load_array(render_key, 'processed_valid')
+        if (cached_buffer is not None and cached_valid is not None and len(cached_valid) == num_blocks
+                and cached_buffer.shape == shape):
+            buffer = cached_buffer
+            valid = cached_valid.copy()
+            log('processor', f'Render loaded from cache: {int(valid.sum())}/{num_blocks} blocks')
+    if buffer is None:
+        buffer = np.zeros(shape, dtype=np.float32)
+        valid = np.zeros(num_blocks, dtype=bool)  # one flag per block
+
+    return Render(ir_key, render_key, ir, conv, gain, buffer, valid, saved_blocks=int(valid.sum()))
+
+def install_render(render):
+    """Make a Render the current processed source"""
+    global processed_buffer, processed_valid, convolver, output_gain, impulse_response
+    global ir_cache_key, render_cache_key, saved_blocks
+
+    ir_cache_key = render.ir_key
+    render_cache_key = render.render_key
+    impulse_response = render.ir
+    convolver = render.convolver
+    output_gain = render.gain
+    processed_buffer = render.buffer
+    processed_valid = render.valid
+    saved_blocks = render.saved_blocks
 
     # Register processed as an audio source
+    ref = audio_sources['ref']
     audio_sources['processed'] = AudioData(
         data=processed_buffer,
         sample_rate=ref.sample_rate,
-        channels=ref.channels,
+        channels=1 if processed_buffer.ndim == 1 else processed_buffer.shape[1],
         duration=ref.duration
     )
 
-    log('processor', f'Initialized processor: {len(processed_buffer)} samples with IR convolution')
+# testbed/load-audio/session - each room keeps its Render while another is installed
+def current_render():
+    """The installed Render, with the blocks rendered so far, or None before init_processor"""
+    if processed_buffer is None:
+        return None
+    return Render(ir_cache_key, render_cache_key, impulse_response, convolver, output_gain,
+                  processed_buffer, processed_valid, saved_blocks)
+
+def init_processor():
+    """Initialize the processor: extract the IR and prepare the streaming convolver"""
+    install_render(prepare_render(audio_sources['ref'], audio_sources['room']))
+    log('processor', f'Initialized processor: {len(processed_valid)} blocks of {BLOCK_SIZE} samples, '
+                     f'{convolver.num_partitions} IR partitions')
+
+def store_render(key, buffer, valid):
+    cache.store_array(key, 'processed', buffer)
+    cache.store_array(key, 'processed_valid', valid)
+
+def save_render_cache():
+    """Store the rendered blocks so the next start with the same inputs can reuse them"""
+    global saved_blocks
+
+    if not CACHE_RENDER or processed_valid is None:
+        return
+
+    with processor_lock:
+        rendered = int(processed_valid.sum())
+        if rendered <= saved_blocks:
+            return
+        store_render(render_cache_key, processed_buffer, processed_valid)
+        saved_blocks = rendered
+
+    log('processor', f'Saved render to cache: {rendered}/{len(processed_valid)} blocks')
+
+def render_blocks(conv, buffer, valid, gain, first, last):
+    """Convolve blocks first..last into buffer and mark them valid"""
+    out = output_samples(conv.process_blocks(first, last))
+    block_start = first * BLOCK_SIZE
+    block_end = min(len(buffer), (last + 1) * BLOCK_SIZE)
+    buffer[block_start:block_end] = out[:block_end - block_start] * gain
+    valid[first:last + 1] = True
+
+def invalid_runs(valid, first, last):
+    """Yield (first, last) of each run of unrendered blocks in first..last, at most RENDER_BATCH_BLOCKS long
+
+    Runs are found as iteration goes, so blocks rendered meanwhile are skipped.
+    """
+    k = first
+    while k <= last:
+        if valid[k]:
+            k += 1
+            continue
+        run_end = k
+        while run_end < min(last, k + RENDER_BATCH_BLOCKS - 1) and not valid[run_end + 1]:
+            run_end += 1
+        yield k, run_end
+        k = run_end + 1
 
 def process_chunk(start_sample, end_sample):
-    """No-op since we pre-convolve everything at init"""
-    # testbed/processor/ir-convolution - all processing done at init time
-    pass
+    """Make sure every block overlapping [start_sample, end_sample) has been processed"""
+    if processed_valid is None:
+        return
+
+    start = max(0, start_sample)
+    end = min(len(processed_buffer), end_sample)
+    if end <= start:
+        return
+
+    first = start // BLOCK_SIZE
+    last = (end - 1) // BLOCK_SIZE
+    if processed_valid[first:last + 1].all():
+        return
+
+    # audio callback, metering and analysis threads all drive the convolver;
+    # runs of missing blocks are rendered in short batches, locking per batch
+    for run_first, run_last in invalid_runs(processed_valid, first, last):
+        with processor_lock:
+            # another thread may have rendered part of the run while this one waited: render the rest
+            for sub_first, sub_last in invalid_runs(processed_valid, run_first, run_last):
+                render_blocks(convolver, processed_buffer, processed_valid, output_gain, sub_first, sub_last)
+    complete = processed_valid.all()
+
+    # testbed/processor/cache - whole track rendered, keep it for the next start
+    if complete:
+        threading.Thread(target=save_render_cache, daemon=True).start()
+
+# testbed/processor/live-params - change parameters while playing
+def update_params(params, playhead, on_swap=None):
+    """Switch to new IR parameters while running, starting at the playhead
+
+    playhead() returns the current position in samples. It is read once the new render is prepared,
+    which can take a second, so the blocks rendered first are the ones about to be played.
+    The blocks from the playhead are rendered with the new IR first; then the new render is swapped in
+    and on_swap(previous processed data) is called under the processor lock, so playback can crossfade.
+    The rest of the track is re-rendered in the background.
+    """
+    global TRAINING_DURATION, IR_MAX_LENGTH, REGULARIZATION, render_generation
+
+    unknown = set(params) - set(ir_params())
+    if unknown:
+        raise ValueError(f'Unknown processor parameters: {", ".join(sorted(unknown))}')
+    if processed_buffer is None:
+        raise ValueError('Processor is not ready yet')  # testbed/startup
+    values = {name: float(value) for name, value in params.items()}
+    if values.get('ir_max_length', 1) <= 0 or values.get('training_duration', 0) < 0 or values.get('regularization', 0) < 0:
+        raise ValueError('IR length must be positive, training duration and regularization non-negative')
+    if int(values.get('ir_max_length', IR_MAX_LENGTH) * audio_sources['ref'].sample_rate) < 1:
+        raise ValueError('IR length must be at least one sample')
+
+    with params_lock:
+        start_time = time.time()
+        TRAINING_DURATION = values.get('training_duration', TRAINING_DURATION)
+        IR_MAX_LENGTH = values.get('ir_max_length', IR_MAX_LENGTH)
+        REGULARIZATION = values.get('regularization', REGULARIZATION)
+        render = prepare_render(audio_sources['ref'], audio_sources['room'])
+
+        # new blocks at the playhead first, so the change is audible right away
+        first = min(max(0, playhead()) // BLOCK_SIZE, len(render.valid) - 1)
+        last = min(first + PLAYHEAD_BLOCKS, len(render.valid)) - 1
+        render_blocks(render.convolver, render.buffer, render.valid, render.gain, first, last)
+
+        with processor_lock:
+            previous = (render_cache_key, processed_buffer, processed_valid, saved_blocks)
+            install_render(render)
+            render_generation += 1
+            generation = render_generation
+            if on_swap is not None:
+                on_swap(previous[1])
+
+        # testbed/processor/cache - keep the previous render, so switching back is instant
+        previous_key, previous_buffer, previous_valid, previous_saved = previous
+        if CACHE_RENDER and int(previous_valid.sum()) > previous_saved:
+            threading.Thread(target=store_render, args=(previous_key, previous_buffer, previous_valid), daemon=True).start()
+
+        threading.Thread(target=refill, args=(generation, first), daemon=True).start()
+        log('processor', f'Parameters {ir_params()} live after {(time.time() - start_time) * 1000:.0f}ms')
+
+    return ir_params()
+
+def refill(generation, first_block):
+    """Render the whole track in the background: from first_block to the end, then from the start"""
+    num_blocks = len(processed_valid)
+    firsts = [*range(first_block, num_blocks, RENDER_BATCH_BLOCKS), *range(0, first_block, RENDER_BATCH_BLOCKS)]
+    for first in firsts:
+        if generation != render_generation:
+            return  # parameters changed again
+        last = min(first + RENDER_BATCH_BLOCKS, first_block if first < first_block else num_blocks)
+        process_chunk(first * BLOCK_SIZE, last * BLOCK_SIZE)
+        time.sleep(0)  # let the audio callback in between batches
 
 def get_processed_at_position(position_samples, num_samples):
-    """Return processed data at position (already computed at init)"""
+    """Return processed data at position, processing it first if needed"""
     if processed_buffer is None:
         return None
 
     start = max(0, position_samples)
     end = min(len(processed_buffer), position_samples + num_samples)
 
+    process_chunk(start, end)
     return processed_buffer[start:end]
 
-def clear_processed():
-    """Clear processed buffer (call when parameters change)"""
-    global processed_valid
-    if processed_valid is not None:
-        processed_valid[:] = False
-        log('processor', 'Cleared processed buffer')
+# testbed/processor/render - stream the processed output without holding the whole track
+def stream_processed(start_sample=0, end_sample=None, batch_blocks=RENDER_BATCH_BLOCKS):
+    """Yield the processed samples of [start_sample, end_sample) in order, a batch of blocks at a time
 
-def save_processed_wav(filepath='processed.wav'):
-    """Save the processed buffer to a WAV file"""
-    from scipy.io import wavfile
+    Blocks already in the processed buffer are copied from it; the rest are convolved by a private
+    convolver and not stored, so memory stays constant however long the range is. Works without
+    init_processor (the IR and gain come from the cache, or are computed once).
+    """
+    ref = audio_sources['ref']
+    num_samples = len(ref.data)
+    start = max(0, start_sample)
+    end = num_samples if end_sample is None else min(num_samples, end_sample)
+    if end <= start:
+        return
+
+    if processed_buffer is not None:
+        conv, gain, buffer, valid = None, output_gain, processed_buffer, processed_valid
+    else:
+        _, _, _, conv, gain = prepare_convolver(ref, audio_sources['room'])
+        buffer = valid = None
+
+    for first in range(start // BLOCK_SIZE, (end - 1) // BLOCK_SIZE + 1, batch_blocks):
+        last = min(first + batch_blocks, -(-end // BLOCK_SIZE)) - 1
+        lo = max(start, first * BLOCK_SIZE)
+        hi = min(end, (last + 1) * BLOCK_SIZE)
+        if valid is not None and valid[first:last + 1].all():
+            yield np.array(buffer[lo:hi])
+            continue
+        if conv is None:
+            # same IR as the live render, but its own delay line
+            conv = PartitionedConvolver(impulse_response, BLOCK_SIZE, convolver.read, convolver.length)
+        out = output_samples(conv.process_blocks(first, last)) * np.float32(gain)
+        yield out[lo - first * BLOCK_SIZE:hi - first * BLOCK_SIZE]
+
+def save_processed_wav(filepath='processed.wav', sample_format='int16'):
+    """Stream the processed output to a WAV file (unplayed blocks are rendered on the way, not kept)"""
+    from wavwriter import WavWriter
 
     if processed_buffer is None:
         log('processor', 'No processed data to save')
         return False
 
-    ref = audio_sources['ref']
-
-    # Convert back to int16 for WAV
-    audio_int16 = (processed_buffer * 32767).astype(np.int16)
-
-    wavfile.write(filepath, ref.sample_rate, audio_int16)
+    processed = audio_sources['processed']
+    with WavWriter(filepath, processed.sample_rate, channels=processed.channels, sample_format=sample_format) as wav:
+        for block in stream_processed():
+            wav.write(block)
     log('processor', f'Saved processed audio to {filepath}')
     return True
@@ -0,0 +1,60 @@
+# testbed/processor/render
+#
+# Render ref through the processor to a WAV file, streaming block by block, so memory stays the same
+# for a 3-minute track and a 3-hour set. Run from the backend directory (next to ref.wav and room.wav):
+#
+#   python render.py --output processed.wav --format float32 --start 60 --end 120
+
+import argparse
+import sys
+import time
+from audio import audio_sources, load_audio_files
+from wavwriter import WavWriter, SAMPLE_FORMATS
+import processor
+
+PROGRESS_INTERVAL = 1.0  # seconds between progress lines
+
+def render(output, sample_format, start_seconds=0.0, end_seconds=None, batch_blocks=processor.RENDER_BATCH_BLOCKS):
+    """Write processed [start_seconds, end_seconds) of the loaded sources to output; returns (frames, seconds taken)"""
+    sample_rate = audio_sources['ref'].sample_rate
+    num_samples = len(audio_sources['ref'].data)
+    start = min(num_samples, max(0, int(start_seconds * sample_rate)))
+    end = num_samples if end_seconds is None else min(num_samples, int(end_seconds * sample_rate))
+    total = max(0, end - start)
+
+    start_time = time.time()
+    last_report = start_time
+    channels = audio_sources['room'].channels  # testbed/processor/stereo - one output per room channel
+    with WavWriter(output, sample_rate, channels=channels, sample_format=sample_format) as wav:
+        for block in processor.stream_processed(start, end, batch_blocks):
+            wav.write(block)
+            now = time.time()
+            if now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                done = wav.frames / sample_rate
+                print(f'\r{wav.frames / max(total, 1):6.1%}  {done:8.1f}s of {total / sample_rate:.1f}s  '
+                      f'{done / (now - start_time):6.1f}x realtime', end='', file=sys.stderr, flush=True)
+        frames = wav.frames
+    if total:
+        print(file=sys.stderr)
+    return frames, time.time() - start_time
+
+def main():
+    parser = argparse.ArgumentParser(description='Render ref.wav through the processor to a WAV file')
+    parser.add_argument('--output', default='processed.wav', help='WAV file to write')
+    parser.add_argument('--format', choices=list(SAMPLE_FORMATS), default='int16', help='sample format')
+    parser.add_argument('--start', type=float, default=0.0, help='start of the range, seconds')
+    parser.add_argument('--end', type=float, help='end of the range, seconds (default: end of track)')
+    parser.add_argument('--batch-blocks', type=int, default=processor.RENDER_BATCH_BLOCKS,
+                        help=f'blocks of {processor.BLOCK_SIZE} samples convolved at a time')
+    parser.add_argument('--room', help='room of session.json to render for (default: its first)')  # testbed/load-audio/session
+    args = parser.parse_args()
+
+    load_audio_files(args.room)
+    frames, elapsed = render(args.output, args.format, args.start, args.end, args.batch_blocks)
+    seconds = frames / audio_sources['ref'].sample_rate
+    print(f'Wrote {seconds:.1f}s ({args.format}) to {args.output} in {elapsed:.1f}s '
+          f'({seconds / max(elapsed, 1e-9):.1f}x realtime)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+# testbed/transport/low-latency
+
+import numpy as np
+
+class RingBuffer:
+    """Single-producer, single-consumer queue of audio frames with no locks
+
+    write_index and read_index only ever increase, and each is written by one side only: the
+    producer fills frames and then advances write_index, the consumer copies frames out and then
+    advances read_index. Integer assignment is atomic under the GIL, so neither side can see a
+    half-updated index.
+    """
+
+    def __init__(self, capacity, channels):
+        self.data = np.zeros((capacity, channels), dtype=np.float32)
+        self.capacity = capacity
+        self.write_index = 0  # producer only
+        self.read_index = 0   # consumer only
+
+    def available(self):
+        return self.write_index - self.read_index
+
+    def space(self):
+        return self.capacity - self.available()
+
+    def write(self, frames):
+        """Append frames (producer side); the caller checks space() first"""
+        n = len(frames)
+        start = self.write_index % self.capacity
+        first = min(n, self.capacity - start)
+        self.data[start:start + first] = frames[:first]
+        self.data[:n - first] = frames[first:]
+        self.write_index += n
+
+    def read_into(self, out):
+        """Copy up to len(out) frames into out (consumer side); returns the number copied"""
+        n = min(len(out), self.available())
+        start = self.read_index % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self.data[start:start + first]
+        out[first:n] = self.data[:n - first]
+        self.read_index += n
+        return n
@@ -0,0 +1,184 @@
+# testbed/load-audio/session
+#
+# The rooms of a session (audio.manifest) are loaded on first use. The active one is presented as the
+# 'room' and 'processed' sources. Every loaded room keeps its own processor Render and meter history,
+# so switching back to a room is instant. Rooms not used recently are unloaded once the loaded ones
+# hold more than the memory budget.
+
+import threading
+import time
+from dataclasses import dataclass
+import numpy as np
+from audio import audio_sources, manifest, load_room, AudioData
+from logger import log
+import history
+import meters
+import processor
+
+MEMORY_BUDGET_MB = 1024     # default for session.json's memory_budget_mb
+DEFAULT_ROOM = 'room'       # the room of a session without session.json; its history stays in HISTORY_DIR
+
+@dataclass
+class Room:
+    name: str
+    audio: AudioData = None             # aligned room recording, None until loaded
+    render: processor.Render = None     # processor state while another room is active
+    last_used: float = 0.0
+
+rooms: dict[str, Room] = {}
+active_room = None
+session_lock = threading.Lock()  # one activation at a time
+
+def room_names():
+    return list(manifest['rooms'])
+
+def memory_budget():
+    """Bytes the loaded rooms may hold before the least recently used are unloaded"""
+    budget_mb = manifest.get('memory_budget_mb') or MEMORY_BUDGET_MB
+    return int(budget_mb * 1024 ** 2)
+
+def buffer_bytes(render):
+    """Memory held by a render's buffer: its rendered blocks
+
+    Pages of either kind of buffer are only held once written or read (a fresh buffer is untouched
+    zero pages, a cache mapping is paged in as it is played), so blocks that were never rendered cost nothing.
+    """
+    block_bytes = render.buffer.nbytes // max(1, len(render.buffer)) * processor.BLOCK_SIZE
+    return min(render.buffer.nbytes, int(render.valid.sum()) * block_bytes)
+
+def room_bytes(room):
+    """Memory held by a room: its samples if they aren't mapped (e.g. 24-bit files), plus its render"""
+    total = 0
+    if room.audio is not None:
+        raw = getattr(room.audio.data, 'raw', None)  # a SampleView's file, or an AlignedView's resampled mapping
+        if raw is not None and not isinstance(raw, np.memmap):
+            total += raw.nbytes
+    render = processor.current_render() if room.name == active_room else room.render
+    if render is not None:
+        conv = render.convolver
+        total += buffer_bytes(render) + render.valid.nbytes + render.ir.nbytes
+        total += conv.partitions.nbytes + conv.delay_line.nbytes
+    return total
+
+def room_history_dir(name):
+    if name == DEFAULT_ROOM:
+        return history.HISTORY_DIR
+    return history.HISTORY_DIR / 'rooms' / name
+
+def describe_rooms():
+    """[{name, loaded, active, ...}] for the frontend; metadata only for loaded rooms"""
+    described = []
+    for name in room_names():
+        room = rooms.get(name)
+        entry = {'name': name, 'loaded': room is not None and room.audio is not None, 'active': name == active_room}
+        if entry['loaded']:
+            entry.update(duration=room.audio.duration, sample_rate=room.audio.sample_rate,
+                         channels=room.audio.channels, memory_mb=room_bytes(room) / 1024 ** 2)
+        described.append(entry)
+    return described
+
+def audio_metadata():
+    """The 'audio_loaded' message: ref, the active room and every room of the session"""
+    ref, room = audio_sources['ref'], audio_sources['room']
+    return {
+        'type': 'audio_loaded',
+        'ref': {'duration': ref.duration, 'sample_rate': ref.sample_rate, 'channels': ref.channels},
+        'room': {'duration': room.duration, 'sample_rate': room.sample_rate, 'channels': room.channels},
+        'rooms': describe_rooms(),
+    }
+
+def init_session():
+    """Register the manifest's rooms; load_audio_files has already loaded the first as 'room'"""
+    global active_room
+    first = room_names()[0]
+    rooms.clear()
+    rooms.update({name: Room(name) for name in room_names()})
+    rooms[first].audio = audio_sources['room']
+    rooms[first].last_used = time.time()
+    active_room = first
+    meters.history_dir = room_history_dir(first)  # before load_history_from_disk
+    log('audio', f'Session: {len(rooms)} rooms, active {first}, memory budget {memory_budget() / 1024 ** 2:.0f}MB')
+
+def activate_room(name, on_swap=None):
+    """Make a room the 'room' and 'processed' sources, loading it and preparing its render if needed
+
+    The slow part (loading, alignment, IR) happens while the previous room keeps playing. The swap
+    itself is under the processor lock; on_swap({'room': ..., 'processed': ...} previous data) is
+    called inside it, so playback can crossfade.
+    """
+    global active_room
+    if name not in rooms:
+        raise KeyError(f'Unknown room: {name}')
+    if processor.processed_buffer is None:
+        raise ValueError('the processor is not ready yet')  # testbed/startup
+
+    with session_lock, processor.params_lock:
+        room = rooms[name]
+        room.last_used = time.time()
+        if name == active_room:
+            return False
+
+        start_time = time.time()
+        ref = audio_sources['ref']
+        if room.audio is None:
+            room.audio = load_room(name)
+            log('audio', f'Loaded room {name}: {room.audio.duration:.1f}s, {room.audio.channels} channels')
+
+        # testbed/processor/live-params - a render kept from before a parameter change is stale
+        render = room.render
+        if render is None or render.render_key != processor.source_key(ref, room.audio, processor.render_params()):
+            keep_rendered_blocks(render)
+            render = processor.prepare_render(ref, room.audio)
+        room.render = None
+
+        # no metering tick between the swap and the history switch, so no reading lands in the other room's
+        # history; the history is flushed outside the processor lock, which the audio callback takes
+        with meters.tick_lock:
+            with processor.processor_lock:
+                previous = {'room': audio_sources['room'].data, 'processed': audio_sources['processed'].data}
+                rooms[active_room].render = processor.current_render()
+                audio_sources['room'] = room.audio
+                processor.install_render(render)
+                processor.render_generation += 1  # a background refill of the previous room stops
+                active_room = name
+                if on_swap is not None:
+                    on_swap(previous)
+            meters.set_history_dir(room_history_dir(name))
+        log('audio', f'Room {name} active after {(time.time() - start_time) * 1000:.0f}ms')
+
+    enforce_budget()
+    return True
+
+def keep_rendered_blocks(render):
+    """Keep a render's newly rendered blocks in the processor cache before it's dropped"""
+    if render is not None and processor.CACHE_RENDER and int(render.valid.sum()) > render.saved_blocks:
+        processor.store_render(render.render_key, render.buffer, render.valid)
+        render.saved_blocks = int(render.valid.sum())
+
+def unload_room(room):
+    """Drop a room's samples and render"""
+    keep_rendered_blocks(room.render)
+    room.audio = None
+    room.render = None
+
+def enforce_budget():
+    """Unload least recently used rooms (never the active one) until the loaded ones fit the budget"""
+    with session_lock:
+        loaded = [room for room in rooms.values() if room.audio is not None]
+        total = sum(room_bytes(room) for room in loaded)
+        for room in sorted(loaded, key=lambda room: room.last_used):
+            if total <= memory_budget():
+                break
+            if room.name == active_room:
+                continue
+            freed = room_bytes(room)
+            unload_room(room)
+            total -= freed
+            log('audio', f'Unloaded room {room.name} ({freed / 1024 ** 2:.0f}MB) to stay within the memory budget')
+
+def save_renders():
+    """Keep every room's rendered blocks for the next start (the active room's and the stashed ones)"""
+    processor.save_render_cache()
+    with session_lock:
+        for room in rooms.values():
+            keep_rendered_blocks(room.render)
@@ -0,0 +1,111 @@
+# testbed/startup
+#
+# Startup as stages on background threads, so the server accepts clients straight away. A stage starts
+# when the stages it needs are ready; independent ones (history and processor) run side by side.
+# Progress is kept in state.stages, so /api/status has it, and every change is sent as a 'startup' event.
+
+import json
+import threading
+import time
+from audio import audio_sources, load_audio_files
+from logger import log
+from state import state, broadcast_state
+import clients
+import meters
+import processor
+import session
+
+PROGRESS_INTERVAL = 0.1  # seconds between progress events from one stage
+
+def stage_audio():
+    load_audio_files()
+    state.duration = audio_sources['ref'].duration
+    session.init_session()  # testbed/load-audio/session - the first room is active, the rest load on first use
+    state.room = session.active_room
+    log('audio', f"Loaded {audio_sources['ref'].path}: {audio_sources['ref'].duration:.1f}s")
+    log('audio', f"Loaded {audio_sources['room'].path}: {audio_sources['room'].duration:.1f}s")
+
+def audio_ready():
+    # testbed/load-audio - clients that connected while loading get the metadata now (after the
+    # stage is marked ready, so a client connecting meanwhile gets it one way or the other)
+    clients.broadcast(json.dumps(session.audio_metadata()))
+
+def stage_history():
+    meters.load_history_from_disk()  # testbed/metering/history/persistence
+
+def stage_processor():
+    processor.progress_callback = lambda fraction: set_progress('processor', fraction)
+    try:
+        processor.init_processor()
+    finally:
+        processor.progress_callback = None
+    state.processor = processor.ir_params()  # testbed/processor/live-params
+
+def stage_metering():
+    meters.start_metering_thread()
+
+# name -> (function, stages it needs)
+ON_READY = {'audio': audio_ready}
+STAGES = {
+    'audio': (stage_audio, []),
+    'history': (stage_history, ['audio']),
+    'processor': (stage_processor, ['audio']),
+    'metering': (stage_metering, ['history']),
+}
+
+stages_lock = threading.Lock()
+last_progress_event = {}  # stage -> time of its last progress event
+
+def stage_status():
+    return {name: {'status': 'pending', 'progress': 0.0, 'seconds': None, 'error': None} for name in STAGES}
+
+def ready(name):
+    return state.stages.get(name, {}).get('status') == 'ready'
+
+def update_stage(name, **changes):
+    with stages_lock:
+        state.stages = {**state.stages, name: {**state.stages[name], **changes}}
+        stages = state.stages
+    clients.broadcast(json.dumps({'type': 'startup', 'stages': stages}), coalesce='startup')
+
+def set_progress(name, fraction):
+    """Report a running stage's progress (0-1), at most every PROGRESS_INTERVAL"""
+    now = time.time()
+    if now - last_progress_event.get(name, 0) < PROGRESS_INTERVAL:
+        return
+    last_progress_event[name] = now
+    update_stage(name, progress=round(min(1.0, max(0.0, fraction)), 3))
+
+def run_stage(name, started):
+    function, needs = STAGES[name]
+    for need in needs:
+        started[need].join()
+        if not ready(need):
+            update_stage(name, status='failed', error=f'{need} failed')
+            log('startup', f'Stage {name} skipped: {need} failed')
+            return
+
+    start_time = time.time()
+    update_stage(name, status='running')
+    try:
+        function()
+    except Exception as e:
+        update_stage(name, status='failed', seconds=time.time() - start_time, error=str(e))
+        log('startup', f'Stage {name} failed: {e}')
+        return
+    seconds = time.time() - start_time
+    update_stage(name, status='ready', progress=1.0, seconds=seconds)
+    log('startup', f'Stage {name} ready after {seconds:.2f}s')
+    if name in ON_READY:
+        ON_READY[name]()
+    broadcast_state()
+
+def start():
+    """Start every stage on its own thread; returns immediately"""
+    state.stages = stage_status()
+    started = {}
+    for name in STAGES:
+        started[name] = threading.Thread(target=run_stage, args=(name, started), daemon=True)
+    for thread in started.values():
+        thread.start()
+    return started
@@ -1,8 +1,8 @@
-# testbed/remote-control
+# testbed/remote-control, testbed/processor/live-params, testbed/transport/low-latency, testbed/load-audio/session, testbed/remote-control/send-queue, testbed/startup
 
-from dataclasses import dataclass, asdict
-from typing import List
+from dataclasses import dataclass, asdict, field
 import json
+import clients
 
 @dataclass
 class AppState:
@@ -10,17 +10,16 @@ class AppState:
     position: float = 0.0
     source: str = 'ref'
     duration: float = 0.0
+    processor: dict = field(default_factory=dict)  # current processor parameters
+    playback_mode: str = 'stable'  # 'stable' or 'low-latency'
+    room: str = ''  # the session room the 'room' and 'processed' sources currently come from
+    stages: dict = field(default_factory=dict)  # startup stage -> {status, progress, seconds, error}
 
 state = AppState()
-connected_clients: List = []
 
 def get_state_dict():
     return {'type': 'state', **asdict(state)}
 
 def broadcast_state():
-    message = json.dumps(get_state_dict())
-    for ws in connected_clients:
-        try:
-            ws.send(message)
-        except:
-            pass  # client may have disconnected
+    # testbed/remote-control/send-queue - a client that hasn't taken the last state yet gets only this one
+    clients.broadcast(json.dumps(get_state_dict()), coalesce='state')
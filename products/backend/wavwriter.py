@@ -0,0 +1,77 @@
+# testbed/processor/render
+#
+# WAV file written a block at a time: the header goes out with placeholder sizes, which are
+# patched on close, so nothing longer than one block is ever held in memory.
+
+import struct
+import numpy as np
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+SAMPLE_FORMATS = {
+    'int16': (WAVE_FORMAT_PCM, np.dtype('<i2')),
+    'float32': (WAVE_FORMAT_IEEE_FLOAT, np.dtype('<f4')),
+}
+FMT_LAYOUT = '<HHIIHH'  # format tag, channels, sample rate, byte rate, block align, bits per sample
+# the RIFF size counts 'WAVE', the fmt chunk and the data chunk header as well as the data, in 32 bits
+RIFF_OVERHEAD = 4 + 8 + struct.calcsize(FMT_LAYOUT) + 8
+MAX_DATA_BYTES = 0xFFFFFFFF - RIFF_OVERHEAD
+
+class WavWriter:
+    """Incremental WAV writer for float samples in [-1, 1]
+
+    with WavWriter('out.wav', 44100, channels=1, sample_format='int16') as wav:
+        wav.write(block)      # (frames,) or (frames, channels) float
+    """
+
+    def __init__(self, path, sample_rate, channels=1, sample_format='int16'):
+        if sample_format not in SAMPLE_FORMATS:
+            raise ValueError(f'Unknown sample format: {sample_format} (choose from {", ".join(SAMPLE_FORMATS)})')
+        self.format_tag, self.dtype = SAMPLE_FORMATS[sample_format]
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frames = 0
+        self.file = open(path, 'wb')
+        self.write_header()
+
+    @property
+    def data_bytes(self):
+        return self.frames * self.channels * self.dtype.itemsize
+
+    def write_header(self):
+        block_align = self.channels * self.dtype.itemsize
+        fmt = struct.pack(FMT_LAYOUT, self.format_tag, self.channels, self.sample_rate,
+                          self.sample_rate * block_align, block_align, 8 * self.dtype.itemsize)
+        self.file.write(b'RIFF' + struct.pack('<I', RIFF_OVERHEAD + self.data_bytes) + b'WAVE')
+        self.file.write(b'fmt ' + struct.pack('<I', len(fmt)) + fmt)
+        self.file.write(b'data' + struct.pack('<I', self.data_bytes))
+
+    def write(self, block):
+        """Append frames; mono blocks are spread across every channel"""
+        block = np.asarray(block, dtype=np.float32)
+        if block.ndim == 1:
+            block = block[:, np.newaxis]
+        if block.shape[1] != self.channels:
+            block = np.broadcast_to(block, (len(block), self.channels))
+        if self.data_bytes + block.size * self.dtype.itemsize > MAX_DATA_BYTES:
+            raise ValueError('WAV data would exceed 4GB; render a shorter range or use int16')
+
+        if self.format_tag == WAVE_FORMAT_PCM:
+            samples = np.round(np.clip(block, -1.0, 1.0) * 32767).astype(self.dtype)
+        else:
+            samples = block.astype(self.dtype)
+        self.file.write(samples.tobytes())
+        self.frames += len(block)
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.file.seek(0)
+        self.write_header()  # now with the real sizes
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,4 +1,4 @@
-// testbed/load-audio, testbed/logging, testbed/remote-control, testbed/transport, testbed/source-switch, testbed/metering, testbed/metering/history/diff-view
+// testbed/load-audio, testbed/logging, testbed/remote-control, testbed/transport, testbed/source-switch, testbed/metering, testbed/metering/history/diff-view, testbed/metering/history/analyze, testbed/metering/binary-frames, testbed/metering/history/range, testbed/processor/live-params, testbed/load-audio/session, testbed/startup
 
 const status = document.getElementById('status');
 let ws;
@@ -16,11 +16,15 @@ const playPauseBtn = document.getElementById('play-pause');
 const skipBackBtn = document.getElementById('skip-back');
 const skipForwardBtn = document.getElementById('skip-forward');
 const positionDisplay = document.getElementById('position');
+const lowLatencyToggle = document.getElementById('low-latency');  // testbed/transport/low-latency
+const perfDisplay = document.getElementById('perf');                // testbed/transport/perf
+const startupDisplay = document.getElementById('startup');          // testbed/startup
 
 // testbed/source-switch - UI elements
 const sourceRefBtn = document.getElementById('source-ref');
-const sourceRoomBtn = document.getElementById('source-room');
 const sourceProcessedBtn = document.getElementById('source-processed');
+const roomSources = document.getElementById('room-sources');  // testbed/load-audio/session
+let roomButtons = {};  // room name -> button
 
 // testbed/logging
 function log(category, message) {
@@ -38,13 +42,87 @@ function formatTime(seconds) {
     return `${mins}:${secs.toString().padStart(2, '0')}`;
 }
 
+// testbed/metering/binary-frames - decode binary meter frames straight into typed arrays
+const METER_FORMAT = 'u8';  // 'json', 'f32' (float32 dB) or 'u8' (dB quantized to 256 steps)
+const FRAME_METER = 1;
+const FRAME_RANGE = 3;
+const FRAME_ENCODING_U8 = 1;
+const FRAME_DB_MIN = -80;
+const FRAME_DB_MAX = 0;
+const frameTextDecoder = new TextDecoder();
+
+function decodeFrame(buffer) {
+    const view = new DataView(buffer);
+    const kind = view.getUint8(0);
+    const encoding = view.getUint8(1);
+    const numBands = view.getUint16(4, true);
+    const labelLength = view.getUint16(6, true);
+    const [name, sourceList, statList] = frameTextDecoder.decode(new Uint8Array(buffer, 8, labelLength)).split(':');
+    const sources = sourceList.split(',');
+    let offset = 8 + labelLength + (-labelLength & 3);
+
+    // next count * numBands values as a Float32Array (a view, unless they need dequantizing)
+    function readValues(count) {
+        const n = count * numBands;
+        if (encoding !== FRAME_ENCODING_U8) {
+            const values = new Float32Array(buffer, offset, n);
+            offset += n * 4;
+            return values;
+        }
+        const quantized = new Uint8Array(buffer, offset, n);
+        offset += n + (-n & 3);
+        const values = new Float32Array(n);
+        const scale = (FRAME_DB_MAX - FRAME_DB_MIN) / 255;
+        for (let i = 0; i < n; i++) {
+            values[i] = FRAME_DB_MIN + quantized[i] * scale;
+        }
+        return values;
+    }
+
+    if (kind === FRAME_METER) {
+        const msg = { type: 'meter', name, time: view.getFloat64(offset, true), diff: view.getFloat32(offset + 8, true) };
+        offset += 12;
+        for (const source of sources) {
+            msg[source] = readValues(1);
+        }
+        return msg;
+    }
+
+    // testbed/metering/history/range - same shape as the JSON message: one band array per column
+    if (kind === FRAME_RANGE) {
+        const msg = {
+            type: 'meter_range', name,
+            start: view.getFloat64(offset, true),
+            end: view.getFloat64(offset + 8, true),
+            span: view.getUint32(offset + 16, true),
+        };
+        offset += 20;
+        for (const source of sources) {
+            const count = view.getUint32(offset, true);
+            msg[source] = { indices: new Uint32Array(buffer, offset + 4, count) };
+            offset += 4 + count * 4;
+            for (const stat of statList.split(',')) {
+                const values = readValues(count);
+                msg[source][stat] = Array.from({ length: count }, (_, i) => values.subarray(i * numBands, (i + 1) * numBands));
+            }
+        }
+        return msg;
+    }
+
+    return { type: 'unknown' };
+}
+
 function connect() {
     ws = new WebSocket(`ws://${window.location.host}/ws`);
+    ws.binaryType = 'arraybuffer';  // testbed/metering/binary-frames
 
     ws.onopen = () => {
         log('ws', 'Connected to backend');
         status.textContent = 'Connected, waiting for audio info...';
 
+        // testbed/metering/binary-frames - choose meter format before subscribing
+        ws.send(JSON.stringify({ type: 'meter_format', format: METER_FORMAT }));
+
         // restore persisted meter selection
         const savedMeter = localStorage.getItem('currentMeter');
         log('ws', `Saved meter from localStorage: ${savedMeter}`);
@@ -55,10 +133,10 @@ function connect() {
     };
 
     ws.onmessage = (event) => {
-        const msg = JSON.parse(event.data);
+        const msg = typeof event.data === 'string' ? JSON.parse(event.data) : decodeFrame(event.data);
 
-        // don't log state updates (too noisy at 10Hz)
-        if (msg.type !== 'state') {
+        // don't log state updates (too noisy at 10Hz) or startup progress
+        if (msg.type !== 'state' && msg.type !== 'startup') {
             log('ws', `Received: ${msg.type}`);
         }
 
@@ -70,15 +148,37 @@ function connect() {
                 viewEnd = msg.ref.duration;
             }
             status.textContent = `ref: ${msg.ref.duration.toFixed(1)}s, room: ${msg.room.duration.toFixed(1)}s @ ${msg.ref.sample_rate}Hz`;
+            // testbed/load-audio/session
+            const rooms = msg.rooms || [{ name: 'room' }];
+            if (rooms.length > 1) status.textContent += `, ${rooms.length} rooms`;
+            buildRoomButtons(rooms);
             updateUI();
         }
 
         // testbed/remote-control - state sync
         if (msg.type === 'state') {
+            const previousRoom = appState.room;
             appState = { ...appState, ...msg };
+            // testbed/load-audio/session - each room has its own history
+            if (previousRoom !== undefined && appState.room !== previousRoom) {
+                historyRange = null;
+                rangeInFlight = false;
+                checkHistoryRange();
+            }
             updateUI();
         }
 
+        // testbed/startup - stage progress while the backend loads
+        if (msg.type === 'startup') {
+            appState.stages = msg.stages;
+            updateUI();
+        }
+
+        // testbed/transport/perf
+        if (msg.type === 'perf') {
+            showPerf(msg);
+        }
+
         // testbed/remote-control - client control
         if (msg.type === 'remote_click') {
             const el = document.querySelector(msg.element);
@@ -104,26 +204,35 @@ function connect() {
             location.reload();
         }
 
-        // testbed/metering/history/persistence - load history from server
-        if (msg.type === 'meter_history') {
+        // testbed/metering/history/range - aggregated columns around the view replace local history
+        if (msg.type === 'meter_range') {
             if (msg.name === currentMeter) {
-                // populate local history from server data
-                for (const [time, data] of Object.entries(msg.ref)) {
-                    meterHistory['ref'][parseFloat(time)] = data;
-                }
-                for (const [time, data] of Object.entries(msg.room)) {
-                    meterHistory['room'][parseFloat(time)] = data;
-                }
-                if (msg.processed) {
-                    for (const [time, data] of Object.entries(msg.processed)) {
-                        meterHistory['processed'][parseFloat(time)] = data;
+                rangeInFlight = false;
+                historySpan = msg.span;
+                meterHistory = { ref: {}, room: {}, processed: {} };
+                liveColumns = { ref: null, room: null, processed: null };
+                for (const source of Object.keys(meterHistory)) {
+                    if (!msg[source]) continue;
+                    const { indices, mean } = msg[source];
+                    for (let i = 0; i < indices.length; i++) {
+                        meterHistory[source][indices[i]] = mean[i];
                     }
                 }
-                log('meter', `Loaded ${Object.keys(msg.ref).length} history buckets`);
+                // readings that arrived while the query was in flight may not be in the result
+                for (const [source, time, data] of liveSinceRequest) {
+                    storeMeterData(source, time, data);
+                }
+                liveSinceRequest = [];
+                log('meter', `Loaded ${msg.ref ? msg.ref.indices.length : 0} history columns of ${msg.span} buckets`);
                 updateMeterDisplay();
             }
         }
 
+        if (msg.type === 'meter_history_changed' && msg.name === currentMeter) {
+            historyRange = null;
+            checkHistoryRange();
+        }
+
         // testbed/metering/history
         if (msg.type === 'meter') {
             if (msg.name === currentMeter) {
@@ -155,13 +264,64 @@ function updateUI() {
 
     // source button highlights
     sourceRefBtn.classList.toggle('active', appState.source === 'ref');
-    sourceRoomBtn.classList.toggle('active', appState.source === 'room');
+    for (const [name, btn] of Object.entries(roomButtons)) {
+        btn.classList.toggle('active', appState.source === 'room' && appState.room === name);
+    }
     sourceProcessedBtn.classList.toggle('active', appState.source === 'processed');
 
+    // testbed/processor/live-params - show current parameters (unless being edited)
+    for (const [name, value] of Object.entries(appState.processor || {})) {
+        const input = document.getElementById(`param-${name}`);
+        if (input && document.activeElement !== input) input.value = value;
+    }
+
+    // testbed/transport/low-latency
+    lowLatencyToggle.checked = appState.playback_mode === 'low-latency';
+
+    // testbed/startup
+    showStartup();
+
     // update meter display when source changes
     updateMeterDisplay();
 }
 
+// testbed/startup - one line of stage progress until everything is ready; controls wait for their stage
+function stageReady(name) {
+    return appState.stages === undefined || (appState.stages[name] && appState.stages[name].status === 'ready');
+}
+
+function showStartup() {
+    const stages = Object.entries(appState.stages || {});
+    const waiting = stages.filter(([, stage]) => stage.status !== 'ready');
+    startupDisplay.textContent = waiting.length === 0 ? '' : 'starting: ' + stages.map(([name, stage]) => {
+        if (stage.status === 'running' && stage.progress > 0) return `${name} ${Math.round(stage.progress * 100)}%`;
+        if (stage.status === 'failed') return `${name} failed (${stage.error})`;
+        return `${name} ${stage.status}`;
+    }).join(', ');
+    startupDisplay.classList.toggle('failed', stages.some(([, stage]) => stage.status === 'failed'));
+
+    const audioReady = stageReady('audio');
+    for (const btn of [playPauseBtn, skipBackBtn, skipForwardBtn, sourceRefBtn, ...Object.values(roomButtons)]) {
+        btn.disabled = !audioReady;
+    }
+    sourceProcessedBtn.disabled = !stageReady('processor');
+}
+
+// testbed/transport/perf - one line of callback timing, updated about once a second while playing
+function showPerf(msg) {
+    const cb = msg.callback;
+    if (!cb.calls) return;
+    const fmt = (ms) => ms === null ? '-' : ms.toFixed(2);
+    const flags = Object.entries(cb.status).filter(([, n]) => n > 0).map(([flag, n]) => `${flag} ${n}`);
+    perfDisplay.textContent =
+        `callback ${fmt(cb.mean_ms)} avg / ${fmt(cb.max_ms)} max of ${fmt(cb.deadline_ms)} ms` +
+        ` | headroom min ${fmt(cb.min_headroom_ms)} ms | misses ${cb.deadline_misses}` +
+        ` | underruns ${cb.underruns}` +
+        ` | process_chunk ${fmt(msg.process_chunk.mean_ms)} avg / ${fmt(msg.process_chunk.max_ms)} max ms` +
+        (flags.length ? ` | ${flags.join(', ')}` : '');
+    perfDisplay.classList.toggle('warning', cb.deadline_misses > 0 || cb.underruns > 0 || flags.length > 0);
+}
+
 // testbed/transport - button handlers
 playPauseBtn.addEventListener('click', () => {
     if (appState.playing) {
@@ -218,10 +378,23 @@ sourceRefBtn.addEventListener('click', () => {
     log('ui', 'Source: ref');
 });
 
-sourceRoomBtn.addEventListener('click', () => {
-    ws.send(JSON.stringify({ type: 'source', name: 'room' }));
-    log('ui', 'Source: room');
-});
+// testbed/load-audio/session - a room button plays that room (loading it first if needed)
+function buildRoomButtons(rooms) {
+    roomSources.replaceChildren();
+    roomButtons = {};
+    for (const room of rooms) {
+        const btn = document.createElement('button');
+        btn.id = `source-${room.name}`;
+        btn.className = 'source-btn';
+        btn.textContent = room.name;
+        btn.addEventListener('click', () => {
+            ws.send(JSON.stringify({ type: 'source', name: room.name }));
+            log('ui', `Source: room ${room.name}`);
+        });
+        roomSources.appendChild(btn);
+        roomButtons[room.name] = btn;
+    }
+}
 
 sourceProcessedBtn.addEventListener('click', () => {
     ws.send(JSON.stringify({ type: 'source', name: 'processed' }));
@@ -253,9 +426,17 @@ let currentMeter = null;
 const meterVisualizers = {};
 
 // testbed/metering/history - time-series data storage
-let meterHistory = { ref: {}, room: {}, processed: {} };
+let meterHistory = { ref: {}, room: {}, processed: {} };  // meterHistory[source][first bucket index] = bands
 const TIME_BUCKET_SIZE = 0.1;  // 100ms buckets
 
+// testbed/metering/history/range - history is held as columns of historySpan buckets around the view
+let historySpan = 1;
+let historyRange = null;        // { start, end, secondsPerColumn } of the last range query
+let rangeInFlight = false;
+let liveSinceRequest = [];      // [source, time, bands] received while a range query is in flight
+let liveColumns = { ref: null, room: null, processed: null };  // per source { column, sum, count } of live readings
+const RANGE_COLUMN_PIXELS = 2;  // screen pixels per history column
+
 // testbed/metering/history/zoom - view state (persisted)
 let viewStart = parseFloat(localStorage.getItem('viewStart')) || 0;
 let viewEnd = parseFloat(localStorage.getItem('viewEnd')) || 300;
@@ -299,16 +480,63 @@ function selectMeter(name) {
     ctx.clearRect(0, 0, meterCanvas.width, meterCanvas.height);
     meterDiff.textContent = '';
     meterHistory = { ref: {}, room: {}, processed: {} };
+
+    // testbed/metering/history/range - fetch history for the current view
+    historySpan = 1;
+    historyRange = null;
+    rangeInFlight = false;
+    liveSinceRequest = [];
+    liveColumns = { ref: null, room: null, processed: null };
+    checkHistoryRange();
 }
 
-// testbed/metering/history - helper functions
-function timeBucket(time) {
-    return Math.floor(time / TIME_BUCKET_SIZE) * TIME_BUCKET_SIZE;
+// testbed/metering/history/range - query the server when the view leaves the fetched window or zoom changes
+function checkHistoryRange() {
+    if (!currentMeter || rangeInFlight || ws.readyState !== WebSocket.OPEN) return;
+
+    const viewDuration = viewEnd - viewStart;
+    const plotWidth = meterCanvas.width - 70;  // matches visualizer padding
+    const secondsPerColumn = viewDuration * RANGE_COLUMN_PIXELS / plotWidth;
+    if (historyRange &&
+        viewStart >= historyRange.start && viewEnd <= historyRange.end &&
+        Math.abs(Math.log2(secondsPerColumn / historyRange.secondsPerColumn)) < 1) {
+        return;
+    }
+
+    // fetch half a view either side so small pans and auto-scroll don't need a new query
+    const start = Math.max(0, viewStart - viewDuration / 2);
+    const end = viewEnd + viewDuration / 2;
+    historyRange = { start, end, secondsPerColumn };
+    rangeInFlight = true;
+    ws.send(JSON.stringify({
+        type: 'meter_range', name: currentMeter, start, end,
+        columns: Math.ceil((end - start) / secondsPerColumn), stats: ['mean'],
+    }));
 }
 
+// testbed/metering/history - helper functions
 function storeMeterData(source, time, data) {
-    const bucket = timeBucket(time);
-    meterHistory[source][bucket] = data;
+    // testbed/metering/history/range - live readings land in the column that holds their bucket
+    const bucket = Math.floor(time / TIME_BUCKET_SIZE);
+    const column = bucket - bucket % historySpan;
+    if (rangeInFlight) liveSinceRequest.push([source, time, data]);
+    if (historySpan === 1) {
+        meterHistory[source][column] = data;
+        return;
+    }
+
+    // an aggregated column is a mean over its buckets: show the mean of the live readings in it, not the latest
+    let live = liveColumns[source];
+    if (!live || live.column !== column) {
+        live = liveColumns[source] = { column, sum: new Float64Array(data.length), count: 0 };
+    }
+    live.count++;
+    const mean = new Float32Array(data.length);
+    for (let i = 0; i < data.length; i++) {
+        live.sum[i] += data[i];
+        mean[i] = live.sum[i] / live.count;
+    }
+    meterHistory[source][column] = mean;
 }
 
 function updateMeterDisplay() {
@@ -328,10 +556,13 @@ function updateMeterDisplay() {
         }
     }
 
+    checkHistoryRange();  // testbed/metering/history/range
+
     const playingSource = appState.source;
     const compareSource = compareSourceSelect.value;
 
-    playingSourceDisplay.textContent = `Playing: ${playingSource}`;
+    const roomLabel = playingSource !== 'ref' && Object.keys(roomButtons).length > 1 ? ` (${appState.room})` : '';  // testbed/load-audio/session
+    playingSourceDisplay.textContent = `Playing: ${playingSource}${roomLabel}`;
 
     // testbed/metering/history - pass history data to visualizer
     meterVisualizers[currentMeter](
@@ -339,7 +570,8 @@ function updateMeterDisplay() {
         meterHistory[playingSource],
         compareSource ? meterHistory[compareSource] : null,
         playingSource, compareSource,
-        appState.position, appState.duration
+        appState.position, appState.duration,
+        historySpan
     );
 
     meterDiff.textContent = '';
@@ -349,7 +581,8 @@ function updateMeterDisplay() {
 compareSourceSelect.addEventListener('change', updateMeterDisplay);
 
 // testbed/metering/history - spectrum as spectrogram
-meterVisualizers['spectrum'] = function(ctx, canvas, historyA, historyB, labelA, labelB, currentTime, duration) {
+// (history is keyed by first bucket index; each entry covers bucketSpan buckets)
+meterVisualizers['spectrum'] = function(ctx, canvas, historyA, historyB, labelA, labelB, currentTime, duration, bucketSpan = 1) {
     const width = canvas.width;
     const height = canvas.height;
     const errorBarHeight = diffViewEnabled ? 15 : 0;
@@ -365,6 +598,10 @@ meterVisualizers['spectrum'] = function(ctx, canvas, historyA, historyB, labelA,
     const minDb = -80;
     const maxDb = 0;
 
+    // testbed/metering/history/range - width of one history entry
+    const bucketSeconds = bucketSpan * TIME_BUCKET_SIZE;
+    const bucketWidth = Math.max((bucketSeconds / (viewEnd - viewStart)) * plotWidth, 1);
+
     function dbToColor(db) {
         const t = Math.max(0, Math.min(1, (db - minDb) / (maxDb - minDb)));
         // black -> blue -> red -> yellow
@@ -418,18 +655,18 @@ meterVisualizers['spectrum'] = function(ctx, canvas, historyA, historyB, labelA,
     }
 
     function drawSpectrogram(history, yOffset, plotH) {
-        const times = Object.keys(history).map(Number).sort((a, b) => a - b);
-        if (times.length === 0) return;
+        const buckets = Object.keys(history).map(Number).sort((a, b) => a - b);
+        if (buckets.length === 0) return;
 
-        const numBands = history[times[0]].length;
+        const numBands = history[buckets[0]].length;
         const bandHeight = plotH / numBands;
 
-        for (const time of times) {
-            if (time < viewStart || time > viewEnd) continue;
+        for (const bucket of buckets) {
+            const time = bucket * TIME_BUCKET_SIZE;
+            if (time + bucketSeconds < viewStart || time > viewEnd) continue;
 
             const x = padding.left + ((time - viewStart) / (viewEnd - viewStart)) * plotWidth;
-            const bucketWidth = Math.max((TIME_BUCKET_SIZE / (viewEnd - viewStart)) * plotWidth, 1);
-            const bands = history[time];
+            const bands = history[bucket];
 
             for (let i = 0; i < bands.length; i++) {
                 const y = yOffset + plotH - (i + 1) * bandHeight;
@@ -441,20 +678,20 @@ meterVisualizers['spectrum'] = function(ctx, canvas, historyA, historyB, labelA,
 
     // testbed/metering/history/diff-view - draw diff spectrogram
     function drawDiffSpectrogram(roomHistory, processedHistory, yOffset, plotH) {
-        const times = Object.keys(roomHistory).map(Number).sort((a, b) => a - b);
-        if (times.length === 0) return;
+        const buckets = Object.keys(roomHistory).map(Number).sort((a, b) => a - b);
+        if (buckets.length === 0) return;
 
-        const numBands = roomHistory[times[0]].length;
+        const numBands = roomHistory[buckets[0]].length;
         const bandHeight = plotH / numBands;
 
-        for (const time of times) {
-            if (time < viewStart || time > viewEnd) continue;
-            if (!processedHistory[time]) continue;
+        for (const bucket of buckets) {
+            const time = bucket * TIME_BUCKET_SIZE;
+            if (time + bucketSeconds < viewStart || time > viewEnd) continue;
+            if (!processedHistory[bucket]) continue;
 
             const x = padding.left + ((time - viewStart) / (viewEnd - viewStart)) * plotWidth;
-            const bucketWidth = Math.max((TIME_BUCKET_SIZE / (viewEnd - viewStart)) * plotWidth, 1);
-            const roomBands = roomHistory[time];
-            const processedBands = processedHistory[time];
+            const roomBands = roomHistory[bucket];
+            const processedBands = processedHistory[bucket];
 
             for (let i = 0; i < numBands; i++) {
                 const diff = roomBands[i] - processedBands[i];
@@ -467,17 +704,17 @@ meterVisualizers['spectrum'] = function(ctx, canvas, historyA, historyB, labelA,
 
     // testbed/metering/history/diff-view - draw error summary bar at top
     function drawErrorBar(histA, histB) {
-        const times = Object.keys(histB).map(Number).sort((a, b) => a - b);
-        if (times.length === 0) return;
+        const buckets = Object.keys(histB).map(Number).sort((a, b) => a - b);
+        if (buckets.length === 0) return;
 
-        for (const time of times) {
-            if (time < viewStart || time > viewEnd) continue;
-            if (!histA[time]) continue;
+        for (const bucket of buckets) {
+            const time = bucket * TIME_BUCKET_SIZE;
+            if (time + bucketSeconds < viewStart || time > viewEnd) continue;
+            if (!histA[bucket]) continue;
 
             const x = padding.left + ((time - viewStart) / (viewEnd - viewStart)) * plotWidth;
-            const bucketWidth = Math.max((TIME_BUCKET_SIZE / (viewEnd - viewStart)) * plotWidth, 1);
-            const bandsA = histA[time];
-            const bandsB = histB[time];
+            const bandsA = histA[bucket];
+            const bandsB = histB[bucket];
 
             // Calculate RMS error across all bands
             let sumSq = 0;
@@ -738,6 +975,33 @@ function resetZoom() {
 // initialize zoom controls
 initZoomControls();
 
+// testbed/metering/history/analyze - measure the whole track on the server
+const analyzeTrackBtn = document.getElementById('analyze-track');
+
+analyzeTrackBtn.addEventListener('click', () => {
+    if (!currentMeter) return;
+    ws.send(JSON.stringify({ type: 'meter_analyze', name: currentMeter }));
+    log('ui', `Analyze track: ${currentMeter}`);
+});
+
+// testbed/processor/live-params - send a parameter when an edit is committed
+for (const input of document.querySelectorAll('#processor-params input')) {
+    input.addEventListener('change', () => {
+        const name = input.id.replace('param-', '');
+        const value = parseFloat(input.value);
+        if (isNaN(value)) return;
+        ws.send(JSON.stringify({ type: 'processor_params', params: { [name]: value } }));
+        log('ui', `Processor ${name} = ${value}`);
+    });
+}
+
+// testbed/transport/low-latency - choose the playback engine
+lowLatencyToggle.addEventListener('change', () => {
+    const mode = lowLatencyToggle.checked ? 'low-latency' : 'stable';
+    ws.send(JSON.stringify({ type: 'playback_mode', mode }));
+    log('ui', `Playback mode: ${mode}`);
+});
+
 // testbed/metering/history/diff-view - event handlers
 diffViewToggle.addEventListener('change', (e) => {
     diffViewEnabled = e.target.checked;